@@ -0,0 +1,227 @@
+# atlas_benchmark.py
+# Reproducible performance benchmark for the ATLAS forecasting engine.
+# A synthetic freight generator (1k-1M daily rows, any number of lanes and
+# exogenous series) feeds timed scenarios for loading, feature building, every
+# model family, the full foundry and prediction. Results are written as JSON and
+# compared against a stored baseline with a regression threshold.
+
+import argparse
+import json
+import logging
+import os
+import platform
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from sklearn.linear_model import Ridge
+from sklearn.ensemble import RandomForestRegressor, GradientBoostingRegressor
+import lightgbm as lgb
+import xgboost as xgb
+from catboost import CatBoostRegressor
+
+from kalopathor_2_engine import AtlasEngine
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BASELINE = 'atlas_benchmark_baseline.json'
+MODEL_FAMILIES = ['Ridge', 'Random_Forest', 'Gradient_Boosting', 'LightGBM', 'CatBoost', 'XGBoost']
+BENCHMARK_HORIZON = 7
+
+# Generated histories end here, so the recent rows the models see have ordinary dates
+GENERATOR_END = '2025-09-19'
+# Text dates before this year do not round-trip through the lane CSVs
+LOAD_MIN_DATE = '1000-01-01'
+
+
+def make_model(family):
+    """Same default configurations the foundry benchmarks."""
+    return {
+        "Ridge": lambda: Ridge(),
+        "Random_Forest": lambda: RandomForestRegressor(random_state=42, n_jobs=-1),
+        "Gradient_Boosting": lambda: GradientBoostingRegressor(random_state=42),
+        "LightGBM": lambda: lgb.LGBMRegressor(random_state=42, verbosity=-1, n_jobs=-1, force_col_wise=True),
+        "CatBoost": lambda: CatBoostRegressor(random_state=42, verbose=0, allow_writing_files=False),
+        "XGBoost": lambda: xgb.XGBRegressor(random_state=42, n_jobs=-1)
+    }[family]()
+
+
+def generate_freight_frame(n_rows=10000, n_lanes=2, n_exog=2, seed=0, end=GENERATOR_END):
+    """Synthetic daily freight history with the columns AtlasEngine.load_data returns.
+
+    Lanes beyond the two modelled ones are named lane_<k>_price. Exogenous series
+    are random walks that drive feuw_price with a short lead. The index uses
+    second resolution so 1M days stay inside the representable date range.
+    """
+    rng = np.random.default_rng(seed)
+    index = pd.date_range(end=end, periods=n_rows, freq='D', unit='s', name='Date')
+
+    exog = 50 + np.cumsum(rng.normal(0, 0.5, (n_rows, n_exog)), axis=0)
+    lanes = 700 + np.cumsum(rng.normal(0, 5, (n_rows, n_lanes - 1)), axis=0)
+    lead = np.roll(exog, 7, axis=0).sum(axis=1) if n_exog else 0.0
+    feuw = 2.5 * lanes[:, 0] + 3 * lead + rng.normal(0, 20, n_rows)
+
+    data = {'feuw_price': feuw, 'uwfe_price': lanes[:, 0]}
+    data.update({f'lane_{k + 2}_price': lanes[:, k] for k in range(1, n_lanes - 1)})
+    data.update({f'exog_{k}': exog[:, k] for k in range(n_exog)})
+    return pd.DataFrame(data, index=index)
+
+
+def write_engine_inputs(df, directory):
+    """Writes the frame as the lane CSVs (newest first) plus CSV-sourced exogenous series."""
+    df = df[df.index.values >= np.datetime64(LOAD_MIN_DATE, 's')]
+    lanes = {'feuw_price': ('xsicfeuw_data.csv', 'XSICFEUW'), 'uwfe_price': ('xsiuwfe_data.csv', 'XSICUWFE')}
+    for col, (filename, raw_name) in lanes.items():
+        df[[col]].rename(columns={col: raw_name}).iloc[::-1].to_csv(os.path.join(directory, filename))
+
+    exog_cols = [col for col in df.columns if col.startswith('exog_')]
+    df[exog_cols].to_csv(os.path.join(directory, 'exog.csv'))
+    series = [{"name": col, "source": "csv", "path": "exog.csv", "column": col, "calendar": "daily"}
+              for col in exog_cols]
+    with open(os.path.join(directory, 'atlas_exog.json'), 'w') as f:
+        json.dump({"series": series}, f)
+
+
+def time_call(fn, repeats):
+    """Runs fn repeats times; returns (timing summary, last return value)."""
+    timings = []
+    value = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        value = fn()
+        timings.append(time.perf_counter() - start)
+    return {"median_seconds": float(np.median(timings)), "min_seconds": float(np.min(timings)),
+            "repeats": repeats}, value
+
+
+def benchmark_matrix(engine, df, max_rows):
+    """Feature matrix and target for the benchmark horizon, limited to the latest max_rows rows."""
+    data = engine.create_features(df)
+    data['target'] = data[engine.target_column].shift(-BENCHMARK_HORIZON)
+    data = data.dropna().iloc[-max_rows:]
+    feature_cols = [col for col in data.columns if engine.target_column not in col and col != 'target']
+    return data[feature_cols], data['target']
+
+
+def run_benchmark(n_rows=10000, n_lanes=2, n_exog=2, seed=0, repeats=3, families=None,
+                  max_model_rows=100000, full_foundry=False):
+    families = families or MODEL_FAMILIES
+    config = {"rows": n_rows, "lanes": n_lanes, "exog": n_exog, "seed": seed,
+              "max_model_rows": max_model_rows, "full_foundry": full_foundry}
+    results = {
+        "metadata": {
+            "timestamp": datetime.now().isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "numpy": np.__version__,
+            "pandas": pd.__version__
+        },
+        "config": config,
+        "scenarios": {}
+    }
+    scenarios = results["scenarios"]
+    df = generate_freight_frame(n_rows, n_lanes, n_exog, seed)
+    engine = AtlasEngine(quick_mode=not full_foundry, explanation_cache_dir=None)
+
+    logger.info(f"Benchmarking {n_rows} rows, {n_lanes} lanes, {n_exog} exogenous series...")
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        write_engine_inputs(df, tmp)
+        os.chdir(tmp)
+        try:
+            engine.load_data()  # builds the exogenous panel once; the timed loads reuse it
+            scenarios["load"], loaded = time_call(engine.load_data, repeats)
+            scenarios["load"]["rows"] = len(loaded)
+        finally:
+            os.chdir(cwd)
+
+    scenarios["features"], _ = time_call(lambda: engine.create_features(df), repeats)
+
+    X, y = benchmark_matrix(engine, df, max_model_rows)
+    split = int(len(X) * 0.8)
+    X_train, X_test, y_train = X.iloc[:split], X.iloc[split:], y.iloc[:split]
+    for family in families:
+        scenarios[f"fit_{family}"], model = time_call(lambda: make_model(family).fit(X_train, y_train), repeats)
+        scenarios[f"fit_{family}"]["rows"] = len(X_train)
+        scenarios[f"predict_{family}"], _ = time_call(lambda: model.predict(X_test), repeats)
+        scenarios[f"predict_{family}"]["rows"] = len(X_test)
+
+    foundry_df = df.iloc[-max_model_rows:]
+    scenarios["foundry"], _ = time_call(lambda: engine.run_forecasting_foundry(foundry_df, BENCHMARK_HORIZON), 1)
+    scenarios["foundry"]["rows"] = len(foundry_df)
+
+    for name, timing in scenarios.items():
+        logger.info(f"  {name:<28} {timing['median_seconds'] * 1000:10.1f} ms")
+    return results
+
+
+def compare_to_baseline(results, baseline, threshold=0.2, min_seconds=0.005):
+    """Scenarios whose median time grew by more than threshold (relative) and min_seconds (absolute)."""
+    if baseline["config"] != results["config"]:
+        logger.warning("Baseline was recorded with a different configuration – not comparing.")
+        return []
+
+    regressions = []
+    for name, timing in results["scenarios"].items():
+        reference = baseline["scenarios"].get(name)
+        if reference is None:
+            continue
+        ratio = timing["median_seconds"] / max(reference["median_seconds"], 1e-12)
+        if ratio > 1 + threshold and timing["median_seconds"] - reference["median_seconds"] > min_seconds:
+            regressions.append({"scenario": name, "baseline_seconds": reference["median_seconds"],
+                                "current_seconds": timing["median_seconds"], "ratio": float(ratio)})
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='ATLAS performance benchmark on synthetic freight data')
+    parser.add_argument('--rows', type=int, default=10000, help='Daily rows to generate (1k-1M)')
+    parser.add_argument('--lanes', type=int, default=2, help='Number of lanes (>= 2)')
+    parser.add_argument('--exog', type=int, default=2, help='Number of exogenous series')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeats', type=int, default=3, help='Timed repetitions per scenario (median reported)')
+    parser.add_argument('--families', nargs='+', choices=MODEL_FAMILIES, help='Model families to time (default: all)')
+    parser.add_argument('--max-model-rows', type=int, default=100000,
+                       help='Latest rows used for model and foundry scenarios')
+    parser.add_argument('--full-foundry', action='store_true', help='Time the full foundry instead of quick mode')
+    parser.add_argument('--output', type=str, help='Results JSON filename')
+    parser.add_argument('--baseline', type=str, default=DEFAULT_BASELINE, help='Baseline results to compare with')
+    parser.add_argument('--save-baseline', action='store_true', help='Store these results as the new baseline')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                       help='Allowed relative slowdown before a scenario counts as a regression')
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s', stream=sys.stdout)
+    if not 1000 <= args.rows <= 1000000:
+        parser.error('--rows must be between 1k and 1M')
+    if args.lanes < 2:
+        parser.error('--lanes must be at least 2')
+
+    results = run_benchmark(args.rows, args.lanes, args.exog, args.seed, args.repeats, args.families,
+                            args.max_model_rows, args.full_foundry)
+
+    filename = args.output or f"atlas_benchmark_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline) as f:
+            results["regressions"] = compare_to_baseline(results, json.load(f), args.threshold)
+    with open(filename, 'w') as f:
+        json.dump(results, f, indent=4)
+    logger.info(f"Results saved to {filename}")
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=4)
+        logger.info(f"Baseline saved to {args.baseline}")
+
+    for regression in results.get("regressions", []):
+        logger.error(f"❌ {regression['scenario']}: {regression['current_seconds']:.3f}s vs "
+                     f"{regression['baseline_seconds']:.3f}s baseline ({regression['ratio']:.2f}x)")
+    if results.get("regressions"):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+# atlas_exog.py
+# Exogenous feature ingestion for the freight engines.
+# Every configured market series (Yahoo tickers in one bulk download, or local
+# CSVs) is aligned to a single daily panel that respects each series' publication
+# calendar, stored once on disk and handed to the engines as a memory-mapped view.
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import sys
+from datetime import datetime
+
+import pandas as pd
+
+from atlas_store import write_frame, read_frame, read_frame_meta
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONFIG_PATH = 'atlas_exog.json'
+DEFAULT_STORE_DIR = 'atlas_exog_panel'
+PANEL_START = '2018-01-01'
+
+# Used when atlas_exog.json is missing; matches the series the engines always used
+DEFAULT_SERIES = [
+    {"name": "bdi_proxy_price", "source": "yahoo", "ticker": "BDRY", "calendar": "business"},
+    {"name": "fuel_price", "source": "yahoo", "ticker": "BZ=F", "calendar": "business"}
+]
+
+# Days between a value's observation date and the day it is actually known.
+# Weekly/monthly series are usually dated at the start of their period and
+# released after it ends. Override per series with "publication_lag_days".
+CALENDAR_PUBLICATION_LAG_DAYS = {
+    "daily": 0,
+    "business": 0,
+    "weekly": 7,
+    "monthly": 45
+}
+
+
+def load_exog_config(path=DEFAULT_CONFIG_PATH):
+    if not os.path.exists(path):
+        return DEFAULT_SERIES
+    with open(path) as f:
+        return json.load(f)["series"]
+
+
+def _config_hash(series):
+    return hashlib.sha1(json.dumps(series, sort_keys=True).encode()).hexdigest()
+
+
+def _fetch_raw(series, start, end):
+    """Raw observations per series, indexed by observation date."""
+    raw = {}
+
+    tickers = [s["ticker"] for s in series if s["source"] == "yahoo"]
+    if tickers:
+        import yfinance as yf
+        # One bulk request for every ticker instead of one per series
+        market_data = yf.download(tickers, start=start, end=end, progress=False)
+        for s in series:
+            if s["source"] == "yahoo":
+                raw[s["name"]] = market_data['Close'][s["ticker"]]
+
+    for s in series:
+        if s["source"] == "csv":
+            csv_df = pd.read_csv(s["path"], index_col=s.get("date_column", "Date"), parse_dates=True)
+            raw[s["name"]] = csv_df[s["column"]]
+
+    return raw
+
+
+def align_series(observations, index, calendar="daily", publication_lag_days=None, max_staleness_days=None):
+    """Places observations on a daily index at the date they become known.
+
+    Each value is forward-filled until the next publication; with
+    max_staleness_days set, values older than that are left missing.
+    """
+    if publication_lag_days is None:
+        publication_lag_days = CALENDAR_PUBLICATION_LAG_DAYS[calendar]
+
+    observations = observations.dropna().sort_index()
+    observations.index = observations.index.normalize() + pd.Timedelta(days=publication_lag_days)
+    observations = observations[~observations.index.duplicated(keep='last')]
+
+    daily = observations.reindex(index.union(observations.index)).ffill(limit=max_staleness_days)
+    return daily.reindex(index)
+
+
+def build_panel(series, start=PANEL_START, end=None):
+    end = end or datetime.now()
+    index = pd.date_range(start, end, freq='D', normalize=True)
+    raw = _fetch_raw(series, start, end)
+
+    panel = pd.DataFrame({
+        s["name"]: align_series(raw[s["name"]], index, s.get("calendar", "daily"),
+                                s.get("publication_lag_days"), s.get("max_staleness_days"))
+        for s in series
+    }, index=index)
+    if panel.dropna(how='all').empty:
+        raise ValueError("no exogenous observations were retrieved")
+    return panel
+
+
+def load_exog_panel(store_dir=DEFAULT_STORE_DIR, config_path=DEFAULT_CONFIG_PATH, max_age_hours=24, refresh=False):
+    """Returns the aligned daily exogenous panel, rebuilding it only when stale.
+
+    The returned frame is a read-only view over the memory-mapped store.
+    Falls back to the last stored panel (or an empty frame) if a rebuild fails.
+    """
+    series = load_exog_config(config_path)
+    config_hash = _config_hash(series)
+    meta = read_frame_meta(store_dir)
+    same_config = meta is not None and meta.get("config_hash") == config_hash
+
+    if same_config and not refresh:
+        age_hours = (datetime.now() - datetime.fromisoformat(meta["built_at"])).total_seconds() / 3600
+        if age_hours < max_age_hours:
+            return _usable_columns(read_frame(store_dir))
+
+    try:
+        panel = build_panel(series)
+        write_frame(panel, store_dir, meta={
+            "config_hash": config_hash,
+            "built_at": datetime.now().isoformat(),
+            "series": series
+        })
+        logger.info(f"Built exogenous panel with {len(series)} series ({len(panel)} days) in {store_dir}")
+    except Exception as e:
+        if not same_config:
+            logger.warning(f"Could not build exogenous panel: {e}")
+            return pd.DataFrame()
+        logger.warning(f"Could not refresh exogenous panel ({e}); using panel built {meta['built_at']}")
+
+    return _usable_columns(read_frame(store_dir))
+
+
+def _usable_columns(panel):
+    empty = panel.columns[panel.isna().all()]
+    if len(empty) > 0:
+        logger.warning(f"Exogenous series without data skipped: {', '.join(empty)}")
+        panel = panel.drop(columns=empty)
+    return panel
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build the aligned daily exogenous feature panel')
+    parser.add_argument('--config', type=str, default=DEFAULT_CONFIG_PATH,
+                       help='Series configuration JSON')
+    parser.add_argument('--store', type=str, default=DEFAULT_STORE_DIR,
+                       help='Panel store directory')
+    parser.add_argument('--refresh', action='store_true',
+                       help='Rebuild even if the stored panel is fresh')
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s', stream=sys.stdout)
+
+    panel = load_exog_panel(store_dir=args.store, config_path=args.config, refresh=args.refresh)
+    if panel.empty:
+        sys.exit(1)
+    logger.info(f"Panel {panel.index.min().date()} – {panel.index.max().date()}: {', '.join(panel.columns)}")
+
+if __name__ == "__main__":
+    main()
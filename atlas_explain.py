@@ -0,0 +1,88 @@
+# atlas_explain.py
+# Unified explainability stage for ATLAS champions.
+# Batched SHAP (TreeExplainer for tree ensembles, LinearExplainer for linear
+# models) plus permutation importance parallelised across features. Results are
+# cached per model fingerprint so regenerating reports doesn't recompute them.
+
+import json
+import os
+
+import joblib
+import numpy as np
+import shap
+from sklearn.inspection import permutation_importance
+
+
+class ExplanationCache:
+    def __init__(self, root='atlas_explanations'):
+        self.root = root
+
+    def _path(self, fingerprint):
+        return os.path.join(self.root, f"{fingerprint}.json")
+
+    def get(self, fingerprint):
+        path = self._path(fingerprint)
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            return json.load(f)
+
+    def put(self, fingerprint, explanation):
+        os.makedirs(self.root, exist_ok=True)
+        with open(self._path(fingerprint), 'w') as f:
+            json.dump(explanation, f, indent=4)
+
+
+def model_fingerprint(model, X_train, X_test):
+    """Hash of the fitted model and the data it is explained on."""
+    return joblib.hash((type(model).__name__, model, X_train, X_test))
+
+
+def _shap_values(model, X_train, X_test):
+    if hasattr(model, 'coef_'):
+        return "linear", shap.LinearExplainer(model, X_train).shap_values(X_test)
+    # One batched call over the whole test window
+    return "tree", shap.TreeExplainer(model).shap_values(X_test, check_additivity=False)
+
+
+def explain_model(model, X_train, X_test, y_test, cache=None, n_samples=3, n_repeats=5, n_jobs=-1, top_n=5):
+    fingerprint = model_fingerprint(model, X_train, X_test)
+    if cache is not None:
+        cached = cache.get(fingerprint)
+        if cached is not None:
+            return cached
+
+    columns = list(X_test.columns)
+    explanation = {"fingerprint": fingerprint}
+
+    # Permutation importance: features are shuffled in parallel worker processes
+    perm = permutation_importance(model, X_test, y_test, n_repeats=n_repeats, n_jobs=n_jobs,
+                                  random_state=42, scoring='neg_mean_absolute_error')
+    order = np.argsort(perm.importances_mean)[::-1][:top_n]
+    explanation["permutation_importance"] = [
+        (columns[i], float(perm.importances_mean[i]), float(perm.importances_std[i])) for i in order
+    ]
+
+    method, shap_values = _shap_values(model, X_train, X_test)
+    shap_values = np.asarray(shap_values)
+    mean_shap = np.mean(np.abs(shap_values), axis=0)
+    shap_importance = sorted(zip(columns, mean_shap), key=lambda x: x[1], reverse=True)
+    explanation["method"] = method
+    explanation["feature_importance"] = [(k, float(v)) for k, v in shap_importance[:top_n]]
+
+    # Sample explanations for the first few predictions, predicted in one batch
+    n = min(n_samples, len(X_test))
+    sample_preds = model.predict(X_test.iloc[:n])
+    explanation["sample_explanations"] = [
+        {
+            "date": X_test.index[i].strftime('%Y-%m-%d'),
+            "prediction": float(sample_preds[i]),
+            "actual": float(y_test.iloc[i]),
+            "feature_contributions": {feature: float(shap_values[i][j]) for j, feature in enumerate(columns)}
+        }
+        for i in range(n)
+    ]
+
+    if cache is not None:
+        cache.put(fingerprint, explanation)
+    return explanation
@@ -0,0 +1,63 @@
+# atlas_lags.py
+# FFT-based automatic lag selection for exogenous features.
+# Cross-correlations between every input column and the target are computed for
+# all lags up to max_lag in a single batched FFT, then the most informative lags
+# per column are kept under a total feature budget.
+
+import numpy as np
+
+
+def cross_correlations(X, y, max_lag):
+    """Correlation of each column of X lagged by 0..max_lag with y.
+
+    X is (n, k), y is (n,). Returns a (max_lag + 1, k) array where entry [l, j]
+    is corr(X[t - l, j], y[t]) over the overlapping samples.
+    """
+    X = np.asarray(X, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    n = len(y)
+    X = (X - X.mean(axis=0)) / (X.std(axis=0) + 1e-12)
+    y = (y - y.mean()) / (y.std() + 1e-12)
+
+    # Zero-padding to >= 2n turns the circular correlation into a linear one
+    nfft = 1 << int(np.ceil(np.log2(2 * n)))
+    spectrum = np.conj(np.fft.rfft(X, nfft, axis=0)) * np.fft.rfft(y, nfft)[:, None]
+    raw = np.fft.irfft(spectrum, nfft, axis=0)[:max_lag + 1]
+
+    overlap = (n - np.arange(max_lag + 1))[:, None]
+    return raw / overlap
+
+
+def select_lags(df, target, columns, max_lag=365, top_k=4, max_features=16,
+                min_lag=1, min_separation=3, difference=True):
+    """Keeps the top_k most correlated lags per column under a max_features budget.
+
+    Lags within min_separation of an already chosen peak are suppressed so the
+    budget isn't spent on neighbouring, nearly identical lags. With difference=True
+    correlations are computed on first differences, which stops the shared trend
+    of price levels from making every lag look equally informative.
+    """
+    columns = [col for col in columns if col in df.columns]
+    X = df[columns].to_numpy(dtype=np.float64)
+    y = np.asarray(target, dtype=np.float64)
+    if difference:
+        X, y = np.diff(X, axis=0), np.diff(y)
+    max_lag = min(max_lag, len(y) // 2)
+
+    corr = np.abs(cross_correlations(X, y, max_lag))
+    corr[:min_lag] = 0.0
+
+    candidates = []
+    for j, col in enumerate(columns):
+        scores = corr[:, j].copy()
+        for _ in range(top_k):
+            lag = int(np.argmax(scores))
+            if scores[lag] <= 0:
+                break
+            candidates.append((float(scores[lag]), col, lag))
+            scores[max(0, lag - min_separation):lag + min_separation + 1] = 0.0
+
+    selected = {col: [] for col in columns}
+    for score, col, lag in sorted(candidates, reverse=True)[:max_features]:
+        selected[col].append(lag)
+    return {col: sorted(lags) for col, lags in selected.items() if lags}
@@ -0,0 +1,113 @@
+# atlas_regimes.py
+# Change-point detection over the freight series for regime-aware training windows.
+# PELT and binary segmentation with O(1) segment costs from cumulative sums, so a
+# full pass over the price history is effectively linear in its length.
+
+import numpy as np
+import pandas as pd
+
+REGIME_SERIES = ['feuw_price', 'uwfe_price', 'trade_imbalance_ratio']
+
+
+class _SegmentCost:
+    """Gaussian mean-shift cost: within-segment sum of squared deviations."""
+
+    def __init__(self, signal):
+        signal = np.asarray(signal, dtype=np.float64)
+        self.cumsum = np.concatenate([[0.0], np.cumsum(signal)])
+        self.cumsum_sq = np.concatenate([[0.0], np.cumsum(signal ** 2)])
+
+    def __call__(self, start, end):
+        # start/end may be arrays of candidate split points
+        n = end - start
+        total = self.cumsum[end] - self.cumsum[start]
+        return self.cumsum_sq[end] - self.cumsum_sq[start] - total ** 2 / n
+
+
+def _prepare(signal):
+    """Standardized log series so one penalty works across lanes and the ratio."""
+    signal = np.log(np.asarray(signal, dtype=np.float64))
+    return (signal - signal.mean()) / (signal.std() + 1e-12)
+
+
+def pelt(signal, penalty, min_size=90):
+    """Pruned Exact Linear Time search. Returns sorted change-point indices."""
+    n = len(signal)
+    cost = _SegmentCost(signal)
+    best = np.full(n + 1, np.inf)
+    best[0] = -penalty
+    last_change = np.zeros(n + 1, dtype=np.int64)
+    candidates = np.array([0], dtype=np.int64)
+
+    for t in range(min_size, n + 1):
+        # Split points become admissible once they are min_size behind t
+        admissible = candidates[t - candidates >= min_size]
+        if len(admissible) == 0:
+            candidates = np.append(candidates, t - min_size + 1)
+            continue
+        totals = best[admissible] + cost(admissible, t) + penalty
+        i = np.argmin(totals)
+        best[t] = totals[i]
+        last_change[t] = admissible[i]
+
+        # Pruning: drop split points that can never be optimal again
+        keep = totals - penalty <= best[t]
+        pending = candidates[t - candidates < min_size]
+        candidates = np.concatenate([admissible[keep], pending, [t - min_size + 1]])
+
+    change_points = []
+    t = n
+    while t > 0:
+        t = last_change[t]
+        if t > 0:
+            change_points.append(int(t))
+    return sorted(change_points)
+
+
+def binary_segmentation(signal, penalty, min_size=90, max_change_points=20):
+    """Greedy recursive splitting; cheaper than PELT but not guaranteed optimal."""
+    cost = _SegmentCost(signal)
+    change_points = []
+    segments = [(0, len(signal))]
+
+    while segments and len(change_points) < max_change_points:
+        start, end = segments.pop()
+        if end - start < 2 * min_size:
+            continue
+        splits = np.arange(start + min_size, end - min_size + 1)
+        gains = cost(start, end) - cost(start, splits) - cost(splits, end)
+        i = np.argmax(gains)
+        if gains[i] > penalty:
+            change_points.append(int(splits[i]))
+            segments.extend([(start, int(splits[i])), (int(splits[i]), end)])
+    return sorted(change_points)
+
+
+def detect_regimes(df, columns=None, method='pelt', beta=8.0, min_size=90, min_regime_days=365, end=None):
+    """Finds regime boundaries per series and the start of the current regime.
+
+    The current regime starts at the latest boundary across all series that
+    still leaves at least min_regime_days of history to train on, up to end
+    (default: the last date of df; pass the full data's end when df is only
+    the history the boundaries may be fitted on).
+    """
+    columns = [col for col in (columns or REGIME_SERIES) if col in df.columns]
+    search = pelt if method == 'pelt' else binary_segmentation
+    penalty = beta * np.log(len(df))
+
+    boundaries = {}
+    for col in columns:
+        values = df[col].dropna()
+        change_points = search(_prepare(values.to_numpy()), penalty, min_size=min_size)
+        boundaries[col] = [values.index[cp] for cp in change_points]
+
+    latest_allowed = (df.index.max() if end is None else pd.Timestamp(end)) - pd.Timedelta(days=min_regime_days)
+    starts = [date for dates in boundaries.values() for date in dates if date <= latest_allowed]
+    regime_start = max(starts) if starts else df.index.min()
+
+    return {
+        "method": method,
+        "penalty": float(penalty),
+        "boundaries": {col: [date.strftime('%Y-%m-%d') for date in dates] for col, dates in boundaries.items()},
+        "current_regime_start": regime_start.strftime('%Y-%m-%d')
+    }
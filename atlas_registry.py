@@ -0,0 +1,86 @@
+# atlas_registry.py
+# Model registry for the ATLAS engine.
+# Keeps the served champion per horizon on disk (joblib) together with the
+# feature columns and metrics it was trained with, indexed by a small JSON file.
+
+import json
+import os
+from datetime import datetime
+
+import joblib
+import pandas as pd
+
+
+class ModelRegistry:
+    def __init__(self, root='atlas_registry'):
+        self.root = root
+        self.index_path = os.path.join(root, 'index.json')
+        os.makedirs(root, exist_ok=True)
+        self.index = self._read_index()
+
+    def _read_index(self):
+        if os.path.exists(self.index_path):
+            with open(self.index_path) as f:
+                return json.load(f)
+        return {"models": {}, "tuning": {}}
+
+    def _write_index(self):
+        tmp_path = f"{self.index_path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self.index, f, indent=4)
+        os.replace(tmp_path, self.index_path)
+
+    def register(self, horizon_key, name, model, feature_cols, metrics, train_end, lags=None, results_file=None):
+        """Stores the champion for a horizon, replacing any previous entry."""
+        model_file = f"{horizon_key}.joblib"
+        joblib.dump(model, os.path.join(self.root, model_file))
+        self.index["models"][horizon_key] = {
+            "name": name,
+            "path": model_file,
+            "feature_cols": list(feature_cols),
+            "lags": lags,
+            "metrics": metrics,
+            "train_end": train_end,
+            "trained_at": datetime.now().isoformat(),
+            "results_file": results_file
+        }
+        self._write_index()
+
+    def entry(self, horizon_key):
+        return self.index["models"].get(horizon_key)
+
+    def horizons(self):
+        return list(self.index["models"].keys())
+
+    def tuned_params(self, horizon_key, family, feature_cols, before=None):
+        """Best hyperparameters found for a horizon/family, if tuned on the same features.
+
+        With before, only configs tuned on rows that all end before that date are
+        returned, so a cached search cannot have seen the folds it is scored on.
+        """
+        entry = self.index.get("tuning", {}).get(horizon_key, {}).get(family)
+        if entry is None or entry["feature_cols"] != list(feature_cols):
+            return None
+        if before is not None and (entry.get("tuned_through") is None or
+                                   pd.Timestamp(entry["tuned_through"]) >= pd.Timestamp(before)):
+            return None
+        return entry
+
+    def store_tuned_params(self, horizon_key, family, feature_cols, result, tuned_through=None):
+        self.index.setdefault("tuning", {}).setdefault(horizon_key, {})[family] = {
+            "params": result["params"],
+            "cv_mae": result["cv_mae"],
+            "trials": result["trials"],
+            "cpu_seconds": result["cpu_seconds"],
+            "feature_cols": list(feature_cols),
+            "tuned_through": None if tuned_through is None else pd.Timestamp(tuned_through).strftime('%Y-%m-%d'),
+            "tuned_at": datetime.now().isoformat()
+        }
+        self._write_index()
+
+    def load(self, horizon_key):
+        """Returns (model, entry) for a horizon, or (None, None) if nothing is registered."""
+        entry = self.entry(horizon_key)
+        if entry is None:
+            return None, None
+        return joblib.load(os.path.join(self.root, entry["path"])), entry
@@ -0,0 +1,284 @@
+# atlas_scheduler.py
+# Drift-triggered retraining scheduler for the ATLAS engine.
+# Watches the input files, keeps cheap incremental drift statistics (PSI/KS on
+# the input features, rolling residual error of the served champions) and only
+# runs the full forecasting foundry when drift or staleness crosses a threshold.
+# Otherwise the cached results from the last retrain keep being served.
+
+import argparse
+import json
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from kalopathor_2_engine import AtlasEngine
+from atlas_registry import ModelRegistry
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WATCH_PATHS = ['xsicfeuw_data.csv', 'xsiuwfe_data.csv', 'atlas_exog_panel/meta.json']
+
+
+class DriftMonitor:
+    """Quantile-binned reference distributions with incrementally updated PSI/KS.
+
+    New observations only add to per-bin counts, so each update costs O(rows)
+    and scoring costs O(bins) regardless of how much history has been seen.
+    KS is evaluated on the binned CDFs, which is exact at the bin edges.
+    """
+
+    def __init__(self, n_bins=20):
+        self.n_bins = n_bins
+        self.features = {}
+
+    def fit_reference(self, features_df):
+        self.features = {}
+        for col in features_df.columns:
+            values = features_df[col].dropna().to_numpy()
+            if len(values) == 0:
+                continue
+            edges = np.unique(np.quantile(values, np.linspace(0, 1, self.n_bins + 1)[1:-1]))
+            ref_counts = np.bincount(np.searchsorted(edges, values, side='right'), minlength=len(edges) + 1)
+            self.features[col] = {
+                "edges": edges.tolist(),
+                "reference": (ref_counts / ref_counts.sum()).tolist(),
+                "counts": [0] * (len(edges) + 1)
+            }
+
+    def update(self, features_df):
+        """Adds newly observed rows to the running bin counts."""
+        for col, state in self.features.items():
+            if col not in features_df.columns:
+                continue
+            values = features_df[col].dropna().to_numpy()
+            bins = np.searchsorted(np.asarray(state["edges"]), values, side='right')
+            state["counts"] = (np.asarray(state["counts"]) + np.bincount(bins, minlength=len(state["counts"]))).tolist()
+
+    def scores(self):
+        scores = {}
+        for col, state in self.features.items():
+            counts = np.asarray(state["counts"], dtype=float)
+            n = counts.sum()
+            if n == 0:
+                scores[col] = {"psi": 0.0, "ks": 0.0, "n": 0}
+                continue
+            observed = np.clip(counts / n, 1e-6, None)
+            expected = np.clip(np.asarray(state["reference"]), 1e-6, None)
+            psi = np.sum((observed - expected) * np.log(observed / expected))
+            ks = np.max(np.abs(np.cumsum(counts / n) - np.cumsum(state["reference"])))
+            scores[col] = {"psi": float(psi), "ks": float(ks), "n": int(n)}
+        return scores
+
+    def to_dict(self):
+        return {"n_bins": self.n_bins, "features": self.features}
+
+    @classmethod
+    def from_dict(cls, data):
+        monitor = cls(n_bins=data.get("n_bins", 20))
+        monitor.features = data.get("features", {})
+        return monitor
+
+
+class AtlasScheduler:
+    def __init__(self, registry_dir='atlas_registry', watch_paths=None, quick_mode=False, regime_aware=False,
+                 psi_threshold=0.25, ks_threshold=0.3, residual_ratio=1.5, residual_window=30,
+                 min_drift_rows=14, max_age_days=7):
+        self.registry = ModelRegistry(registry_dir)
+        self.watch_paths = list(watch_paths or DEFAULT_WATCH_PATHS)
+        self.quick_mode = quick_mode
+        self.regime_aware = regime_aware
+        self.psi_threshold = psi_threshold
+        self.ks_threshold = ks_threshold
+        self.residual_ratio = residual_ratio
+        self.residual_window = residual_window
+        self.min_drift_rows = min_drift_rows
+        self.max_age_days = max_age_days
+        self.state_path = os.path.join(registry_dir, 'scheduler_state.json')
+        self.state = self._load_state()
+        self.monitor = DriftMonitor.from_dict(self.state.get("drift", {}))
+
+    def _load_state(self):
+        if os.path.exists(self.state_path):
+            with open(self.state_path) as f:
+                return json.load(f)
+        return {"fingerprints": {}, "residuals": {}}
+
+    def _save_state(self):
+        self.state["drift"] = self.monitor.to_dict()
+        tmp_path = f"{self.state_path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self.state, f, indent=4)
+        os.replace(tmp_path, self.state_path)
+
+    def _fingerprints(self):
+        fingerprints = {}
+        for path in self.watch_paths:
+            if os.path.exists(path):
+                stat = os.stat(path)
+                fingerprints[path] = [stat.st_mtime_ns, stat.st_size]
+        return fingerprints
+
+    @staticmethod
+    def drift_features(engine, features_df):
+        """Monitored inputs: every lagged model input, so exogenous panel series are covered too."""
+        return [col for col in engine.lag_columns(features_df) if col in features_df.columns]
+
+    def _age_days(self):
+        if "last_retrain" not in self.state:
+            return None
+        return (datetime.now() - datetime.fromisoformat(self.state["last_retrain"])).total_seconds() / 86400
+
+    def _update_residuals(self, engine, df):
+        """Scores the served champions on rows whose target became known since the last check."""
+        report = {}
+        for horizon_key in self.registry.horizons():
+            model, entry = self.registry.load(horizon_key)
+            h = int(horizon_key.split('_')[0])
+            features = engine.create_features(df, lags=entry.get("lags"))
+            tracker = self.state["residuals"].setdefault(horizon_key, {"last_scored": entry["train_end"], "errors": []})
+
+            target = df[engine.target_column].shift(-h)
+            rows = (df.index > pd.Timestamp(tracker["last_scored"])) & target.notna().to_numpy()
+            X = features.loc[rows, entry["feature_cols"]].dropna()
+            if len(X) > 0:
+                errors = np.abs(model.predict(X) - target.loc[X.index].to_numpy())
+                tracker["errors"] = (tracker["errors"] + errors.tolist())[-self.residual_window:]
+                tracker["last_scored"] = X.index.max().strftime('%Y-%m-%d')
+
+            baseline_mae = entry["metrics"]["mae"]
+            rolling_mae = float(np.mean(tracker["errors"])) if tracker["errors"] else None
+            report[horizon_key] = {
+                "rolling_mae": rolling_mae,
+                "baseline_mae": baseline_mae,
+                "ratio": rolling_mae / baseline_mae if rolling_mae is not None and baseline_mae > 0 else None
+            }
+        return report
+
+    def check(self):
+        """Decides whether the cached forecasts can keep being served.
+
+        Input data is only reloaded when a watched file changed or the models
+        are stale; the drift statistics are updated with the new rows only.
+        """
+        decision = {"timestamp": datetime.now().isoformat(), "action": "serve_cached", "reasons": []}
+        fingerprints = self._fingerprints()
+        age = self._age_days()
+
+        if not self.registry.horizons():
+            decision["reasons"].append("no registered models")
+        if age is not None and age > self.max_age_days:
+            decision["reasons"].append(f"models are {age:.1f} days old (max {self.max_age_days})")
+
+        if fingerprints == self.state["fingerprints"] and not decision["reasons"]:
+            return decision, None
+
+        engine = AtlasEngine(quick_mode=self.quick_mode, regime_aware=self.regime_aware)
+        df = engine.load_data()
+        self.state["fingerprints"] = fingerprints
+
+        if self.registry.horizons():
+            last_seen = pd.Timestamp(self.state.get("last_seen", df.index.min()))
+            new_rows = engine.create_features(df).loc[df.index > last_seen]
+            self.monitor.update(new_rows[self.drift_features(engine, new_rows)])
+            self.state["last_seen"] = df.index.max().strftime('%Y-%m-%d')
+
+            decision["drift"] = self.monitor.scores()
+            for col, score in decision["drift"].items():
+                if score["n"] < self.min_drift_rows:
+                    continue
+                if score["psi"] > self.psi_threshold:
+                    decision["reasons"].append(f"PSI drift on {col} ({score['psi']:.3f})")
+                if score["ks"] > self.ks_threshold:
+                    decision["reasons"].append(f"KS drift on {col} ({score['ks']:.3f})")
+
+            decision["residuals"] = self._update_residuals(engine, df)
+            for horizon_key, residual in decision["residuals"].items():
+                if residual["ratio"] is not None and residual["ratio"] > self.residual_ratio:
+                    decision["reasons"].append(f"{horizon_key} rolling MAE {residual['ratio']:.2f}x training MAE")
+
+        if decision["reasons"]:
+            decision["action"] = "retrain"
+        self._save_state()
+        return decision, df
+
+    def retrain(self, df):
+        engine = AtlasEngine(quick_mode=self.quick_mode, regime_aware=self.regime_aware)
+        output_file = os.path.join(self.registry.root, f"atlas_v2_results_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+        engine.run_all(output_file=output_file, registry=self.registry, df=df)
+
+        # New reference distribution and residual baseline from the retrained state
+        features = engine.create_features(df)
+        self.monitor.fit_reference(features[self.drift_features(engine, features)])
+        self.state["residuals"] = {
+            horizon_key: {
+                "last_scored": (df.index.max() - timedelta(days=int(horizon_key.split('_')[0]))).strftime('%Y-%m-%d'),
+                "errors": []
+            }
+            for horizon_key in self.registry.horizons()
+        }
+        self.state["last_seen"] = df.index.max().strftime('%Y-%m-%d')
+        self.state["last_retrain"] = datetime.now().isoformat()
+        self.state["results_file"] = output_file
+        self._save_state()
+
+    def cached_forecast(self):
+        """Returns the results of the last retrain, or None if nothing has been trained yet."""
+        results_file = self.state.get("results_file")
+        if results_file is None or not os.path.exists(results_file):
+            return None
+        with open(results_file) as f:
+            return json.load(f)
+
+    def tick(self):
+        decision, df = self.check()
+        if decision["action"] == "retrain":
+            logger.info(f"🔁 Retraining: {'; '.join(decision['reasons'])}")
+            self.retrain(df)
+        else:
+            logger.info("✅ No significant drift – serving cached forecasts.")
+        return decision
+
+    def run_forever(self, interval_seconds=3600):
+        logger.info(f"🚀 ATLAS scheduler watching {', '.join(self.watch_paths)} every {interval_seconds}s")
+        while True:
+            try:
+                self.tick()
+            except Exception as e:
+                logger.error(f"Scheduler tick failed: {e}")
+            time.sleep(interval_seconds)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='ATLAS drift-triggered retraining scheduler')
+    parser.add_argument('--registry', type=str, default='atlas_registry',
+                       help='Model registry directory')
+    parser.add_argument('--watch', type=str, nargs='+',
+                       help='Files to watch for changes (default: the lane CSVs)')
+    parser.add_argument('--interval', type=int, default=3600,
+                       help='Seconds between drift checks')
+    parser.add_argument('--once', action='store_true',
+                       help='Run a single check (and retrain if needed), then exit')
+    parser.add_argument('--quick', action='store_true',
+                       help='Retrain in quick mode (Ridge only, 7-day horizon)')
+    parser.add_argument('--regime-aware', action='store_true',
+                       help='Retrain on the current regime only')
+    parser.add_argument('--max-age-days', type=float, default=7,
+                       help='Retrain when the served models are older than this')
+
+    args = parser.parse_args()
+
+    scheduler = AtlasScheduler(registry_dir=args.registry, watch_paths=args.watch,
+                               quick_mode=args.quick, regime_aware=args.regime_aware,
+                               max_age_days=args.max_age_days)
+    if args.once:
+        decision = scheduler.tick()
+        print(json.dumps(decision, indent=4))
+    else:
+        scheduler.run_forever(args.interval)
+
+if __name__ == "__main__":
+    main()
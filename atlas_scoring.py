@@ -0,0 +1,73 @@
+# atlas_scoring.py
+# Probabilistic forecast scoring for ATLAS.
+# Quantile forecasts come from conformal residuals: each CV fold's point
+# predictions are widened by the residual quantiles of the folds before it.
+# CRPS, pinball loss, coverage and interval width are then computed for every
+# model and fold in single broadcast array operations.
+
+import numpy as np
+
+# Equally spaced levels, so the mean pinball loss over them approximates CRPS
+QUANTILES = np.round(np.linspace(0.05, 0.95, 19), 2)
+INTERVAL = (0.1, 0.9)
+
+
+def pinball_loss(actual, quantile_preds, taus=QUANTILES):
+    """Mean pinball loss per quantile level.
+
+    actual is (..., n) and quantile_preds is (..., n, Q); returns (..., Q).
+    """
+    taus = np.asarray(taus)
+    diff = np.asarray(actual)[..., None] - quantile_preds
+    return np.mean(np.maximum(taus * diff, (taus - 1) * diff), axis=-2)
+
+
+def crps_from_quantiles(actual, quantile_preds, taus=QUANTILES):
+    """CRPS approximated as twice the mean pinball loss over equally spaced levels."""
+    return 2 * np.mean(pinball_loss(actual, quantile_preds, taus), axis=-1)
+
+
+def interval_scores(actual, lower, upper):
+    """Empirical coverage and mean width of [lower, upper]; reduces the last axis."""
+    actual = np.asarray(actual)
+    covered = (actual >= lower) & (actual <= upper)
+    return np.mean(covered, axis=-1), np.mean(upper - lower, axis=-1)
+
+
+def conformal_quantiles(preds, actuals, taus=QUANTILES):
+    """Quantile forecasts for folds 1..F-1 from residuals of all earlier folds.
+
+    preds is (models, folds, n) and actuals is (folds, n); the folds must be
+    equally sized (as TimeSeriesSplit test folds are). Returns
+    (models, folds - 1, n, Q).
+    """
+    residuals = np.asarray(actuals)[None] - preds
+    n_models, n_folds, _ = preds.shape
+    offsets = np.stack([
+        np.quantile(residuals[:, :k].reshape(n_models, -1), taus, axis=1).T
+        for k in range(1, n_folds)
+    ], axis=1)
+    return preds[:, 1:, :, None] + offsets[:, :, None, :]
+
+
+def score_folds(preds, actuals, taus=QUANTILES, interval=INTERVAL):
+    """Probabilistic scores for every model and scored fold.
+
+    Returns arrays: crps (M, F-1), pinball (M, F-1, Q), coverage and width (M, F-1).
+    """
+    taus = np.asarray(taus)
+    preds = np.asarray(preds, dtype=np.float64)
+    actuals = np.asarray(actuals, dtype=np.float64)
+    quantile_preds = conformal_quantiles(preds, actuals, taus)
+    scored_actuals = actuals[1:]
+
+    lower = quantile_preds[..., int(np.argmin(np.abs(taus - interval[0])))]
+    upper = quantile_preds[..., int(np.argmin(np.abs(taus - interval[1])))]
+    coverage, width = interval_scores(scored_actuals, lower, upper)
+    pinball = pinball_loss(scored_actuals, quantile_preds, taus)
+    return {
+        "crps": 2 * np.mean(pinball, axis=-1),
+        "pinball": pinball,
+        "coverage": coverage,
+        "width": width
+    }
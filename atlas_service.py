@@ -0,0 +1,339 @@
+# atlas_service.py
+# Local HTTP forecast service for the champions in the ATLAS model registry.
+# Concurrent predict requests for the same horizon are gathered into micro-batches
+# (closed when full or when the oldest request has waited the latency budget) and
+# scored with one vectorised predict call. Per-horizon request/batch counters and
+# p50/p99 latencies are exposed on /metrics.
+
+import argparse
+import json
+import logging
+import queue
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+import pandas as pd
+
+from atlas_registry import ModelRegistry
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PORT = 8765
+LATENCY_WINDOW = 10000
+
+
+class UnknownHorizonError(LookupError):
+    """Raised for a horizon with no registered champion (served as a 404)."""
+
+
+class LatencyStats:
+    """Request and batch counters plus a rolling window of request latencies."""
+
+    def __init__(self, window=LATENCY_WINDOW):
+        self._latencies = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.rows = 0
+        self.batches = 0
+
+    def record_batch(self, latencies, n_rows):
+        with self._lock:
+            self._latencies.extend(latencies)
+            self.requests += len(latencies)
+            self.rows += n_rows
+            self.batches += 1
+
+    def to_dict(self):
+        with self._lock:
+            latencies = np.array(self._latencies)
+            requests, rows, batches = self.requests, self.rows, self.batches
+        p50, p99 = np.percentile(latencies, [50, 99]) * 1000 if len(latencies) else (None, None)
+        return {
+            "requests": requests,
+            "rows": rows,
+            "batches": batches,
+            "mean_batch_requests": requests / batches if batches else None,
+            "p50_ms": None if p50 is None else float(p50),
+            "p99_ms": None if p99 is None else float(p99)
+        }
+
+
+class MicroBatcher:
+    """Collects feature rows from concurrent callers and scores them in one call.
+
+    predict_fn takes a (rows, features) array. A batch is sent once it holds
+    max_batch_rows rows or its first request has waited max_wait_ms.
+    """
+
+    def __init__(self, predict_fn, max_batch_rows=512, max_wait_ms=5.0):
+        self.predict_fn = predict_fn
+        self.max_batch_rows = max_batch_rows
+        self.max_wait = max_wait_ms / 1000
+        self.stats = LatencyStats()
+        self._queue = queue.Queue()
+        self._worker = threading.Thread(target=self._run, daemon=True)
+        self._worker.start()
+
+    def submit(self, rows):
+        """Queues a (rows, features) array; the Future resolves to its predictions."""
+        future = Future()
+        self._queue.put((np.atleast_2d(np.asarray(rows, dtype=np.float64)), future, time.perf_counter()))
+        return future
+
+    def predict(self, rows, timeout=30):
+        return self.submit(rows).result(timeout)
+
+    def close(self):
+        self._queue.put(None)
+        self._worker.join()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            batch = [item]
+            n_rows = len(item[0])
+            deadline = item[2] + self.max_wait
+            while n_rows < self.max_batch_rows:
+                try:
+                    item = self._queue.get(timeout=max(0.0, deadline - time.perf_counter()))
+                except queue.Empty:
+                    break
+                if item is None:
+                    self._queue.put(None)
+                    break
+                batch.append(item)
+                n_rows += len(item[0])
+            self._score(batch, n_rows)
+
+    def _score(self, batch, n_rows):
+        try:
+            preds = np.asarray(self.predict_fn(np.concatenate([rows for rows, _, _ in batch])), dtype=np.float64)
+        except Exception as e:
+            for _, future, _ in batch:
+                future.set_exception(e)
+            return
+
+        done = time.perf_counter()
+        offset = 0
+        for rows, future, _ in batch:
+            future.set_result(preds[offset:offset + len(rows)])
+            offset += len(rows)
+        self.stats.record_batch([done - queued for _, _, queued in batch], n_rows)
+
+
+class ForecastService:
+    """Serves every registered horizon through its own micro-batcher.
+
+    With a stream journal, requests without explicit features are scored on the
+    latest FreightStream feature row.
+    """
+
+    def __init__(self, registry_dir='atlas_registry', journal_path=None, max_batch_rows=512, max_wait_ms=5.0):
+        self.registry = ModelRegistry(registry_dir)
+        self.models = {}
+        self.batchers = {}
+        for horizon_key in self.registry.horizons():
+            model, entry = self.registry.load(horizon_key)
+            self.models[horizon_key] = entry
+            self.batchers[horizon_key] = MicroBatcher(self._predict_fn(model, entry["feature_cols"]),
+                                                      max_batch_rows, max_wait_ms)
+        if not self.models:
+            raise ValueError(f"No models registered in {registry_dir}")
+
+        self.stream = self._open_stream(journal_path) if journal_path else None
+        self._stream_lock = threading.Lock()
+        logger.info(f"🚀 Serving {', '.join(self.models)} from {registry_dir}")
+
+    @staticmethod
+    def _predict_fn(model, feature_cols):
+        # Models fitted on frames expect their column names; lean-mode models take arrays
+        if hasattr(model, 'feature_names_in_'):
+            return lambda rows: model.predict(pd.DataFrame(rows, columns=feature_cols))
+        return lambda rows: model.predict(rows.astype(np.float32))
+
+    def _open_stream(self, journal_path):
+        from atlas_stream import FreightStream, _read_header
+        from kalopathor_2_engine import DEFAULT_LAGS
+
+        columns, _ = _read_header(journal_path)
+        lags = {}
+        for entry in self.models.values():
+            entry_lags = entry.get("lags") or {col: DEFAULT_LAGS for col in columns[1:] + ['trade_imbalance_ratio']}
+            for col, col_lags in entry_lags.items():
+                lags[col] = sorted(set(lags.get(col, [])) | set(col_lags))
+        return FreightStream(journal_path, lags)
+
+    def horizon_entry(self, horizon_key):
+        if horizon_key not in self.models:
+            raise UnknownHorizonError(f"Unknown horizon {horizon_key}; registered: {', '.join(self.models)}")
+        return self.models[horizon_key]
+
+    def predict(self, horizon_key, instances):
+        """Predictions for a list of feature dicts (or a rows x feature_cols array).
+
+        Instances are validated here, before they join a batch, so one malformed
+        request cannot fail the other requests scored with it.
+        """
+        feature_cols = self.horizon_entry(horizon_key)["feature_cols"]
+        if len(instances) and isinstance(instances[0], dict):
+            missing = set(feature_cols) - set.intersection(*map(set, instances))
+            if missing:
+                raise ValueError(f"Missing features: {', '.join(sorted(missing))}")
+            instances = [[instance[col] for col in feature_cols] for instance in instances]
+        rows = np.atleast_2d(np.asarray(instances, dtype=np.float64))
+        if rows.ndim != 2 or rows.shape[0] == 0 or rows.shape[1] != len(feature_cols):
+            raise ValueError(f"Expected a non-empty list of rows with {len(feature_cols)} features, "
+                             f"got shape {rows.shape}")
+        return self.batchers[horizon_key].predict(rows)
+
+    def latest(self, horizon_key):
+        """Forecast from the newest journal row, dated by its target day."""
+        if self.stream is None:
+            raise ValueError("No stream journal configured")
+        feature_cols = self.horizon_entry(horizon_key)["feature_cols"]
+        with self._stream_lock:
+            row = self.stream.current_row()
+        missing = [col for col in feature_cols if col not in row.index]
+        if missing:
+            raise ValueError(f"Stream journal lacks features: {', '.join(missing)}")
+        prediction = self.batchers[horizon_key].predict([row[feature_cols].to_numpy()])[0]
+        h = int(horizon_key.split('_')[0])
+        return {"as_of": row.name.strftime('%Y-%m-%d'),
+                "target_date": (row.name + pd.Timedelta(days=h)).strftime('%Y-%m-%d'),
+                "prediction": float(prediction)}
+
+    def observe(self, date, feuw, uwfe, **exog):
+        if self.stream is None:
+            raise ValueError("No stream journal configured")
+        with self._stream_lock:
+            self.stream.append_observation(date, feuw, uwfe, **exog)
+            return self.stream.last_date.strftime('%Y-%m-%d')
+
+    def metrics(self):
+        return {horizon_key: batcher.stats.to_dict() for horizon_key, batcher in self.batchers.items()}
+
+    def close(self):
+        for batcher in self.batchers.values():
+            batcher.close()
+
+
+class ForecastHandler(BaseHTTPRequestHandler):
+    """JSON endpoints: GET /health, /metrics, /forecast?horizon=; POST /predict, /observe."""
+
+    def _send(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _dispatch(self, action):
+        try:
+            self._send(200, action())
+        except UnknownHorizonError as e:
+            self._send(404, {"error": str(e)})
+        except (ValueError, TypeError) as e:
+            self._send(400, {"error": str(e)})
+        except Exception as e:
+            logger.error(f"Request failed: {e}")
+            self._send(500, {"error": str(e)})
+
+    def _body(self, *required):
+        """The JSON request object; missing required keys are a client error, not a 404."""
+        length = int(self.headers.get('Content-Length', 0))
+        request = json.loads(self.rfile.read(length) or b'{}')
+        if not isinstance(request, dict):
+            raise ValueError("Expected a JSON object")
+        missing = [key for key in required if key not in request]
+        if missing:
+            raise ValueError(f"Missing fields: {', '.join(missing)}")
+        return request
+
+    def do_GET(self):
+        service = self.server.service
+        url = urlparse(self.path)
+        if url.path == '/health':
+            self._dispatch(lambda: {"status": "ok", "horizons": list(service.models)})
+        elif url.path == '/metrics':
+            self._dispatch(service.metrics)
+        elif url.path == '/forecast':
+            horizon = parse_qs(url.query).get('horizon', ['7_day'])[0]
+            self._dispatch(lambda: dict(service.latest(horizon), horizon=horizon))
+        else:
+            self._send(404, {"error": f"Unknown path {url.path}"})
+
+    def do_POST(self):
+        service = self.server.service
+        url = urlparse(self.path)
+        if url.path == '/predict':
+            def action():
+                request = self._body('instances')
+                horizon = request.get('horizon', '7_day')
+                predictions = service.predict(horizon, request['instances'])
+                return {"horizon": horizon, "model": service.models[horizon]["name"],
+                        "predictions": predictions.tolist()}
+            self._dispatch(action)
+        elif url.path == '/observe':
+            def action():
+                request = self._body('date', 'feuw', 'uwfe')
+                exog = {key: value for key, value in request.items() if key not in ('date', 'feuw', 'uwfe')}
+                return {"last_date": service.observe(request['date'], request['feuw'], request['uwfe'], **exog)}
+            self._dispatch(action)
+        else:
+            self._send(404, {"error": f"Unknown path {url.path}"})
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+
+class ForecastServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # High-QPS clients open many connections at once; the default backlog of 5 resets them
+    request_queue_size = 1024
+
+
+def make_server(service, host='127.0.0.1', port=DEFAULT_PORT):
+    """Threaded HTTP server bound to the service (port 0 picks a free port)."""
+    server = ForecastServer((host, port), ForecastHandler)
+    server.service = service
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description='ATLAS forecast service with micro-batched scoring')
+    parser.add_argument('--registry', type=str, default='atlas_registry',
+                       help='Model registry directory')
+    parser.add_argument('--journal', type=str,
+                       help='Stream journal (atlas_stream.py) for /forecast and /observe')
+    parser.add_argument('--host', type=str, default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--max-batch', type=int, default=512,
+                       help='Maximum rows scored per model call')
+    parser.add_argument('--max-wait-ms', type=float, default=5.0,
+                       help='Latency budget: longest a request waits for its batch to fill')
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s', stream=sys.stdout)
+
+    service = ForecastService(args.registry, args.journal, args.max_batch, args.max_wait_ms)
+    server = make_server(service, args.host, args.port)
+    logger.info(f"Listening on http://{args.host}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+# atlas_store.py
+# Columnar on-disk storage for ATLAS inputs and outputs.
+# Predictions for every horizon/model/date live in a single Arrow IPC file that
+# can be memory-mapped, so the results JSON only needs to reference it.
+# Daily input frames (e.g. the exogenous panel, cached lane CSVs) are stored as a
+# raw float64 npy matrix plus a date index, so engines get a zero-copy
+# memory-mapped view.
+
+import hashlib
+import json
+import os
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.ipc as ipc
+
+DEFAULT_CACHE_DIR = 'atlas_cache'
+
+PREDICTION_SCHEMA = pa.schema([
+    ('horizon', pa.int16()),
+    ('model', pa.dictionary(pa.int8(), pa.string())),
+    ('date', pa.timestamp('ns')),
+    ('actual', pa.float64()),
+    ('predicted', pa.float64()),
+    ('confidence_lower', pa.float64()),
+    ('confidence_upper', pa.float64()),
+])
+
+
+def build_prediction_table(horizon, model, dates, actual, predicted, lower=None, upper=None):
+    """Builds one horizon/model block of the prediction store from numpy arrays."""
+    n = len(predicted)
+    missing = pa.nulls(n, pa.float64())
+    columns = [
+        pa.array(np.full(n, horizon, dtype=np.int16)),
+        pa.DictionaryArray.from_arrays(pa.array(np.zeros(n, dtype=np.int8)), pa.array([model])),
+        pa.array(pd.DatetimeIndex(dates).as_unit('ns').values, type=pa.timestamp('ns')),
+        pa.array(np.asarray(actual, dtype=np.float64)),
+        pa.array(np.asarray(predicted, dtype=np.float64)),
+        pa.array(np.asarray(lower, dtype=np.float64)) if lower is not None else missing,
+        pa.array(np.asarray(upper, dtype=np.float64)) if upper is not None else missing,
+    ]
+    return pa.Table.from_arrays(columns, schema=PREDICTION_SCHEMA)
+
+
+def write_prediction_store(tables, path):
+    """Writes prediction blocks to an uncompressed Arrow IPC file and returns a JSON-safe reference."""
+    table = pa.concat_tables(tables).unify_dictionaries() if tables else PREDICTION_SCHEMA.empty_table()
+    with pa.OSFile(path, 'wb') as sink:
+        with ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+
+    return {
+        "path": os.path.basename(path),
+        "format": "arrow_ipc",
+        "key": ["horizon", "model", "date"],
+        "columns": table.schema.names,
+        "rows": table.num_rows,
+    }
+
+
+def read_prediction_store(path, columns=None, horizon=None, model=None):
+    """Memory-maps the prediction store and returns the requested slice as a DataFrame.
+
+    Only the listed columns are materialized; filtering happens on the mapped
+    Arrow buffers before conversion.
+    """
+    with pa.memory_map(path, 'r') as source:
+        table = ipc.open_file(source).read_all()
+
+    if horizon is not None:
+        table = table.filter(pc.equal(table['horizon'], horizon))
+    if model is not None:
+        table = table.filter(pc.equal(table['model'].cast(pa.string()), model))
+    if columns is not None:
+        table = table.select(columns)
+    return table.to_pandas()
+
+
+def write_frame(df, directory, meta=None):
+    """Stores a single-dtype daily frame as values.npy + index.npy + meta.json."""
+    os.makedirs(directory, exist_ok=True)
+    meta_path = os.path.join(directory, 'meta.json')
+    # Retire the old meta first so no reader pairs it with the new arrays
+    if os.path.exists(meta_path):
+        os.remove(meta_path)
+
+    # Arrays go to temporary files and are renamed into place: processes that still
+    # map the old values.npy keep reading the old file instead of seeing it truncated
+    arrays = {'values.npy': np.ascontiguousarray(df.to_numpy(dtype=np.float64)),
+              'index.npy': df.index.values.astype('datetime64[ns]')}
+    for name, array in arrays.items():
+        tmp_path = os.path.join(directory, f"{name}.tmp")
+        with open(tmp_path, 'wb') as f:
+            np.save(f, array)
+        os.replace(tmp_path, os.path.join(directory, name))
+
+    # meta.json is written last so readers never see a half-written frame as complete
+    meta = dict(meta or {}, columns=list(df.columns), rows=len(df))
+    tmp_path = f"{meta_path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(meta, f, indent=4)
+    os.replace(tmp_path, meta_path)
+
+
+def read_frame_meta(directory):
+    path = os.path.join(directory, 'meta.json')
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def read_frame(directory):
+    """Memory-maps a frame written by write_frame; the DataFrame is a view, not a copy."""
+    meta = read_frame_meta(directory)
+    values = np.load(os.path.join(directory, 'values.npy'), mmap_mode='r')
+    index = pd.DatetimeIndex(np.load(os.path.join(directory, 'index.npy')))
+    return pd.DataFrame(values, index=index, columns=meta['columns'], copy=False)
+
+
+def load_lane_csv(path, value_column, name, cache_dir=DEFAULT_CACHE_DIR):
+    """Reads a raw lane CSV (Date + one price column) through a typed binary cache.
+
+    The CSV is parsed once into a date-sorted frame; later calls memory-map the
+    cached copy until the source file's size or modification time changes.
+    Each (absolute path, value_column, name) gets its own cache entry, so files
+    sharing a basename or read with other columns never see each other's frame.
+    """
+    stat = os.stat(path)
+    request = {"source": os.path.abspath(path), "value_column": value_column, "name": name}
+    source = dict(request, mtime_ns=stat.st_mtime_ns, size=stat.st_size)
+    digest = hashlib.sha256(json.dumps(request, sort_keys=True).encode()).hexdigest()[:16]
+    directory = os.path.join(cache_dir, f"{os.path.splitext(os.path.basename(path))[0]}_{digest}")
+
+    meta = read_frame_meta(directory)
+    if meta is None or {key: meta.get(key) for key in source} != source:
+        df = pd.read_csv(path, index_col='Date', parse_dates=True)[[value_column]].sort_index()
+        write_frame(df.rename(columns={value_column: name}), directory, meta=source)
+    return read_frame(directory).rename_axis('Date')
@@ -0,0 +1,202 @@
+# atlas_stream.py
+# Streaming ingestion of daily freight prints for ATLAS.
+# FreightStream keeps a ring buffer deep enough for every configured lag, so each
+# new observation yields its feature row (same columns and values as
+# AtlasEngine.create_features) in O(features). The daily series is persisted in an
+# append-only binary journal instead of re-reading and resampling the lane CSVs.
+
+import argparse
+import json
+import logging
+import os
+import struct
+import sys
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+JOURNAL_MAGIC = b'ATLSTRM1'
+BASE_COLUMNS = ['feuw_price', 'uwfe_price']
+
+
+def _record_dtype(columns):
+    return np.dtype([('date', '<i8')] + [(col, '<f8') for col in columns])
+
+
+def _write_header(path, columns):
+    header = json.dumps({"columns": list(columns)}).encode()
+    with open(path, 'wb') as f:
+        f.write(JOURNAL_MAGIC + struct.pack('<I', len(header)) + header)
+
+
+def _read_header(path):
+    """Returns (columns, offset of the first record)."""
+    with open(path, 'rb') as f:
+        if f.read(len(JOURNAL_MAGIC)) != JOURNAL_MAGIC:
+            raise ValueError(f"{path} is not an ATLAS stream journal")
+        (length,) = struct.unpack('<I', f.read(4))
+        header = json.loads(f.read(length))
+    return header["columns"], len(JOURNAL_MAGIC) + 4 + length
+
+
+class FreightStream:
+    """Incremental feature state over the daily freight series.
+
+    lags maps column -> list of lags, as stored in the registry or results JSON.
+    Days skipped between two observations are forward-filled, matching the
+    resample('D').ffill() the engines apply to the lane CSVs.
+    """
+
+    def __init__(self, journal_path, lags, columns=None):
+        self.journal_path = journal_path
+        self.lags = {col: list(col_lags) for col, col_lags in lags.items()}
+
+        if os.path.exists(journal_path):
+            self.columns, self._offset = _read_header(journal_path)
+        else:
+            self.columns = list(columns or BASE_COLUMNS)
+            _write_header(journal_path, self.columns)
+            self._offset = _read_header(journal_path)[1]
+        if self.columns[:2] != BASE_COLUMNS:
+            raise ValueError(f"Journal columns must start with {BASE_COLUMNS}")
+        self.record_dtype = _record_dtype(self.columns)
+
+        # Buffered values: the stored series plus the derived imbalance ratio
+        self.buffer_columns = self.columns + ['trade_imbalance_ratio']
+        lag_specs = [(f'{col}_lag_{lag}', self.buffer_columns.index(col), lag)
+                     for col, col_lags in self.lags.items() if col in self.buffer_columns
+                     for lag in col_lags]
+        self._lag_names = [name for name, _, _ in lag_specs]
+        self._lag_cols = np.array([j for _, j, _ in lag_specs], dtype=np.intp)
+        self._lag_steps = np.array([lag for _, _, lag in lag_specs], dtype=np.intp)
+        self.feature_names = self.buffer_columns + self._lag_names
+
+        self.window = int(self._lag_steps.max()) + 1 if len(self._lag_steps) else 1
+        self._buffer = np.full((self.window, len(self.buffer_columns)), np.nan)
+        self._pos = -1
+        self._count = 0
+        self.last_date = None
+        self._replay()
+
+    @classmethod
+    def from_frame(cls, df, journal_path, lags):
+        """Starts a journal from a daily history frame (e.g. AtlasEngine.load_data output)."""
+        if os.path.exists(journal_path):
+            os.remove(journal_path)
+        df = df.asfreq('D').ffill()
+        stream = cls(journal_path, lags, columns=list(df.columns))
+        stream._write(df.index, df.to_numpy(dtype=np.float64))
+        stream._replay()
+        return stream
+
+    def _records(self):
+        n_bytes = os.path.getsize(self.journal_path) - self._offset
+        n_records = n_bytes // self.record_dtype.itemsize
+        if n_records == 0:
+            return np.empty(0, dtype=self.record_dtype)
+        return np.memmap(self.journal_path, dtype=self.record_dtype, mode='r',
+                         offset=self._offset, shape=(n_records,))
+
+    def _replay(self):
+        """Restores the ring buffer from the tail of the journal."""
+        records = self._records()
+        self._count = 0
+        self._pos = -1
+        for record in records[-self.window:]:
+            self._push(np.array([record[col] for col in self.columns]))
+        self._count = len(records)
+        self.last_date = pd.Timestamp(int(records[-1]['date']), unit='D') if len(records) else None
+
+    def _push(self, values):
+        self._pos = (self._pos + 1) % self.window
+        self._buffer[self._pos, :-1] = values
+        self._buffer[self._pos, -1] = values[0] / (values[1] + 1e-6)
+        self._count += 1
+
+    def _write(self, dates, values):
+        records = np.empty(len(dates), dtype=self.record_dtype)
+        records['date'] = pd.DatetimeIndex(dates).values.astype('datetime64[D]').astype(np.int64)
+        for j, col in enumerate(self.columns):
+            records[col] = values[:, j]
+        with open(self.journal_path, 'ab') as f:
+            f.write(records.tobytes())
+
+    def append_observation(self, date, feuw, uwfe, **exog):
+        """Ingests one daily print and returns that day's feature row.
+
+        Exogenous values not given are carried forward from the previous day.
+        """
+        date = pd.Timestamp(date).normalize()
+        unknown = set(exog) - set(self.columns[2:])
+        if unknown:
+            raise ValueError(f"Unknown exogenous columns: {', '.join(sorted(unknown))}")
+        if self.last_date is not None and date <= self.last_date:
+            raise ValueError(f"Observation for {date.date()} is not after {self.last_date.date()}")
+
+        previous = self._buffer[self._pos, :-1].copy() if self._count else np.full(len(self.columns), np.nan)
+        values = np.array([feuw, uwfe] + [exog.get(col, previous[j + 2]) for j, col in enumerate(self.columns[2:])],
+                          dtype=np.float64)
+
+        # Fill skipped days with the last known values before the new print
+        dates = [date]
+        rows = [values]
+        if self.last_date is not None:
+            gap = pd.date_range(self.last_date + pd.Timedelta(days=1), date - pd.Timedelta(days=1), freq='D')
+            dates = list(gap) + dates
+            rows = [previous] * len(gap) + rows
+
+        self._write(dates, np.vstack(rows))
+        for row in rows:
+            self._push(row)
+        self.last_date = date
+        return self.current_row()
+
+    def current_row(self):
+        """Feature row for the latest day, in AtlasEngine.create_features column order."""
+        if self.last_date is None:
+            raise ValueError(f"{self.journal_path} holds no observations yet")
+        lagged = self._buffer[(self._pos - self._lag_steps) % self.window, self._lag_cols]
+        lagged[self._lag_steps >= self._count] = np.nan
+        return pd.Series(np.concatenate([self._buffer[self._pos], lagged]),
+                         index=self.feature_names, name=self.last_date)
+
+    def to_frame(self):
+        """The full daily series stored in the journal."""
+        records = self._records()
+        index = pd.DatetimeIndex(records['date'].astype('datetime64[D]').astype('datetime64[ns]'), name='Date')
+        return pd.DataFrame({col: records[col] for col in self.columns}, index=index)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Append daily freight prints to the ATLAS stream journal')
+    parser.add_argument('--journal', type=str, default='atlas_stream.bin',
+                       help='Journal file')
+    parser.add_argument('--init', action='store_true',
+                       help='(Re)build the journal from the lane CSVs and exogenous panel')
+    parser.add_argument('--append', nargs=3, metavar=('DATE', 'FEUW', 'UWFE'),
+                       help='Append one observation and print its feature row')
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s', stream=sys.stdout)
+
+    from kalopathor_2_engine import AtlasEngine, DEFAULT_LAGS
+    engine = AtlasEngine(explanation_cache_dir=None)
+
+    if args.init:
+        df = engine.load_data()
+        lags = {col: DEFAULT_LAGS for col in engine.lag_columns(df)}
+        stream = FreightStream.from_frame(df, args.journal, lags)
+        logger.info(f"Journal {args.journal} holds {len(df)} days up to {stream.last_date.date()}")
+    else:
+        columns, _ = _read_header(args.journal)
+        stream = FreightStream(args.journal, {col: DEFAULT_LAGS for col in engine.lag_columns(pd.DataFrame(columns=columns))})
+
+    if args.append:
+        date, feuw, uwfe = args.append
+        row = stream.append_observation(date, float(feuw), float(uwfe))
+        logger.info(f"Features for {row.name.date()}:\n{row.to_string()}")
+
+if __name__ == "__main__":
+    main()
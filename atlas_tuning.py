@@ -0,0 +1,176 @@
+# atlas_tuning.py
+# Budgeted hyperparameter search for the gradient-boosting families in ATLAS.
+# Successive halving over sampled configurations: every rung trains the survivors
+# for eta times more boosting rounds, with each library's native early stopping on
+# the tail of each training fold; the fold's validation slice only scores the trial.
+# Trials run in parallel threads that share one thread budget, and the search
+# stops once its CPU-time budget is spent.
+
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import lightgbm as lgb
+import xgboost as xgb
+from catboost import CatBoostRegressor
+from sklearn.metrics import mean_absolute_error
+
+TUNABLE_FAMILIES = ['LightGBM', 'XGBoost', 'CatBoost']
+
+# Share of each training fold (its most recent rows) held out for early stopping
+EARLY_STOPPING_FRACTION = 0.2
+
+SEARCH_SPACES = {
+    'LightGBM': {
+        'learning_rate': [0.01, 0.03, 0.1, 0.3],
+        'num_leaves': [7, 15, 31, 63],
+        'min_child_samples': [10, 20, 40],
+        'subsample': [0.7, 1.0],
+        'subsample_freq': [1],
+        'colsample_bytree': [0.7, 1.0]
+    },
+    'XGBoost': {
+        'learning_rate': [0.01, 0.03, 0.1, 0.3],
+        'max_depth': [3, 5, 7],
+        'min_child_weight': [1, 5, 10],
+        'subsample': [0.7, 1.0],
+        'colsample_bytree': [0.7, 1.0]
+    },
+    'CatBoost': {
+        'learning_rate': [0.01, 0.03, 0.1, 0.3],
+        'depth': [4, 6, 8],
+        'l2_leaf_reg': [1, 3, 10]
+    }
+}
+
+
+def make_estimator(family, params=None, n_jobs=-1):
+    """Estimator with the engine's fixed settings plus the given hyperparameters."""
+    params = dict(params or {})
+    if family == 'LightGBM':
+        return lgb.LGBMRegressor(random_state=42, verbosity=-1, n_jobs=n_jobs, force_col_wise=True, **params)
+    if family == 'XGBoost':
+        return xgb.XGBRegressor(random_state=42, n_jobs=n_jobs, **params)
+    if family == 'CatBoost':
+        return CatBoostRegressor(random_state=42, verbose=0, allow_writing_files=False, thread_count=n_jobs, **params)
+    raise ValueError(f"Unknown model family: {family}")
+
+
+def sample_configs(family, n_configs, random_state=42):
+    """Distinct random draws from the family's grid (the whole grid if it is smaller)."""
+    space = SEARCH_SPACES[family]
+    keys = sorted(space)
+    grid_size = int(np.prod([len(space[k]) for k in keys]))
+    rng = np.random.default_rng(random_state)
+    picks = rng.choice(grid_size, size=min(n_configs, grid_size), replace=False)
+
+    configs = []
+    for flat in picks:
+        config = {}
+        for key in keys:
+            flat, pos = divmod(int(flat), len(space[key]))
+            config[key] = space[key][pos]
+        configs.append(config)
+    return configs
+
+
+def _fit_with_early_stopping(family, config, n_rounds, early_stopping_rounds, n_jobs,
+                             X_train, y_train, X_stop, y_stop, X_val):
+    """Fits up to n_rounds, stopping on (X_stop, y_stop); returns (validation predictions, best iteration)."""
+    if family == 'LightGBM':
+        model = make_estimator(family, dict(config, n_estimators=n_rounds), n_jobs)
+        model.fit(X_train, y_train, eval_set=[(X_stop, y_stop)],
+                  callbacks=[lgb.early_stopping(early_stopping_rounds, verbose=False)])
+        best = model.best_iteration_ or n_rounds
+        return model.predict(X_val, num_iteration=best), best
+    if family == 'XGBoost':
+        model = make_estimator(family, dict(config, n_estimators=n_rounds,
+                                            early_stopping_rounds=early_stopping_rounds), n_jobs)
+        model.fit(X_train, y_train, eval_set=[(X_stop, y_stop)], verbose=False)
+        return model.predict(X_val), model.best_iteration + 1
+    model = make_estimator(family, dict(config, iterations=n_rounds), n_jobs)
+    model.fit(X_train, y_train, eval_set=(X_stop, y_stop), early_stopping_rounds=early_stopping_rounds)
+    return model.predict(X_val), model.get_best_iteration() + 1
+
+
+def _evaluate(family, config, X, y, folds, n_rounds, early_stopping_rounds, n_jobs):
+    """Mean validation MAE and mean best iteration over the folds.
+
+    Early stopping watches the most recent rows of each training fold, so the
+    validation slice that ranks the configurations never picks their round count.
+    """
+    maes, best_iterations = [], []
+    for train_idx, val_idx in folds:
+        n_stop = min(max(1, int(len(train_idx) * EARLY_STOPPING_FRACTION)), len(train_idx) - 1)
+        fit_idx, stop_idx = train_idx[:-n_stop], train_idx[-n_stop:]
+        preds, best = _fit_with_early_stopping(
+            family, config, n_rounds, early_stopping_rounds, n_jobs,
+            X[fit_idx], y[fit_idx], X[stop_idx], y[stop_idx], X[val_idx]
+        )
+        maes.append(mean_absolute_error(y[val_idx], preds))
+        best_iterations.append(best)
+    return float(np.mean(maes)), int(np.mean(best_iterations))
+
+
+def successive_halving(family, X, y, folds, n_configs=27, min_rounds=50, max_rounds=1350, eta=3,
+                       early_stopping_rounds=50, n_jobs=None, n_parallel=None,
+                       cpu_budget_minutes=5.0, random_state=42):
+    """Runs successive halving for one model family and returns the best configuration.
+
+    folds is a list of (train_idx, val_idx) pairs. n_jobs threads are shared by
+    n_parallel concurrent trials. Once cpu_budget_minutes of process CPU time are
+    used no new rung is started (and remaining trials in the current rung are
+    skipped), so the search costs a bounded amount of compute.
+    """
+    X = np.ascontiguousarray(X, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    n_jobs = n_jobs or os.cpu_count() or 1
+    n_parallel = max(1, min(n_parallel or n_jobs, n_jobs))
+    threads_per_trial = max(1, n_jobs // n_parallel)
+
+    cpu_start = time.process_time()
+    cpu_budget = cpu_budget_minutes * 60
+
+    def run_trial(config):
+        if time.process_time() - cpu_start > cpu_budget:
+            return None
+        return _evaluate(family, config, X, y, folds, n_rounds, early_stopping_rounds, threads_per_trial)
+
+    configs = sample_configs(family, n_configs, random_state)
+    n_rounds = min_rounds
+    history = []
+    best = None
+    with ThreadPoolExecutor(max_workers=n_parallel) as pool:
+        while configs:
+            scored = []
+            for config, outcome in zip(configs, pool.map(run_trial, configs)):
+                if outcome is None:
+                    continue
+                mae, best_iteration = outcome
+                scored.append((mae, best_iteration, config))
+                history.append({"rounds": n_rounds, "mae": mae, "best_iteration": best_iteration, **config})
+            if not scored:
+                break
+
+            scored.sort(key=lambda item: item[0])
+            if best is None or scored[0][0] <= best[0]:
+                best = scored[0]
+
+            over_budget = time.process_time() - cpu_start > cpu_budget
+            if len(scored) == 1 or n_rounds >= max_rounds or over_budget:
+                break
+            configs = [config for _, _, config in scored[:max(1, len(scored) // eta)]]
+            n_rounds = min(n_rounds * eta, max_rounds)
+
+    if best is None:
+        return None
+    mae, best_iteration, config = best
+    rounds_key = 'iterations' if family == 'CatBoost' else 'n_estimators'
+    return {
+        "params": dict(config, **{rounds_key: max(1, best_iteration)}),
+        "cv_mae": mae,
+        "trials": len(history),
+        "cpu_seconds": float(time.process_time() - cpu_start),
+        "history": history
+    }
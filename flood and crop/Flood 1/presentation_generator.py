@@ -15,8 +15,13 @@ from PIL import Image, ImageDraw, ImageFont
 import pandas as pd
 from pathlib import Path
 import warnings
+import sys
+sys.path.append('..')
+from common.tile_store import TileStore
 warnings.filterwarnings('ignore')
 
+TILE_STORE_DIR = 'data/rapid_processed/tiles'
+
 # Try to import additional libraries
 try:
     from matplotlib.patches import Rectangle
@@ -199,16 +204,14 @@ class PresentationGenerator:
     
     def visualize_preprocessing(self):
         """Visualize preprocessing results"""
-        train_data_path = 'data/rapid_processed/train_data.npz'
-        val_data_path = 'data/rapid_processed/val_data.npz'
-        
-        if not os.path.exists(train_data_path):
+        if not TileStore.exists(TILE_STORE_DIR):
             print("⚠️ Preprocessed data not found")
             return
         
-        # Load data
-        train_data = np.load(train_data_path)
-        val_data = np.load(val_data_path)
+        # Open splits lazily; tiles are read only when indexed
+        store = TileStore.open(TILE_STORE_DIR)
+        train_data = store.split('train')
+        val_data = store.split('val')
         
         # Create preprocessing visualization
         fig = plt.figure(figsize=(18, 10))
@@ -419,7 +422,7 @@ class PresentationGenerator:
             model.eval()
             
             # Load validation data
-            val_data = np.load('data/rapid_processed/val_data.npz')
+            val_data = TileStore.open(TILE_STORE_DIR).split('val')
             
             # Run inference on multiple samples
             n_samples = min(6, len(val_data['change']))
@@ -9,117 +9,215 @@ import os
 from scipy import ndimage
 import cv2
 from PIL import Image
-import rasterio
 import warnings
+import argparse
+import shutil
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+sys.path.append('..')
+from common.raster_io import (RasterSource, ScaledSource, BlockCacheSource, ValidSource, open_raster, aligned_shape,
+                              tile_count, window_views, iter_aligned_windows, iter_aligned_tiles)
+from common.raster_stats import BandStats, scene_stats, merge_stats, save_stats, load_stats
+from common.speckle import LeeFilteredSource, DEFAULT_WINDOW, SPECKLE_FILTERS
+from common.tile_screen import TileScreen, window_sums
+from common.tile_store import TileStore
+from common.utils import clean_filename
 warnings.filterwarnings('ignore')
 
+# SAR layers normalized with their statistics
+SCENE_LAYERS = ('s1_pre', 's1_flood')
+# Acquisition exports VV as unitScale(-25, 5): dB = value * 30 - 25
+S1_DB_TRANSFORM = (30.0, -25.0)
+
 class RapidFloodPreprocessor:
-    def __init__(self):
+    def __init__(self, compress: bool = False, workers: int = 1, normalization: str = 'scene',
+                 stats_path: str = None, speckle_filter: str = 'none', speckle_window: int = DEFAULT_WINDOW,
+                 screen: bool = True):
         self.data_dir = "data/optimized"
         self.output_dir = "data/rapid_processed"
+        self.store_dir = f"{self.output_dir}/tiles"
+        # Per-scene and per-collection statistics of every layer, written by run()
+        self.stats_file = f"{self.output_dir}/normalization_stats.json"
+        # 'scene' scales each scene by its own robust range, 'collection' by the range of all scenes
+        self.normalization = normalization
+        # Reuse the collection statistics of an earlier run (e.g. the training set's, at inference)
+        self.stats_path = stats_path
+        # Speckle filter applied to both SAR scenes before statistics and tiling
+        self.speckle_filter = speckle_filter
+        self.speckle_window = speckle_window
+        # Re-encode the tile store as LZ4 chunks (smaller on disk, decompressed per read)
+        self.compress = compress
+        # Events are tiled in parallel, each into its own shard of the store
+        self.workers = workers
+        # Drops nodata tiles and down-weights featureless ones (None keeps every tile at weight 1)
+        self.screen = TileScreen() if screen else None
         os.makedirs(self.output_dir, exist_ok=True)
         
         self.tile_size = 128
         self.stride = 64
         
     def load_geotiff(self, filepath: str) -> np.ndarray:
-        """Load GeoTIFF file"""
-        try:
-            # Try rasterio first
-            with rasterio.open(filepath) as src:
-                data = src.read(1)  # Read first band
-                return data.astype(np.float32)
-        except:
-            # Fallback to PIL
-            try:
-                img = Image.open(filepath)
-                return np.array(img).astype(np.float32)
-            except:
-                # Last resort - numpy
-                return np.load(filepath, allow_pickle=True).astype(np.float32)
-    
+        """Load band 1 of a raster in full (small files only; tiling streams blocks instead)"""
+        with open_raster(filepath) as src:
+            return src.read(0, 0, *src.shape)
+
+    def normalized_source(self, source: RasterSource, stats: BandStats) -> RasterSource:
+        """NaN to 0, then scaling of the robust (2nd-98th percentile) range to 0-1 if the layer exceeds 1
+
+        Outliers beyond the range (e.g. speckle) are clipped instead of compressing every other pixel.
+        """
+        if stats.max > 1:
+            lo, hi = stats.robust_range()
+            return ScaledSource(source, lo, 1.0 / (hi - lo + 1e-8), clip=(0.0, 1.0))
+        return ScaledSource(source)
+
+    def open_flood_pair(self, pre_flood_path: str, flood_path: str, mask_path: str, sar_sources=None):
+        """Open a before/during flood pair with real mask; returns the sources and their common extent
+
+        sar_sources are already opened pre/flood rasters to build on (default: opened from the paths).
+        """
+        sources = list(sar_sources or [open_raster(pre_flood_path), open_raster(flood_path)]) + [open_raster(mask_path)]
+        if self.speckle_filter == 'lee':
+            # Filtered block by block with a halo, so tiles match filtering the whole scene
+            sources[:2] = [LeeFilteredSource(source, self.speckle_window, db_transform=S1_DB_TRANSFORM)
+                           for source in sources[:2]]
+        # The three rasters share the top-left origin; tile their common extent
+        return sources, aligned_shape(sources)
+
     def process_flood_pair(self, pre_flood_path: str, flood_path: str, mask_path: str):
-        """Process before/during flood pair with real mask"""
-        
-        # Load data
-        pre_flood = self.load_geotiff(pre_flood_path)
-        flood = self.load_geotiff(flood_path)
-        mask = self.load_geotiff(mask_path)
-        
-        # Ensure 2D arrays
-        if len(pre_flood.shape) > 2:
-            pre_flood = pre_flood[..., 0] if pre_flood.shape[-1] < pre_flood.shape[0] else pre_flood[0]
-        if len(flood.shape) > 2:
-            flood = flood[..., 0] if flood.shape[-1] < flood.shape[0] else flood[0]
-        if len(mask.shape) > 2:
-            mask = mask[..., 0] if mask.shape[-1] < mask.shape[0] else mask[0]
-        
-        # Ensure consistent shapes
-        h = min(pre_flood.shape[0], flood.shape[0], mask.shape[0])
-        w = min(pre_flood.shape[1], flood.shape[1], mask.shape[1])
-        
-        pre_flood = pre_flood[:h, :w]
-        flood = flood[:h, :w]
-        mask = mask[:h, :w]
-        
-        # Normalize
-        pre_flood = np.nan_to_num(pre_flood, 0)
-        flood = np.nan_to_num(flood, 0)
-        
-        # Normalize to 0-1 range
-        if pre_flood.max() > 1:
-            pre_flood = (pre_flood - pre_flood.min()) / (pre_flood.max() - pre_flood.min() + 1e-8)
-        if flood.max() > 1:
-            flood = (flood - flood.min()) / (flood.max() - flood.min() + 1e-8)
-        
-        # Binary mask
-        mask = (mask > 0).astype(np.float32)
-        
-        # Calculate change
-        change = flood - pre_flood
-        
-        # Create training tiles
+        """Process before/during flood pair with real mask
+
+        Returns every tile (unscreened) as a dict of pre/flood/change/mask arrays in
+        row-major order, normalized by the pair's own statistics. All tiles are held
+        in memory, so this suits single small scenes; run() streams pairs into the
+        tile store with write_flood_pair instead.
+        """
+        sources, shape = self.open_flood_pair(pre_flood_path, flood_path, mask_path)
         tiles = []
+        try:
+            stats = {layer: scene_stats(source, shape) for layer, source in zip(SCENE_LAYERS, sources)}
+            pre_src = self.normalized_source(sources[0], stats['s1_pre'])
+            flood_src = self.normalized_source(sources[1], stats['s1_flood'])
+            for row, col, (pre_flood, flood, mask) in iter_aligned_tiles(
+                    [pre_src, flood_src, sources[2]], self.tile_size, self.stride, shape=shape):
+                tiles.append(((row, col), {
+                    'pre': pre_flood.copy(),
+                    'flood': flood.copy(),
+                    'change': flood - pre_flood,
+                    'mask': (mask > 0).astype(np.float32)
+                }))
+        finally:
+            for source in sources:
+                source.close()
+        return [tile for _, tile in sorted(tiles, key=lambda item: item[0])]
+
+    def write_flood_pair(self, store: TileStore, pre_flood_path: str, flood_path: str, mask_path: str,
+                         stats=None) -> int:
+        """Tile a flood pair straight into the store, one aligned block window at a time
+
+        Tiles are strided views of the block and are copied once, into the store.
+        Scenes smaller than a tile are zero padded to a single tile. stats maps
+        s1_pre/s1_flood to the statistics to normalize with (default: the pair's own).
+        Screened tiles (mostly nodata or padding) are not written; the sampling
+        weight of every kept tile goes to the 'weights' field.
+        """
+        # Nodata is judged on the raw scenes (NaN or the 0 fill of masked pixels), from the same
+        # blocks the normalized (and filtered) chain reads, so each raster is read once
+        raw = [BlockCacheSource(open_raster(path)) for path in (pre_flood_path, flood_path)]
+        sources, shape = self.open_flood_pair(pre_flood_path, flood_path, mask_path, sar_sources=raw)
+        valid_src = ValidSource(raw)
+        written = 0
+        try:
+            if stats is None:
+                stats = {layer: scene_stats(source, shape) for layer, source in zip(SCENE_LAYERS, sources)}
+            pre_src = self.normalized_source(sources[0], stats['s1_pre'])
+            flood_src = self.normalized_source(sources[1], stats['s1_flood'])
+
+            for _, _, (pre_flood, flood, mask, valid) in iter_aligned_windows(
+                    [pre_src, flood_src, sources[2], valid_src], self.tile_size, self.stride, shape=shape):
+                change = flood - pre_flood
+                water = (mask > 0).astype(np.float32)
+                fields = {
+                    'pre': window_views(pre_flood, self.tile_size, self.stride),
+                    'flood': window_views(flood, self.tile_size, self.stride),
+                    'change': window_views(change, self.tile_size, self.stride),
+                    'masks': window_views(water, self.tile_size, self.stride)
+                }
+                tile_rows, tile_cols = fields['pre'].shape[:2]
+                if self.screen is None:
+                    weights = np.ones((tile_rows, tile_cols), dtype=np.float32)
+                else:
+                    # Featureless tiles stay (down-weighted) for training diversity; tiles with water never drop
+                    tile_stats = self.screen.measure(flood, valid, change, self.tile_size, self.stride)
+                    weights = self.screen.weights(tile_stats, window_sums(water, self.tile_size, self.stride) > 0)
+                fields['weights'] = weights
+                for i in range(tile_rows):
+                    keep = weights[i] > 0
+                    n = int(keep.sum())
+                    if not n:
+                        continue
+                    slot = store.reserve(n)
+                    for name, views in fields.items():
+                        target = store.arrays[name][slot:slot + n]
+                        (target[:, 0] if target.ndim == 4 else target)[...] = views[i][keep]
+                    written += n
+        finally:
+            # valid_src shares the raw SAR sources, which the chains close
+            for source in sources:
+                source.close()
+        return written
+
+    def survey_pair(self, data_files):
+        """Tile count and per-layer statistics of a flood pair in one streaming pass ((0, None) if unreadable)"""
+        try:
+            sources, shape = self.open_flood_pair(data_files['s1_pre'], data_files['s1_flood'],
+                                                  data_files['flood_mask'])
+        except Exception:
+            return 0, None
+        try:
+            stats = {layer: scene_stats(source, shape) for layer, source in zip(SCENE_LAYERS, sources)}
+        finally:
+            for source in sources:
+                source.close()
+        return tile_count(shape, self.tile_size, self.stride), stats
+
+    def shard_manifest_path(self, index: int, event_name: str) -> str:
+        return f"{self.store_dir}/shards/{index:04d}_{clean_filename(event_name)}.json"
+
+    def write_event_shard(self, index: int, event_name: str, data_files, start: int, stop: int, stats=None):
+        """Tile one event into store slots [start, stop) and record them in a shard manifest
+
+        Runs in a worker process; the shard manifest is merged by run().
+        """
+        store = TileStore.open(self.store_dir, mode='r+')
+        store.seek(start, stop)
+        shard = {'event': event_name, 'offset': start, 'count': 0}
+        try:
+            shard['count'] = self.write_flood_pair(
+                store,
+                data_files['s1_pre'],
+                data_files['s1_flood'],
+                data_files['flood_mask'],
+                stats
+            )
+            store.flush(write_manifest=False)
+        except Exception as e:
+            shard['error'] = str(e)
         
-        # Ensure we can create tiles
-        if h < self.tile_size or w < self.tile_size:
-            # Pad if too small
-            pad_h = max(0, self.tile_size - h)
-            pad_w = max(0, self.tile_size - w)
-            
-            pre_flood = np.pad(pre_flood, ((0, pad_h), (0, pad_w)), mode='constant')
-            flood = np.pad(flood, ((0, pad_h), (0, pad_w)), mode='constant')
-            change = np.pad(change, ((0, pad_h), (0, pad_w)), mode='constant')
-            mask = np.pad(mask, ((0, pad_h), (0, pad_w)), mode='constant')
-            
-            h, w = pre_flood.shape
-        
-        for i in range(0, h - self.tile_size + 1, self.stride):
-            for j in range(0, w - self.tile_size + 1, self.stride):
-                tile_pre = pre_flood[i:i+self.tile_size, j:j+self.tile_size]
-                tile_flood = flood[i:i+self.tile_size, j:j+self.tile_size]
-                tile_change = change[i:i+self.tile_size, j:j+self.tile_size]
-                tile_mask = mask[i:i+self.tile_size, j:j+self.tile_size]
-                
-                # Include all tiles (even without water) for training diversity
-                tiles.append({
-                    'pre': tile_pre,
-                    'flood': tile_flood,
-                    'change': tile_change,
-                    'mask': tile_mask
-                })
-        
-        # If no tiles created, create at least one
-        if len(tiles) == 0:
-            tiles.append({
-                'pre': pre_flood[:self.tile_size, :self.tile_size],
-                'flood': flood[:self.tile_size, :self.tile_size],
-                'change': change[:self.tile_size, :self.tile_size],
-                'mask': mask[:self.tile_size, :self.tile_size]
-            })
-        
-        return tiles
-    
+        shard_path = self.shard_manifest_path(index, event_name)
+        with open(f"{shard_path}.tmp", 'w') as f:
+            json.dump(shard, f)
+        os.replace(f"{shard_path}.tmp", shard_path)
+        return shard
+
+    def report_shard(self, event_name: str, shard):
+        """Print the outcome of one event"""
+        print(f"\n📍 Processing {event_name}")
+        if 'error' in shard:
+            print(f"   ⚠️ Error processing {event_name}: {shard['error']}")
+        else:
+            print(f"   ✓ Generated {shard['count']} tiles")
+
     def run(self):
         """Execute rapid preprocessing"""
         print("="*60)
@@ -135,73 +233,114 @@ class RapidFloodPreprocessor:
         with open(catalog_path, 'r') as f:
             catalog = json.load(f)
         
-        all_tiles = []
+        pairs = {event_name: event_data['data'] for event_name, event_data in catalog['events'].items()
+                 if all(key in event_data['data'] for key in ('s1_pre', 's1_flood', 'flood_mask'))}
         
-        for event_name, event_data in catalog['events'].items():
-            print(f"\n📍 Processing {event_name}")
-            
-            data_files = event_data['data']
-            
-            if 's1_pre' in data_files and 's1_flood' in data_files and 'flood_mask' in data_files:
-                try:
-                    tiles = self.process_flood_pair(
-                        data_files['s1_pre'],
-                        data_files['s1_flood'],
-                        data_files['flood_mask']
-                    )
-                    
-                    all_tiles.extend(tiles)
-                    print(f"   ✓ Generated {len(tiles)} tiles")
-                except Exception as e:
-                    print(f"   ⚠️ Error processing {event_name}: {str(e)}")
-        
-        if len(all_tiles) == 0:
+        # One streaming pass per scene for tile counts and normalization statistics
+        if self.workers > 1:
+            with ProcessPoolExecutor(max_workers=self.workers) as pool:
+                surveys = list(pool.map(self.survey_pair, pairs.values()))
+        else:
+            surveys = [self.survey_pair(data_files) for data_files in pairs.values()]
+        scenes = {event_name: stats for event_name, (_, stats) in zip(pairs, surveys) if stats is not None}
+        if self.stats_path:
+            _, collections = load_stats(self.stats_path)
+        else:
+            collections = {layer: merge_stats(stats[layer] for stats in scenes.values()) for layer in SCENE_LAYERS}
+        save_stats(self.stats_file, scenes, collections)
+        
+        # Preallocate the tile store for every pair and reserve each event's shard of it
+        # (an upper bound: screened tiles leave gaps that merge_shards closes)
+        tile_shape = (self.tile_size, self.tile_size)
+        capacities = [capacity for capacity, _ in surveys]
+        offsets = np.concatenate([[0], np.cumsum(capacities, dtype=np.int64)])
+        store = TileStore.create(
+            self.store_dir,
+            {'pre': (1,) + tile_shape, 'flood': (1,) + tile_shape, 'change': (1,) + tile_shape,
+             'masks': tile_shape, 'weights': ()},
+            capacity=max(int(offsets[-1]), 1)
+        )
+        store.flush()
+        os.makedirs(f"{self.store_dir}/shards", exist_ok=True)
+        
+        jobs = [(i, event_name, data_files, int(offsets[i]), int(offsets[i + 1]),
+                 collections if self.normalization == 'collection' else scenes.get(event_name))
+                for i, (event_name, data_files) in enumerate(pairs.items())]
+        if self.workers > 1:
+            with ProcessPoolExecutor(max_workers=self.workers) as pool:
+                futures = {pool.submit(self.write_event_shard, *job): job for job in jobs}
+                for future in as_completed(futures):
+                    try:
+                        shard = future.result()
+                    except Exception as e:
+                        shard = {'error': str(e)}
+                    self.report_shard(futures[future][1], shard)
+        else:
+            for job in jobs:
+                self.report_shard(job[1], self.write_event_shard(*job))
+        
+        # Merge the shard manifests in catalog order, so tile order (and the split) ignores worker timing
+        shards = []
+        for i, event_name, _, start, _, _ in jobs:
+            shard_path = self.shard_manifest_path(i, event_name)
+            if os.path.exists(shard_path):
+                with open(shard_path, 'r') as f:
+                    shards.append(json.load(f))
+                os.remove(shard_path)
+            else:
+                shards.append({'event': event_name, 'offset': start, 'count': 0})
+        store.merge_shards(shards)
+        shutil.rmtree(f"{self.store_dir}/shards")
+        
+        n_tiles = store.count
+        if n_tiles == 0:
+            shutil.rmtree(self.store_dir)
             print("❌ No tiles generated!")
             return
         
-        # Quick train/val split
-        np.random.seed(42)
-        np.random.shuffle(all_tiles)
+        # Quick train/val split as index arrays into the store
+        order = np.random.RandomState(42).permutation(n_tiles)
         
-        split_idx = int(len(all_tiles) * 0.8)
-        train_tiles = all_tiles[:split_idx]
-        val_tiles = all_tiles[split_idx:]
+        split_idx = int(n_tiles * 0.8)
+        train_idx = order[:split_idx]
+        val_idx = order[split_idx:]
         
         # Ensure we have at least one tile in validation
-        if len(val_tiles) == 0 and len(train_tiles) > 1:
-            val_tiles = [train_tiles[-1]]
-            train_tiles = train_tiles[:-1]
-        
-        # Save processed data
-        for split_name, tiles in [('train', train_tiles), ('val', val_tiles)]:
-            if tiles:
-                # Stack all tiles
-                pre_stack = np.stack([t['pre'] for t in tiles])
-                flood_stack = np.stack([t['flood'] for t in tiles])
-                change_stack = np.stack([t['change'] for t in tiles])
-                mask_stack = np.stack([t['mask'] for t in tiles])
-                
-                # Add channel dimension if needed
-                if len(pre_stack.shape) == 3:
-                    pre_stack = np.expand_dims(pre_stack, axis=1)
-                if len(flood_stack.shape) == 3:
-                    flood_stack = np.expand_dims(flood_stack, axis=1)
-                if len(change_stack.shape) == 3:
-                    change_stack = np.expand_dims(change_stack, axis=1)
-                
-                np.savez_compressed(
-                    f"{self.output_dir}/{split_name}_data.npz",
-                    pre=pre_stack,
-                    flood=flood_stack,
-                    change=change_stack,
-                    masks=mask_stack
-                )
-                
-                print(f"✓ Saved {split_name}: {len(tiles)} tiles")
-        
-        print(f"\n✓ Total tiles: {len(all_tiles)}")
+        if len(val_idx) == 0 and len(train_idx) > 1:
+            val_idx = train_idx[-1:]
+            train_idx = train_idx[:-1]
+        
+        store.set_split('train', train_idx)
+        store.set_split('val', val_idx)
+        store.flush()
+        if self.compress:
+            store.compress()
+        
+        for split_name, indices in [('train', train_idx), ('val', val_idx)]:
+            print(f"✓ Saved {split_name}: {len(indices)} tiles")
+        
+        print(f"\n✓ Total tiles: {n_tiles}")
         print(f"✓ Output: {self.output_dir}")
 
 if __name__ == "__main__":
-    preprocessor = RapidFloodPreprocessor()
+    parser = argparse.ArgumentParser(description='Tile flood pairs into the training tile store')
+    parser.add_argument('--lz4', action='store_true', help='Store tiles as LZ4 chunks instead of raw arrays')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Events preprocessed in parallel processes (default 1 = sequential; '
+                             'each worker holds a few full-width blocks per source in memory)')
+    parser.add_argument('--normalization', choices=['scene', 'collection'], default='scene',
+                        help='Scale each scene by its own percentiles or by those of all scenes')
+    parser.add_argument('--stats', type=str, default=None,
+                        help='Normalization stats of an earlier run to reuse (implies collection normalization)')
+    parser.add_argument('--speckle-filter', choices=SPECKLE_FILTERS, default='none',
+                        help='Speckle filter applied to the SAR scenes before tiling')
+    parser.add_argument('--speckle-window', type=int, default=DEFAULT_WINDOW, help='Speckle filter window (pixels)')
+    parser.add_argument('--no-screen', action='store_true',
+                        help='Keep every tile, including nodata and featureless ones, at full weight')
+    args = parser.parse_args()
+    
+    preprocessor = RapidFloodPreprocessor(compress=args.lz4, workers=args.workers,
+                                          normalization='collection' if args.stats else args.normalization,
+                                          stats_path=args.stats, speckle_filter=args.speckle_filter,
+                                          speckle_window=args.speckle_window, screen=not args.no_screen)
     preprocessor.run()
\ No newline at end of file
@@ -34,11 +34,12 @@ def run_complete_demo():
         # Step 2: Preprocessing
         print("\n⚙️ STEP 2: Preprocessing data...")
         from rapid_preprocessing import RapidFloodPreprocessor
+        from common.tile_store import TileStore
         preprocessor = RapidFloodPreprocessor()
         preprocessor.run()
         
         # Check if data was created
-        if not os.path.exists("data/rapid_processed/train_data.npz"):
+        if not TileStore.exists(preprocessor.store_dir):
             print("\n⚠️ No training data created. Using synthetic data for demo...")
             
             # Create synthetic data for demo
@@ -69,11 +70,16 @@ def run_complete_demo():
                 synthetic_data['change'][i, 0] = synthetic_data['flood'][i, 0] - synthetic_data['pre'][i, 0]
             
             # Save synthetic data
-            np.savez_compressed("data/rapid_processed/train_data.npz", **synthetic_data)
+            store = TileStore.create(preprocessor.store_dir,
+                                     {k: v.shape[1:] for k, v in synthetic_data.items()}, n_samples)
+            for k, v in synthetic_data.items():
+                store.arrays[k][:] = v
+            store.reserve(n_samples)
+            store.set_split('train', np.arange(n_samples))
             
             # Create smaller validation set
-            val_data = {k: v[:10] for k, v in synthetic_data.items()}
-            np.savez_compressed("data/rapid_processed/val_data.npz", **val_data)
+            store.set_split('val', np.arange(10))
+            store.flush()
             
             print("✓ Created synthetic demonstration data")
         
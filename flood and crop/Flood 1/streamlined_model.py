@@ -4,11 +4,16 @@ streamlined_model.py - Fixed for single-channel SAR input
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
-from torch.utils.data import DataLoader, Dataset
+from torch.utils.data import DataLoader, Dataset, WeightedRandomSampler
 import numpy as np
 from typing import Dict, Optional
 import time
 import os
+import sys
+sys.path.append('..')
+from common.tile_store import TileStore
+
+TILE_STORE_DIR = 'data/rapid_processed/tiles'
 
 class OptimizedAttention(nn.Module):
     """Fast multi-head attention"""
@@ -248,31 +253,22 @@ class StreamlinedFloodNet(nn.Module):
         return outputs
 
 class OptimizedFloodDataset(Dataset):
-    """Fast dataset loader"""
-    def __init__(self, data_path: str):
-        data = np.load(data_path)
-        
-        # Handle the data with proper shape
-        self.pre = data['pre'].astype(np.float32)
-        self.flood = data['flood'].astype(np.float32)
-        self.change = data['change'].astype(np.float32)
-        self.masks = data['masks'].astype(np.float32)
-        
-        # Ensure correct shape (N, C, H, W)
-        if len(self.pre.shape) == 3:
-            self.pre = np.expand_dims(self.pre, axis=1)
-        if len(self.flood.shape) == 3:
-            self.flood = np.expand_dims(self.flood, axis=1)
-        if len(self.change.shape) == 3:
-            self.change = np.expand_dims(self.change, axis=1)
+    """Lazy dataset: tiles are read from the memory-mapped tile store by index"""
+    def __init__(self, store_dir: str, split: str):
+        self.tiles = TileStore.open(store_dir).split(split)
+        self.pre = self.tiles['pre']
+        self.change = self.tiles['change']
+        self.masks = self.tiles['masks']
+        # Sampling weights from the tile pre-screen (stores written without it have none)
+        self.weights = self.tiles['weights'][:] if 'weights' in self.tiles.keys() else None
             
     def __len__(self):
         return len(self.masks)
     
     def __getitem__(self, idx):
-        change = torch.tensor(self.change[idx], dtype=torch.float32)
-        pre = torch.tensor(self.pre[idx], dtype=torch.float32)
-        mask = torch.tensor(self.masks[idx], dtype=torch.float32)
+        change = torch.from_numpy(self.change[idx])
+        pre = torch.from_numpy(self.pre[idx])
+        mask = torch.from_numpy(self.masks[idx])
         
         return change, pre, mask
 
@@ -285,17 +281,23 @@ def rapid_training():
     device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
     
     # Check if data exists
-    if not os.path.exists('data/rapid_processed/train_data.npz'):
+    if not TileStore.exists(TILE_STORE_DIR):
         print("❌ Training data not found!")
         return None
     
     # Load data
-    train_dataset = OptimizedFloodDataset('data/rapid_processed/train_data.npz')
-    val_dataset = OptimizedFloodDataset('data/rapid_processed/val_data.npz')
+    train_dataset = OptimizedFloodDataset(TILE_STORE_DIR, 'train')
+    val_dataset = OptimizedFloodDataset(TILE_STORE_DIR, 'val')
     
     print(f"📊 Dataset sizes - Train: {len(train_dataset)}, Val: {len(val_dataset)}")
     
-    train_loader = DataLoader(train_dataset, batch_size=4, shuffle=True)
+    if train_dataset.weights is not None:
+        # Featureless tiles (e.g. open ocean) are drawn less often than informative ones
+        sampler = WeightedRandomSampler(torch.from_numpy(train_dataset.weights).double(),
+                                        num_samples=len(train_dataset), replacement=True)
+        train_loader = DataLoader(train_dataset, batch_size=4, sampler=sampler)
+    else:
+        train_loader = DataLoader(train_dataset, batch_size=4, shuffle=True)
     val_loader = DataLoader(val_dataset, batch_size=4, shuffle=False)
     
     # Initialize model with 1 input channel for SAR data
@@ -434,11 +436,11 @@ def demo_inference(model_path: str = 'outputs/optimized_flood_model.pt'):
     print(f"✓ Accuracy: {checkpoint.get('accuracy', 'N/A'):.2f}%")
     
     # Load test data
-    if not os.path.exists('data/rapid_processed/val_data.npz'):
+    if not TileStore.exists(TILE_STORE_DIR):
         print("⚠️ Validation data not found!")
         return None
         
-    test_data = np.load('data/rapid_processed/val_data.npz')
+    test_data = TileStore.open(TILE_STORE_DIR).split('val')
     
     # Run inference on sample
     sample_idx = min(0, len(test_data['change']) - 1)
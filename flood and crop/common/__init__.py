@@ -4,9 +4,29 @@ Common utilities and configuration for the flood detection system
 
 from .config import *
 from .utils import ensure_dir, setup_logging, get_file_size_mb, clean_filename, format_time
+from .download_cache import DownloadCache, request_key
+from .gridding import AoiGrid, GridTile, plan_grid, build_once, tile_jobs, mosaic_npy, mosaic_geotiff, fetch_mosaic
+from .raster_io import (RasterSource, RasterioSource, ArraySource, ScaledSource, BlockCacheSource, ValidSource,
+                        open_raster, aligned_shape, tile_count, window_views, iter_aligned_windows, iter_aligned_tiles,
+                        streaming_range)
+from .raster_stats import (RunningStats, QuantileSketch, BandStats, scene_stats, merge_stats, save_stats,
+                           load_stats)
+from .speckle import lee_filter, box_mean, despeckle, LeeFilteredSource
+from .tile_screen import TileScreen, window_sums, stitch_tiles
+from .tile_store import TileStore, TileSplit, SplitField, Lz4TileArray
+from .download import DownloadJob, Downloader, Transport, EarthEngineTransport, HttpMirrorTransport, make_session, region_coordinates
 
 __all__ = [
     'GCP_PROJECT', 'ASSET_DIR', 'SCALE', 'MAX_PIXELS', 'TILE_SIZE', 'STRIDE',
-    'BATCH_SIZE', 'LEARNING_RATE', 'EPOCHS', 'DATA_DIR', 'OUTPUT_DIR', 'MODEL_PATH',
-    'ensure_dir', 'setup_logging', 'get_file_size_mb', 'clean_filename', 'format_time'
+    'BATCH_SIZE', 'LEARNING_RATE', 'EPOCHS', 'DATA_DIR', 'DOWNLOAD_CACHE_DIR', 'OUTPUT_DIR', 'MODEL_PATH',
+    'ensure_dir', 'setup_logging', 'get_file_size_mb', 'clean_filename', 'format_time',
+    'DownloadJob', 'Downloader', 'Transport', 'EarthEngineTransport', 'HttpMirrorTransport', 'make_session', 'region_coordinates',
+    'DownloadCache', 'request_key',
+    'AoiGrid', 'GridTile', 'plan_grid', 'build_once', 'tile_jobs', 'mosaic_npy', 'mosaic_geotiff', 'fetch_mosaic',
+    'RasterSource', 'RasterioSource', 'ArraySource', 'ScaledSource', 'BlockCacheSource', 'ValidSource', 'open_raster',
+    'aligned_shape', 'tile_count', 'window_views', 'iter_aligned_windows', 'iter_aligned_tiles', 'streaming_range',
+    'RunningStats', 'QuantileSketch', 'BandStats', 'scene_stats', 'merge_stats', 'save_stats', 'load_stats',
+    'lee_filter', 'box_mean', 'despeckle', 'LeeFilteredSource',
+    'TileScreen', 'window_sums', 'stitch_tiles',
+    'TileStore', 'TileSplit', 'SplitField', 'Lz4TileArray'
 ]
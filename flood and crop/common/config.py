@@ -23,5 +23,6 @@ EPOCHS = 10
 
 # Data paths
 DATA_DIR = "data/optimized"
+DOWNLOAD_CACHE_DIR = "data/download_cache"
 OUTPUT_DIR = "data/rapid_processed"
 MODEL_PATH = "optimized_flood_model.pt"
@@ -0,0 +1,266 @@
+"""
+Concurrent, streaming download engine for satellite layers
+"""
+import os
+import time
+import random
+import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterable, List, Optional
+from urllib.parse import quote
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from .download_cache import DownloadCache, request_key
+
+log = logging.getLogger(__name__)
+
+# Status codes worth retrying: rate limiting and transient server errors
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+class IncompleteDownloadError(IOError):
+    """The transfer ended before the advertised number of bytes arrived."""
+
+
+@dataclass
+class DownloadJob:
+    """
+    One layer to fetch.
+
+    Attributes:
+        name: Key the result is reported under (e.g. 's1_pre')
+        path: Destination file
+        build: Returns the layer to download (e.g. an ee.Image), or None to skip it.
+            Called on a worker thread, so blocking getInfo() checks run concurrently.
+        params: Download parameters (scale, region, format, ...)
+        spec: Everything else that identifies the layer (dataset, dates, bands, ...).
+            Jobs with a spec are cached under the hash of spec and params.
+    """
+    name: str
+    path: str
+    build: Optional[Callable[[], Any]] = None
+    params: Dict[str, Any] = field(default_factory=dict)
+    spec: Optional[Dict[str, Any]] = None
+
+    def cache_spec(self) -> Optional[Dict[str, Any]]:
+        if self.spec is None:
+            return None
+        return {'spec': self.spec, 'params': self.params}
+
+
+class Transport:
+    """Turns a job into a URL the downloader can stream from."""
+
+    def resolve(self, job: DownloadJob) -> Optional[str]:
+        raise NotImplementedError
+
+    def identity(self) -> str:
+        """Where the bytes come from; part of the cache key, so sources never share entries"""
+        return type(self).__name__
+
+
+class EarthEngineTransport(Transport):
+    """Builds the job's image and asks Earth Engine for a download URL."""
+
+    def __init__(self, project: Optional[str] = None):
+        import ee
+        if project is not None:
+            ee.Initialize(project=project)
+
+    def resolve(self, job: DownloadJob) -> Optional[str]:
+        image = job.build() if job.build is not None else None
+        if image is None:
+            return None
+        return image.getDownloadURL(job.params)
+
+    def identity(self) -> str:
+        return 'earthengine'
+
+
+class HttpMirrorTransport(Transport):
+    """
+    Serves every job from <base_url>/<job name><extension>, e.g. a local stand-in server for Earth Engine.
+
+    Plain layers map to <base_url>/s1_pre.npy. Gridded layers (see gridding.tile_jobs)
+    map to one file per tile under the layer name, <base_url>/<layer>/tile_<row>_<col>.<ext>,
+    so the mirror holds the same tiles Earth Engine would return.
+    """
+
+    def __init__(self, base_url: str):
+        self.base_url = base_url.rstrip('/')
+
+    def resolve(self, job: DownloadJob) -> Optional[str]:
+        return f"{self.base_url}/{quote(job.name)}{os.path.splitext(job.path)[1]}"
+
+    def identity(self) -> str:
+        return f"http-mirror:{self.base_url}"
+
+
+def region_coordinates(bbox: List[float]) -> List[List[float]]:
+    """Closed polygon ring of a [west, south, east, north] box, usable as a download region"""
+    west, south, east, north = bbox
+    return [[west, south], [east, south], [east, north], [west, north], [west, south]]
+
+
+def make_session(pool_size: int = 16) -> requests.Session:
+    """
+    Session whose connection pool can serve pool_size concurrent downloads.
+
+    Args:
+        pool_size: Maximum simultaneous connections per host
+
+    Returns:
+        Configured requests session
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+class Downloader:
+    """
+    Fetches many layers concurrently over one pooled session.
+
+    Responses are streamed to disk in chunks (never held in memory) through a
+    .part file that only replaces the destination once complete; a leftover
+    .part file is resumed with an HTTP Range request. Failed URL resolutions and
+    transient HTTP errors are retried with exponential backoff. With a cache,
+    jobs that carry a spec are served from it without contacting the transport;
+    the transport's identity is part of the cache key.
+    """
+
+    def __init__(self, transport: Transport, max_workers: int = 8, retries: int = 4,
+                 backoff: float = 1.0, chunk_size: int = 1 << 20, timeout: float = 300,
+                 session: Optional[requests.Session] = None, cache: Optional[DownloadCache] = None):
+        self.transport = transport
+        self.cache = cache
+        self.max_workers = max_workers
+        self.retries = retries
+        self.backoff = backoff
+        self.chunk_size = chunk_size
+        self.timeout = timeout
+        self.session = session or make_session(max_workers)
+
+    def _wait(self, attempt: int) -> None:
+        time.sleep(self.backoff * (2 ** attempt) * (0.5 + random.random()))
+
+    def _stream(self, url: str, part_path: str) -> int:
+        """
+        Streams url into part_path, resuming after any bytes already there.
+
+        Returns:
+            The complete file size in bytes
+        """
+        offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        # Ask for the layer itself: Range offsets and Content-Length then count the bytes written to disk
+        headers = {'Accept-Encoding': 'identity'}
+        if offset:
+            headers['Range'] = f'bytes={offset}-'
+        with self.session.get(url, stream=True, timeout=self.timeout, headers=headers) as response:
+            if offset and response.status_code == 416:
+                # Stale partial file (e.g. the layer changed size); start over
+                os.remove(part_path)
+                return self._stream(url, part_path)
+            response.raise_for_status()
+
+            # A server may compress anyway; the tail of an encoded body cannot be decoded onto the partial file
+            encoded = response.headers.get('Content-Encoding', 'identity').lower() != 'identity'
+            resumed = offset and response.status_code == 206 and not encoded and \
+                response.headers.get('Content-Range', '').startswith(f'bytes {offset}-')
+            if offset and response.status_code == 206 and not resumed:
+                os.remove(part_path)
+                return self._stream(url, part_path)
+            length = response.headers.get('Content-Length')
+
+            with open(part_path, 'ab' if resumed else 'wb') as f:
+                for chunk in response.iter_content(chunk_size=self.chunk_size):
+                    f.write(chunk)
+            # Content-Length counts the bytes on the wire, which differ from the decoded ones when encoded
+            received = response.raw.tell()
+
+        if length is not None and received != int(length):
+            raise IncompleteDownloadError(f"received {received} of {length} bytes")
+        return os.path.getsize(part_path)
+
+    def fetch(self, job: DownloadJob) -> Optional[str]:
+        """
+        Downloads one job with retries.
+
+        Args:
+            job: Layer to fetch
+
+        Returns:
+            The written path, or None if the job's build skipped it
+        """
+        directory = os.path.dirname(job.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        spec = job.cache_spec() if self.cache is not None else None
+        if spec is not None:
+            spec = dict(spec, transport=self.transport.identity())
+        key = request_key(spec) if spec is not None else None
+        if key is not None and self.cache.lookup(key):
+            self.cache.materialize(key, job.path)
+            log.info(f"⚡ Cache hit for {job.name}")
+            return job.path
+        part_path = self.cache.partial_path(key) if key is not None else f"{job.path}.part"
+
+        for attempt in range(self.retries + 1):
+            try:
+                url = self.transport.resolve(job)
+                if url is None:
+                    return None
+                size = self._stream(url, part_path)
+                if key is not None:
+                    self.cache.commit(key, part_path, spec)
+                    self.cache.materialize(key, job.path)
+                else:
+                    os.replace(part_path, job.path)
+                log.info(f"✓ Downloaded {job.name} ({size / (1024 * 1024):.1f} MB)")
+                return job.path
+            except requests.HTTPError as e:
+                status = e.response.status_code if e.response is not None else None
+                if status not in RETRY_STATUS or attempt == self.retries:
+                    raise
+                log.warning(f"HTTP {status} for {job.name}, retrying ({attempt + 1}/{self.retries})")
+            except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError,
+                    IncompleteDownloadError) as e:
+                if attempt == self.retries:
+                    raise
+                log.warning(f"{type(e).__name__} for {job.name}, retrying ({attempt + 1}/{self.retries})")
+            except Exception as e:
+                # Earth Engine raises its own exception types for quota and transient errors
+                if job.build is None or attempt == self.retries:
+                    raise
+                log.warning(f"Could not resolve {job.name} ({e}), retrying ({attempt + 1}/{self.retries})")
+            self._wait(attempt)
+        return None
+
+    def fetch_all(self, jobs: Iterable[DownloadJob]) -> Dict[str, Optional[str]]:
+        """
+        Downloads all jobs on a bounded thread pool.
+
+        Args:
+            jobs: Layers to fetch (names must be unique)
+
+        Returns:
+            Mapping of job name to written path; None for skipped or failed jobs
+        """
+        jobs = list(jobs)
+        results = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            futures = {pool.submit(self.fetch, job): job for job in jobs}
+            for future in as_completed(futures):
+                job = futures[future]
+                try:
+                    results[job.name] = future.result()
+                except Exception as e:
+                    log.error(f"✗ Failed {job.name}: {e}")
+                    results[job.name] = None
+        return {job.name: results[job.name] for job in jobs}
@@ -0,0 +1,186 @@
+"""
+Content-addressed download cache for satellite layers
+"""
+import os
+import json
+import shutil
+import hashlib
+import logging
+import threading
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+log = logging.getLogger(__name__)
+
+HASH_CHUNK = 1 << 20
+
+
+def request_key(spec: Dict[str, Any]) -> str:
+    """
+    Stable key for a download request.
+
+    Args:
+        spec: Everything that determines the layer's bytes (dataset, AOI, dates,
+            bands, scale, format, ...); must be JSON serializable
+
+    Returns:
+        SHA-256 hex digest of the canonical JSON encoding
+    """
+    canonical = json.dumps(spec, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def file_sha256(path: str) -> str:
+    """SHA-256 of a file, read in chunks"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class DownloadCache:
+    """
+    Completed downloads stored under the hash of their request parameters.
+
+    Blobs live in <root>/blobs/<key[:2]>/<key>; in-progress downloads keep a
+    <blob>.part file so an interrupted transfer resumes (HTTP Range) on the next
+    run. index.json records size, mtime, SHA-256 and the request spec of every
+    blob. A hit only compares size and mtime, so it costs one stat; the digest
+    is computed at commit and re-checked only when verification is asked for.
+
+    Args:
+        root: Cache directory
+        verify: Re-hash every blob on lookup (e.g. after copying the cache between machines)
+    """
+
+    def __init__(self, root: str = "data/download_cache", verify: bool = False):
+        self.root = root
+        self.verify = verify
+        self.index_path = os.path.join(root, 'index.json')
+        os.makedirs(os.path.join(root, 'blobs'), exist_ok=True)
+        self._lock = threading.Lock()
+        self.index = self._read_index()
+
+    def _read_index(self) -> Dict[str, Any]:
+        if os.path.exists(self.index_path):
+            with open(self.index_path) as f:
+                return json.load(f)
+        return {}
+
+    def _write_index(self) -> None:
+        tmp_path = f"{self.index_path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self.index, f, indent=2)
+        os.replace(tmp_path, self.index_path)
+
+    def blob_path(self, key: str) -> str:
+        return os.path.join(self.root, 'blobs', key[:2], key)
+
+    def partial_path(self, key: str) -> str:
+        """Where an in-progress download for key is written (and resumed from)"""
+        path = f"{self.blob_path(key)}.part"
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return path
+
+    def lookup(self, key: str, verify: Optional[bool] = None) -> Optional[str]:
+        """
+        Blob path for a cached request, or None on a miss.
+
+        Args:
+            key: Request key
+            verify: Also re-hash the blob; defaults to the cache's verify setting.
+                Entries indexed before mtimes were recorded are hashed once either way.
+
+        Returns:
+            Path of the intact blob, or None (damaged entries are dropped)
+        """
+        with self._lock:
+            entry = self.index.get(key)
+        if entry is None:
+            return None
+        if verify is None:
+            verify = self.verify or 'mtime_ns' not in entry
+
+        path = self.blob_path(key)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            stat = None
+        # Any write to the blob (including through a materialized hard link) moves its mtime
+        intact = stat is not None and stat.st_size == entry['size'] and \
+            (verify or stat.st_mtime_ns == entry['mtime_ns'])
+        if intact and verify:
+            intact = file_sha256(path) == entry['sha256']
+        if not intact:
+            log.warning(f"Cached download {key[:12]} is missing or damaged, refetching")
+            self.evict(key)
+            return None
+        if entry.get('mtime_ns') != stat.st_mtime_ns:
+            with self._lock:
+                self.index[key] = dict(entry, mtime_ns=stat.st_mtime_ns)
+                self._write_index()
+        return path
+
+    def commit(self, key: str, part_path: str, spec: Optional[Dict[str, Any]] = None) -> str:
+        """
+        Moves a completed download into the cache and indexes it.
+
+        Args:
+            key: Request key
+            part_path: Fully downloaded file
+            spec: Request parameters, stored for inspection
+
+        Returns:
+            Path of the cached blob
+        """
+        path = self.blob_path(key)
+        sha256 = file_sha256(part_path)
+        os.replace(part_path, path)
+        stat = os.stat(path)
+        with self._lock:
+            self.index[key] = {
+                'size': stat.st_size,
+                'mtime_ns': stat.st_mtime_ns,
+                'sha256': sha256,
+                'spec': spec,
+                'created': datetime.now().isoformat()
+            }
+            self._write_index()
+        return path
+
+    def materialize(self, key: str, dest: str) -> str:
+        """
+        Hard-links a cached blob to dest, copying it where links are not possible
+        (another filesystem, or one without hard links).
+
+        Callers must replace dest rather than write into it; an in-place write
+        would change the blob too (and get it evicted on its next lookup).
+        """
+        blob = self.blob_path(key)
+        directory = os.path.dirname(dest)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Renaming a link over another link to the same blob is a no-op that would leave tmp behind
+        if os.path.exists(dest) and os.path.samefile(blob, dest):
+            return dest
+        tmp_path = f"{dest}.tmp"
+        if os.path.lexists(tmp_path):
+            os.remove(tmp_path)
+        try:
+            os.link(blob, tmp_path)
+        except OSError:
+            shutil.copyfile(blob, tmp_path)
+        os.replace(tmp_path, dest)
+        return dest
+
+    def evict(self, key: str) -> None:
+        with self._lock:
+            self.index.pop(key, None)
+            self._write_index()
+        if os.path.exists(self.blob_path(key)):
+            os.remove(self.blob_path(key))
+
+    def size_mb(self) -> float:
+        with self._lock:
+            return sum(entry['size'] for entry in self.index.values()) / (1024 * 1024)
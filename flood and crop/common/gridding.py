@@ -0,0 +1,251 @@
+"""
+AOI gridding: split a region into Earth Engine sized download tiles and mosaic them
+"""
+import os
+import math
+import shutil
+import logging
+import threading
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+from .download import DownloadJob, Downloader
+
+try:
+    import rasterio
+    from rasterio.windows import Window
+except ImportError:  # Only needed to mosaic multi-tile GeoTIFFs
+    rasterio = None
+
+log = logging.getLogger(__name__)
+
+# getDownloadURL rejects requests above 48 MiB or wider/taller than 32768 pixels
+EE_MAX_REQUEST_BYTES = 50331648
+EE_MAX_GRID_DIMENSION = 32768
+# Headroom for per-band overhead and EE's own size estimate
+REQUEST_SAFETY = 0.8
+METERS_PER_DEGREE = 111320.0
+
+
+@dataclass(frozen=True)
+class GridTile:
+    """Pixel window of one download tile within the full AOI raster"""
+    row: int
+    col: int
+    row_off: int
+    col_off: int
+    height: int
+    width: int
+
+
+@dataclass
+class AoiGrid:
+    """
+    Pixel grid over an AOI in EPSG:4326 and its split into download tiles.
+
+    Attributes:
+        bbox: [west, south, east, north] actually covered (snapped outward to whole pixels)
+        dx, dy: Pixel size in degrees
+        width, height: Full raster size in pixels
+        tile_width, tile_height: Nominal tile size in pixels (edge tiles may be smaller)
+    """
+    bbox: List[float]
+    dx: float
+    dy: float
+    width: int
+    height: int
+    tile_width: int
+    tile_height: int
+
+    @property
+    def transform(self) -> List[float]:
+        """Affine transform [dx, 0, west, 0, -dy, north] of the full raster"""
+        return [self.dx, 0.0, self.bbox[0], 0.0, -self.dy, self.bbox[3]]
+
+    def tiles(self) -> List[GridTile]:
+        tiles = []
+        for row, row_off in enumerate(range(0, self.height, self.tile_height)):
+            for col, col_off in enumerate(range(0, self.width, self.tile_width)):
+                tiles.append(GridTile(row, col, row_off, col_off,
+                                      min(self.tile_height, self.height - row_off),
+                                      min(self.tile_width, self.width - col_off)))
+        return tiles
+
+    def tile_params(self, tile: GridTile) -> Dict[str, Any]:
+        """getDownloadURL parameters that return exactly this tile's pixels"""
+        west = self.bbox[0] + tile.col_off * self.dx
+        north = self.bbox[3] - tile.row_off * self.dy
+        return {
+            'crs': 'EPSG:4326',
+            'crs_transform': [self.dx, 0.0, west, 0.0, -self.dy, north],
+            'dimensions': f"{tile.width}x{tile.height}"
+        }
+
+
+def plan_grid(bbox: List[float], scale: float, n_bands: int, bytes_per_pixel: int = 4,
+              max_request_bytes: int = EE_MAX_REQUEST_BYTES,
+              max_dimension: int = EE_MAX_GRID_DIMENSION) -> AoiGrid:
+    """
+    Grid an AOI so that every tile stays under the download request limits.
+
+    Args:
+        bbox: [west, south, east, north] in degrees
+        scale: Pixel size in meters (converted at the AOI's mid latitude)
+        n_bands: Number of bands requested per tile
+        bytes_per_pixel: Bytes per band value (use the widest band type)
+        max_request_bytes: Size limit of a single request
+        max_dimension: Maximum tile width or height in pixels
+
+    Returns:
+        The AOI grid
+    """
+    west, south, east, north = bbox
+    dy = scale / METERS_PER_DEGREE
+    dx = scale / (METERS_PER_DEGREE * math.cos(math.radians((south + north) / 2)))
+    width = max(1, math.ceil((east - west) / dx))
+    height = max(1, math.ceil((north - south) / dy))
+
+    max_pixels = max_request_bytes * REQUEST_SAFETY / (n_bands * bytes_per_pixel)
+    side = max(1, min(int(math.sqrt(max_pixels)), max_dimension))
+    # Spread the pixels evenly over the fewest tiles that fit
+    tile_width = math.ceil(width / math.ceil(width / side))
+    tile_height = math.ceil(height / math.ceil(height / side))
+
+    grid = AoiGrid([west, north - height * dy, west + width * dx, north], dx, dy, width, height,
+                   tile_width, tile_height)
+    log.info(f"AOI grid: {width}x{height} px at {scale} m in {len(grid.tiles())} tile(s) "
+             f"of up to {tile_width}x{tile_height} px")
+    return grid
+
+
+def build_once(build: Callable[[], Any]) -> Callable[[], Any]:
+    """
+    Wrap a layer build so it runs once, however many tile jobs (and threads) call it.
+
+    A build that raises is not remembered, so a retried tile builds again.
+    """
+    lock = threading.Lock()
+    built = []
+
+    def cached() -> Any:
+        with lock:
+            if not built:
+                built.append(build())
+            return built[0]
+    return cached
+
+
+def tile_jobs(grid: AoiGrid, name: str, tile_dir: str, build: Callable[[], Any],
+              spec: Dict[str, Any], fmt: str = 'NPY') -> Dict[GridTile, DownloadJob]:
+    """
+    One download job per grid tile.
+
+    Args:
+        grid: AOI grid
+        name: Layer name; tile jobs are named <name>/tile_<row>_<col>
+        tile_dir: Directory for the downloaded tiles
+        build: Returns the layer image; built once and shared by all tiles
+        spec: Layer spec for the download cache
+        fmt: 'NPY' or 'GeoTIFF'
+
+    Returns:
+        Mapping of tile to its job
+    """
+    ext = 'npy' if fmt == 'NPY' else 'tif'
+    build = build_once(build)
+    return {
+        tile: DownloadJob(
+            name=f"{name}/tile_{tile.row}_{tile.col}",
+            path=os.path.join(tile_dir, f"{name.replace('/', '_')}_{tile.row}_{tile.col}.{ext}"),
+            build=build,
+            params=dict(grid.tile_params(tile), format=fmt),
+            spec=spec
+        )
+        for tile in grid.tiles()
+    }
+
+
+def _tile_array(path: str) -> np.ndarray:
+    """(rows, cols, bands) view of a downloaded NPY tile; EE writes one structured field per band"""
+    data = np.load(path, mmap_mode='r')
+    if data.dtype.names:
+        return np.stack([data[band] for band in data.dtype.names], axis=-1)
+    return data if data.ndim == 3 else data[..., None]
+
+
+def mosaic_npy(grid: AoiGrid, tile_paths: Dict[GridTile, str], out_path: str,
+               dtype=np.float32) -> List[str]:
+    """
+    Write NPY tiles into one (height, width, bands) array on disk, one tile window at a time.
+
+    Returns:
+        Band names (from the tiles' structured fields, else band_<i>)
+    """
+    first = np.load(next(iter(tile_paths.values())), mmap_mode='r')
+    bands = list(first.dtype.names) if first.dtype.names else \
+        [f"band_{i}" for i in range(first.shape[2] if first.ndim == 3 else 1)]
+
+    out = np.lib.format.open_memmap(out_path, mode='w+', dtype=dtype,
+                                    shape=(grid.height, grid.width, len(bands)))
+    for tile, path in tile_paths.items():
+        out[tile.row_off:tile.row_off + tile.height, tile.col_off:tile.col_off + tile.width] = _tile_array(path)
+    out.flush()
+    del out
+    return bands
+
+
+def mosaic_geotiff(grid: AoiGrid, tile_paths: Dict[GridTile, str], out_path: str) -> None:
+    """Write GeoTIFF tiles into one tiled GeoTIFF, copying block windows so memory stays bounded."""
+    if len(tile_paths) == 1:
+        shutil.copyfile(next(iter(tile_paths.values())), out_path)
+        return
+    if rasterio is None:
+        raise ImportError("rasterio is required to mosaic multi-tile GeoTIFFs")
+
+    with rasterio.open(next(iter(tile_paths.values()))) as src:
+        profile = src.profile
+    profile.update(driver='GTiff', width=grid.width, height=grid.height, crs='EPSG:4326',
+                   transform=rasterio.Affine(*grid.transform), tiled=True, blockxsize=512,
+                   blockysize=512, compress='deflate', BIGTIFF='IF_SAFER')
+
+    with rasterio.open(out_path, 'w', **profile) as dst:
+        for tile, path in tile_paths.items():
+            with rasterio.open(path) as src:
+                for _, window in src.block_windows(1):
+                    dst.write(src.read(window=window),
+                              window=Window(tile.col_off + window.col_off, tile.row_off + window.row_off,
+                                            window.width, window.height))
+
+
+def fetch_mosaic(downloader: Downloader, layers: List[Dict[str, Any]]) -> Dict[str, Optional[str]]:
+    """
+    Download gridded layers in parallel and mosaic each into a single raster.
+
+    Args:
+        downloader: Downloader (its thread pool fetches the tiles of all layers together)
+        layers: Dicts with name, grid, out_path, tile_dir, build, spec and optionally format
+
+    Returns:
+        Mapping of layer name to mosaic path, or None if any of its tiles is missing
+    """
+    plans = {layer['name']: tile_jobs(layer['grid'], layer['name'], layer['tile_dir'], layer['build'],
+                                      layer['spec'], layer.get('format', 'NPY'))
+             for layer in layers}
+    fetched = downloader.fetch_all(job for jobs in plans.values() for job in jobs.values())
+
+    results = {}
+    for layer in layers:
+        jobs = plans[layer['name']]
+        tile_paths = {tile: fetched[job.name] for tile, job in jobs.items()}
+        if any(path is None for path in tile_paths.values()):
+            results[layer['name']] = None
+            continue
+        if layer.get('format', 'NPY') == 'NPY':
+            mosaic_npy(layer['grid'], tile_paths, layer['out_path'])
+        else:
+            mosaic_geotiff(layer['grid'], tile_paths, layer['out_path'])
+        log.info(f"✓ Mosaicked {len(tile_paths)} tile(s) of {layer['name']} into {layer['out_path']}")
+        results[layer['name']] = layer['out_path']
+    return results
@@ -0,0 +1,276 @@
+"""
+Windowed raster reading: aligned, block-streamed tiles across several rasters
+"""
+import logging
+from typing import Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+try:
+    import rasterio
+    from rasterio.windows import Window
+except ImportError:  # GeoTIFFs then fall back to PIL
+    rasterio = None
+
+log = logging.getLogger(__name__)
+
+# Default number of tile rows/columns read per block window
+DEFAULT_BLOCK_TILES = 16
+
+
+class RasterSource:
+    """Single-band raster that can be read window by window."""
+
+    shape: Tuple[int, int]
+
+    def read(self, row_off: int, col_off: int, height: int, width: int) -> np.ndarray:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class RasterioSource(RasterSource):
+    """Band 1 of a GeoTIFF, read through rasterio windows."""
+
+    def __init__(self, path: str):
+        self.dataset = rasterio.open(path)
+        self.shape = (self.dataset.height, self.dataset.width)
+
+    def read(self, row_off, col_off, height, width):
+        return self.dataset.read(1, window=Window(col_off, row_off, width, height)).astype(np.float32)
+
+    def close(self):
+        self.dataset.close()
+
+
+class ArraySource(RasterSource):
+    """2D view of an in-memory or memory-mapped array (first channel of 3D arrays)."""
+
+    def __init__(self, data: np.ndarray):
+        if data.dtype.names:
+            data = data[data.dtype.names[0]]
+        if data.ndim > 2:
+            # Channels-last if the last axis is the short one, else channels-first
+            data = data[..., 0] if data.shape[-1] < data.shape[0] else data[0]
+        self.data = data
+        self.shape = data.shape
+
+    def read(self, row_off, col_off, height, width):
+        return np.asarray(self.data[row_off:row_off + height, col_off:col_off + width], dtype=np.float32)
+
+
+class ScaledSource(RasterSource):
+    """Reads another source as (nan_to_num(value) - offset) * scale, optionally clipped; padding outside it stays 0."""
+
+    def __init__(self, source: RasterSource, offset: float = 0.0, scale: float = 1.0,
+                 clip: Optional[Tuple[float, float]] = None):
+        self.source = source
+        self.offset = offset
+        self.scale = scale
+        self.clip = clip
+        self.shape = source.shape
+
+    def read(self, row_off, col_off, height, width):
+        block = np.nan_to_num(self.source.read(row_off, col_off, height, width))
+        if self.offset or self.scale != 1.0:
+            block = (block - np.float32(self.offset)) * np.float32(self.scale)
+        if self.clip is not None:
+            np.clip(block, *self.clip, out=block)
+        return block
+
+    def close(self):
+        self.source.close()
+
+
+class BlockCacheSource(RasterSource):
+    """
+    Keeps the last window read from another source.
+
+    A later read of the same or an enclosed window (e.g. a nodata mask judged on
+    the block a filter just read with its halo) is sliced from memory instead of
+    read again. Blocks are shared, so readers must not modify them in place.
+    """
+
+    def __init__(self, source: RasterSource):
+        self.source = source
+        self.shape = source.shape
+        self._window = None
+        self._block = None
+
+    def read(self, row_off, col_off, height, width):
+        if self._window is not None:
+            top, left, block_h, block_w = self._window
+            if top <= row_off and left <= col_off and \
+                    row_off + height <= top + block_h and col_off + width <= left + block_w:
+                return self._block[row_off - top:row_off - top + height, col_off - left:col_off - left + width]
+        self._block = self.source.read(row_off, col_off, height, width)
+        self._window = (row_off, col_off, height, width)
+        return self._block
+
+    def close(self):
+        self._window = self._block = None
+        self.source.close()
+
+
+class ValidSource(RasterSource):
+    """1 where every source holds data (finite and nonzero, as exports fill masked pixels), else 0."""
+
+    def __init__(self, sources: Sequence[RasterSource]):
+        self.sources = list(sources)
+        self.shape = aligned_shape(self.sources)
+
+    def read(self, row_off, col_off, height, width):
+        valid = np.ones((height, width), dtype=bool)
+        for source in self.sources:
+            block = source.read(row_off, col_off, height, width)
+            valid &= np.isfinite(block) & (block != 0)
+        return valid.astype(np.float32)
+
+    def close(self):
+        for source in self.sources:
+            source.close()
+
+
+def open_raster(path: str) -> RasterSource:
+    """
+    Open a raster for windowed reads.
+
+    GeoTIFFs use rasterio when it is installed, else PIL (which decodes the whole
+    image, so only suits small files). .npy files are memory-mapped.
+
+    Args:
+        path: GeoTIFF or .npy file
+
+    Returns:
+        Raster source
+
+    Raises:
+        ValueError: If no reader can open the file
+    """
+    errors = []
+    if path.endswith('.npy'):
+        return ArraySource(np.load(path, mmap_mode='r'))
+    if rasterio is not None:
+        try:
+            return RasterioSource(path)
+        except Exception as e:
+            errors.append(f"rasterio: {e}")
+    try:
+        from PIL import Image
+        with Image.open(path) as img:
+            return ArraySource(np.asarray(img))
+    except Exception as e:
+        errors.append(f"PIL: {e}")
+    raise ValueError(f"Cannot read raster {path} ({'; '.join(errors)})")
+
+
+def aligned_shape(sources: Sequence[RasterSource]) -> Tuple[int, int]:
+    """Largest extent covered by all sources (they share the top-left origin)"""
+    return min(s.shape[0] for s in sources), min(s.shape[1] for s in sources)
+
+
+def iter_blocks(shape: Tuple[int, int], block_rows: int = 1024) -> Iterator[Tuple[int, int]]:
+    """(row_off, height) strips covering a raster of the given shape"""
+    for row_off in range(0, shape[0], block_rows):
+        yield row_off, min(block_rows, shape[0] - row_off)
+
+
+def tile_offsets(length: int, tile_size: int, stride: int) -> List[int]:
+    """Tile start offsets along one axis; a single tile if the axis is shorter than tile_size"""
+    return list(range(0, max(length - tile_size, 0) + 1, stride))
+
+
+def tile_count(shape: Tuple[int, int], tile_size: int, stride: int) -> int:
+    """Number of tiles iter_aligned_windows covers for a raster of the given shape"""
+    return len(tile_offsets(shape[0], tile_size, stride)) * len(tile_offsets(shape[1], tile_size, stride))
+
+
+def window_views(block: np.ndarray, tile_size: int, stride: int) -> np.ndarray:
+    """
+    Tiles of a block as a strided view, without copying.
+
+    Returns:
+        (tile_rows, tile_cols, tile_size, tile_size) view into block
+    """
+    return sliding_window_view(block, (tile_size, tile_size))[::stride, ::stride]
+
+
+def iter_aligned_windows(sources: Sequence[RasterSource], tile_size: int, stride: int,
+                         block_tiles: int = DEFAULT_BLOCK_TILES,
+                         shape: Optional[Tuple[int, int]] = None
+                         ) -> Iterator[Tuple[int, int, List[np.ndarray]]]:
+    """
+    Block windows of several aligned rasters, each covering a group of tiles.
+
+    Every block spans block_tiles x block_tiles tile positions plus the stride
+    overlap, so only one block per source is in memory at a time. Areas beyond
+    the aligned extent (scenes smaller than a tile) are zero padded.
+
+    Args:
+        sources: Rasters sharing the same pixel grid
+        tile_size: Tile edge in pixels
+        stride: Step between tiles
+        block_tiles: Tile positions per block edge
+        shape: Extent to cover (default: aligned_shape(sources))
+
+    Yields:
+        (row_off, col_off, arrays): block origin and one float32 block per source
+    """
+    h, w = shape or aligned_shape(sources)
+    rows, cols = tile_offsets(h, tile_size, stride), tile_offsets(w, tile_size, stride)
+    for bi in range(0, len(rows), block_tiles):
+        row_off = rows[bi]
+        height = rows[min(bi + block_tiles, len(rows)) - 1] + tile_size - row_off
+        for bj in range(0, len(cols), block_tiles):
+            col_off = cols[bj]
+            width = cols[min(bj + block_tiles, len(cols)) - 1] + tile_size - col_off
+
+            arrays = []
+            for source in sources:
+                block = np.zeros((height, width), dtype=np.float32)
+                valid_h, valid_w = max(0, min(height, h - row_off)), max(0, min(width, w - col_off))
+                if valid_h and valid_w:
+                    block[:valid_h, :valid_w] = source.read(row_off, col_off, valid_h, valid_w)
+                arrays.append(block)
+            yield row_off, col_off, arrays
+
+
+def iter_aligned_tiles(sources: Sequence[RasterSource], tile_size: int, stride: int,
+                       block_tiles: int = DEFAULT_BLOCK_TILES,
+                       shape: Optional[Tuple[int, int]] = None
+                       ) -> Iterator[Tuple[int, int, List[np.ndarray]]]:
+    """
+    Tiles of several aligned rasters, in row-major order within each block.
+
+    Yields:
+        (row, col, tiles): tile origin in the scene and one (tile_size, tile_size) view per source
+    """
+    for row_off, col_off, blocks in iter_aligned_windows(sources, tile_size, stride, block_tiles, shape):
+        views = [window_views(block, tile_size, stride) for block in blocks]
+        for i in range(views[0].shape[0]):
+            for j in range(views[0].shape[1]):
+                yield row_off + i * stride, col_off + j * stride, [view[i, j] for view in views]
+
+
+def streaming_range(source: RasterSource, shape: Optional[Tuple[int, int]] = None,
+                    block_rows: int = 1024) -> Tuple[float, float]:
+    """
+    Min and max over a raster (NaN read as 0), one row strip at a time.
+
+    Returns:
+        (min, max)
+    """
+    h, w = shape or source.shape
+    lo, hi = np.inf, -np.inf
+    for row_off, height in iter_blocks((h, w), block_rows):
+        block = np.nan_to_num(source.read(row_off, 0, height, w))
+        lo, hi = min(lo, float(block.min())), max(hi, float(block.max()))
+    return lo, hi
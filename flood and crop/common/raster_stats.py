@@ -0,0 +1,312 @@
+"""
+Streaming raster statistics: Welford moments and mergeable quantile sketches
+"""
+import os
+import json
+import math
+import logging
+from typing import Dict, Iterable, Optional, Tuple
+
+import numpy as np
+
+from .raster_io import RasterSource, iter_blocks
+
+log = logging.getLogger(__name__)
+
+# Percentiles are within this relative error of the exact value
+RELATIVE_ACCURACY = 0.005
+# Magnitudes below this count as zero in the quantile sketch
+MIN_MAGNITUDE = 1e-12
+# Percentiles used as the robust normalization range
+ROBUST_PERCENTILES = (2.0, 98.0)
+
+
+class RunningStats:
+    """Count, mean, variance, min and max, updated block by block (Welford / Chan et al.)."""
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def update(self, values: np.ndarray) -> None:
+        """Add finite values (any shape)"""
+        n = values.size
+        if n == 0:
+            return
+        block_mean = float(values.mean(dtype=np.float64))
+        # Deviations in float64: float32 blocks would otherwise subtract in float32
+        block_m2 = float(np.square(np.subtract(values, block_mean, dtype=np.float64)).sum())
+        self._combine(n, block_mean, block_m2, float(values.min()), float(values.max()))
+
+    def merge(self, other: 'RunningStats') -> None:
+        if other.count:
+            self._combine(other.count, other.mean, other.m2, other.min, other.max)
+
+    def _combine(self, n: int, mean: float, m2: float, lo: float, hi: float) -> None:
+        total = self.count + n
+        delta = mean - self.mean
+        self.mean += delta * n / total
+        self.m2 += m2 + delta * delta * self.count * n / total
+        self.count = total
+        self.min, self.max = min(self.min, lo), max(self.max, hi)
+
+    @property
+    def variance(self) -> float:
+        return self.m2 / self.count if self.count else math.nan
+
+    @property
+    def std(self) -> float:
+        return math.sqrt(self.variance)
+
+    def to_dict(self) -> Dict[str, float]:
+        return {'count': self.count, 'mean': self.mean, 'm2': self.m2, 'min': self.min, 'max': self.max}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, float]) -> 'RunningStats':
+        stats = cls()
+        stats.count, stats.mean, stats.m2 = int(data['count']), data['mean'], data['m2']
+        stats.min, stats.max = data['min'], data['max']
+        return stats
+
+
+class _Buckets:
+    """Counts of a run of consecutive integer keys, grown as new keys arrive"""
+
+    def __init__(self, offset: int = 0, counts: Optional[np.ndarray] = None):
+        self.offset = offset
+        self.counts = np.zeros(0, dtype=np.int64) if counts is None else np.asarray(counts, dtype=np.int64)
+
+    @property
+    def total(self) -> int:
+        return int(self.counts.sum())
+
+    def _grow(self, lo: int, hi: int) -> None:
+        if not len(self.counts):
+            self.offset, self.counts = lo, np.zeros(hi - lo + 1, dtype=np.int64)
+            return
+        new_lo, new_hi = min(lo, self.offset), max(hi, self.offset + len(self.counts) - 1)
+        if new_lo < self.offset or new_hi >= self.offset + len(self.counts):
+            counts = np.zeros(new_hi - new_lo + 1, dtype=np.int64)
+            counts[self.offset - new_lo:self.offset - new_lo + len(self.counts)] = self.counts
+            self.offset, self.counts = new_lo, counts
+
+    def add(self, keys: np.ndarray) -> None:
+        self._grow(int(keys.min()), int(keys.max()))
+        self.counts += np.bincount(keys - self.offset, minlength=len(self.counts))
+
+    def merge(self, other: '_Buckets') -> None:
+        if not other.total:
+            return
+        self._grow(other.offset, other.offset + len(other.counts) - 1)
+        start = other.offset - self.offset
+        self.counts[start:start + len(other.counts)] += other.counts
+
+
+class QuantileSketch:
+    """
+    Mergeable quantile sketch with relative accuracy (DDSketch).
+
+    Values fall into logarithmic buckets |x| in (gamma^(k-1), gamma^k], kept
+    separately for each sign, so every quantile is within relative_accuracy of
+    the true value however far a few outliers (e.g. speckle) stretch the range.
+    """
+
+    def __init__(self, relative_accuracy: float = RELATIVE_ACCURACY):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.positive = _Buckets()
+        self.negative = _Buckets()
+        self.zero_count = 0
+
+    @property
+    def total(self) -> int:
+        return self.positive.total + self.negative.total + self.zero_count
+
+    def _keys(self, magnitudes: np.ndarray) -> np.ndarray:
+        return np.ceil(np.log(magnitudes.astype(np.float64)) / self._log_gamma).astype(np.int64)
+
+    def _value(self, key: int) -> float:
+        return 2 * self.gamma ** key / (self.gamma + 1)
+
+    def update(self, values: np.ndarray) -> None:
+        """Add finite values (any shape)"""
+        values = values.ravel()
+        positive = values[values > MIN_MAGNITUDE]
+        negative = -values[values < -MIN_MAGNITUDE]
+        self.zero_count += int(values.size - positive.size - negative.size)
+        if positive.size:
+            self.positive.add(self._keys(positive))
+        if negative.size:
+            self.negative.add(self._keys(negative))
+
+    def merge(self, other: 'QuantileSketch') -> None:
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError("Cannot merge sketches with different relative accuracy")
+        self.positive.merge(other.positive)
+        self.negative.merge(other.negative)
+        self.zero_count += other.zero_count
+
+    def quantile(self, q: float) -> float:
+        """Value at rank q * (n - 1) of the sketched values"""
+        total = self.total
+        if not total:
+            return math.nan
+        rank = q * (total - 1)
+
+        # Negative values ascend as their bucket keys descend
+        negative = self.negative.counts[::-1]
+        if len(negative) and rank < negative.sum():
+            i = int(np.searchsorted(np.cumsum(negative), rank, side='right'))
+            return -self._value(self.negative.offset + len(negative) - 1 - i)
+        rank -= self.negative.total
+        if rank < self.zero_count:
+            return 0.0
+        rank -= self.zero_count
+        i = int(np.searchsorted(np.cumsum(self.positive.counts), rank, side='right'))
+        return self._value(self.positive.offset + min(i, len(self.positive.counts) - 1))
+
+    def to_dict(self) -> Dict:
+        return {'relative_accuracy': self.relative_accuracy, 'zero_count': self.zero_count,
+                'positive': {'offset': self.positive.offset, 'counts': self.positive.counts.tolist()},
+                'negative': {'offset': self.negative.offset, 'counts': self.negative.counts.tolist()}}
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'QuantileSketch':
+        sketch = cls(data['relative_accuracy'])
+        sketch.zero_count = data['zero_count']
+        sketch.positive = _Buckets(data['positive']['offset'], data['positive']['counts'])
+        sketch.negative = _Buckets(data['negative']['offset'], data['negative']['counts'])
+        return sketch
+
+
+class BandStats:
+    """
+    One-pass statistics of a raster band: moments, extremes and percentiles.
+
+    Non-finite values (NaN nodata, inf) are counted but excluded from the statistics.
+    """
+
+    def __init__(self, relative_accuracy: float = RELATIVE_ACCURACY):
+        self.moments = RunningStats()
+        self.sketch = QuantileSketch(relative_accuracy)
+        self.nonfinite = 0
+
+    def update(self, block: np.ndarray) -> None:
+        finite = np.isfinite(block)
+        values = block[finite] if not finite.all() else block
+        self.nonfinite += int(block.size - values.size)
+        self.moments.update(values)
+        self.sketch.update(values)
+
+    def merge(self, other: 'BandStats') -> 'BandStats':
+        self.moments.merge(other.moments)
+        self.sketch.merge(other.sketch)
+        self.nonfinite += other.nonfinite
+        return self
+
+    @property
+    def count(self) -> int:
+        return self.moments.count
+
+    @property
+    def min(self) -> float:
+        return self.moments.min
+
+    @property
+    def max(self) -> float:
+        return self.moments.max
+
+    def percentile(self, p: float) -> float:
+        """p-th percentile (0-100), clamped to the observed extremes"""
+        return float(np.clip(self.sketch.quantile(p / 100.0), self.min, self.max))
+
+    def robust_range(self, percentiles: Tuple[float, float] = ROBUST_PERCENTILES) -> Tuple[float, float]:
+        """Normalization range that ignores outliers such as speckle"""
+        return self.percentile(percentiles[0]), self.percentile(percentiles[1])
+
+    def summary(self) -> Dict[str, float]:
+        return {'count': self.count, 'nonfinite': self.nonfinite, 'mean': self.moments.mean,
+                'std': self.moments.std, 'min': self.min, 'max': self.max,
+                **{f"p{p:g}": self.percentile(p) for p in (1, 2, 50, 98, 99)}}
+
+    def to_dict(self) -> Dict:
+        return {'summary': self.summary(), 'moments': self.moments.to_dict(),
+                'sketch': self.sketch.to_dict(), 'nonfinite': self.nonfinite}
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'BandStats':
+        stats = cls(data['sketch']['relative_accuracy'])
+        stats.moments = RunningStats.from_dict(data['moments'])
+        stats.sketch = QuantileSketch.from_dict(data['sketch'])
+        stats.nonfinite = data['nonfinite']
+        return stats
+
+
+def scene_stats(source: RasterSource, shape: Optional[Tuple[int, int]] = None,
+                block_rows: int = 1024) -> BandStats:
+    """
+    Statistics of a raster in one pass over row strips.
+
+    Args:
+        source: Raster to scan
+        shape: Extent to cover (default: the whole raster)
+        block_rows: Rows read per strip
+
+    Returns:
+        Band statistics
+    """
+    h, w = shape or source.shape
+    stats = BandStats()
+    for row_off, height in iter_blocks((h, w), block_rows):
+        stats.update(source.read(row_off, 0, height, w))
+    return stats
+
+
+def merge_stats(stats: Iterable[BandStats]) -> BandStats:
+    """Collection statistics from per-scene statistics"""
+    merged = BandStats()
+    for item in stats:
+        merged.merge(item)
+    return merged
+
+
+def save_stats(path: str, scenes: Dict[str, Dict[str, BandStats]],
+               collections: Optional[Dict[str, BandStats]] = None) -> None:
+    """
+    Persist statistics as JSON.
+
+    Args:
+        path: Output file
+        scenes: Scene name -> band/layer name -> statistics
+        collections: Band/layer name -> statistics over all scenes
+    """
+    data = {
+        'scenes': {scene: {band: stats.to_dict() for band, stats in bands.items()}
+                   for scene, bands in scenes.items()},
+        'collections': {band: stats.to_dict() for band, stats in (collections or {}).items()}
+    }
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(f"{path}.tmp", 'w') as f:
+        json.dump(data, f)
+    os.replace(f"{path}.tmp", path)
+
+
+def load_stats(path: str) -> Tuple[Dict[str, Dict[str, BandStats]], Dict[str, BandStats]]:
+    """
+    Read statistics written by save_stats.
+
+    Returns:
+        (scenes, collections)
+    """
+    with open(path) as f:
+        data = json.load(f)
+    scenes = {scene: {band: BandStats.from_dict(stats) for band, stats in bands.items()}
+              for scene, bands in data['scenes'].items()}
+    collections = {band: BandStats.from_dict(stats) for band, stats in data['collections'].items()}
+    return scenes, collections
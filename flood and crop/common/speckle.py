@@ -0,0 +1,166 @@
+"""
+SAR speckle filtering (Lee) with separable box filters, run block by block with a halo
+"""
+import time
+import logging
+import argparse
+from typing import Optional, Tuple
+
+import numpy as np
+from scipy.ndimage import uniform_filter1d
+
+from .raster_io import RasterSource, ArraySource, iter_blocks
+
+log = logging.getLogger(__name__)
+
+# Equivalent number of looks of Sentinel-1 IW GRD high resolution products
+S1_GRD_LOOKS = 4.4
+DEFAULT_WINDOW = 7
+LN10_OVER_10 = np.log(10.0) / 10.0
+SPECKLE_FILTERS = ('none', 'lee')
+
+
+def box_mean(image: np.ndarray, size: int) -> np.ndarray:
+    """
+    size x size moving average with reflected edges (as uniform_filter(mode='reflect')).
+
+    Separable: uniform_filter1d along rows, then a sum of shifted row slices down
+    the columns, which stays contiguous in memory and is several times faster
+    than filtering along axis 0.
+    """
+    rows = uniform_filter1d(image, size, axis=1, mode='reflect')
+    half = size // 2
+    padded = np.pad(rows, ((half, size - 1 - half), (0, 0)), mode='symmetric')
+    out = padded[:image.shape[0]].copy()
+    for k in range(1, size):
+        out += padded[k:k + image.shape[0]]
+    out /= size
+    return out
+
+
+def lee_filter(image: np.ndarray, size: int = DEFAULT_WINDOW, looks: float = S1_GRD_LOOKS,
+               db_transform: Optional[Tuple[float, float]] = None) -> np.ndarray:
+    """
+    Lee filter for multiplicative speckle.
+
+    Each pixel moves from the local mean towards its own value in proportion to
+    how much of the local variance exceeds the speckle variance (mean^2 / looks).
+    Local moments come from separable box filters; NaN pixels are left out of the
+    moments and stay NaN.
+
+    Args:
+        image: 2D backscatter
+        size: Window edge in pixels
+        looks: Equivalent number of looks of the product
+        db_transform: (scale, offset) with dB = value * scale + offset when the image
+            is in (scaled) decibels; it is filtered in linear power and mapped back.
+            None if the image is already linear power.
+
+    Returns:
+        Filtered float32 image
+    """
+    x = np.array(image, dtype=np.float32)
+    if db_transform is not None:
+        # 10^(dB / 10) as one exp
+        x *= np.float32(db_transform[0] * LN10_OVER_10)
+        x += np.float32(db_transform[1] * LN10_OVER_10)
+        np.exp(x, out=x)
+
+    valid = np.isfinite(x)
+    all_valid = valid.all()
+    if all_valid:
+        mean = box_mean(x, size)
+        sq_mean = box_mean(x * x, size)
+    else:
+        x[~valid] = 0.0
+        count = np.maximum(box_mean(valid.astype(np.float32), size), np.float32(1e-6))
+        mean = box_mean(x, size) / count
+        sq_mean = box_mean(x * x, size) / count
+
+    variance = np.maximum(sq_mean - mean * mean, 0.0)
+    speckle = np.float32(1.0 / looks)
+    signal_variance = np.maximum((variance - mean * mean * speckle) / (1 + speckle), 0.0)
+    weight = np.divide(signal_variance, variance, out=np.zeros_like(variance), where=variance > 0)
+    out = mean + weight * (x - mean)
+
+    if db_transform is not None:
+        np.log10(np.maximum(out, np.finfo(np.float32).tiny), out=out)
+        out *= np.float32(10.0 / db_transform[0])
+        out -= np.float32(db_transform[1] / db_transform[0])
+    if not all_valid:
+        out[~valid] = np.nan
+    return out
+
+
+class LeeFilteredSource(RasterSource):
+    """
+    Reads another source through a Lee filter.
+
+    Every window is read with a halo of size // 2 pixels (clamped to the raster),
+    so block-by-block output equals filtering the whole scene at once.
+    """
+
+    def __init__(self, source: RasterSource, size: int = DEFAULT_WINDOW, looks: float = S1_GRD_LOOKS,
+                 db_transform: Optional[Tuple[float, float]] = None):
+        self.source = source
+        self.size = size
+        self.looks = looks
+        self.db_transform = db_transform
+        self.shape = source.shape
+
+    def read(self, row_off, col_off, height, width):
+        halo = self.size // 2
+        h, w = self.shape
+        top, left = max(row_off - halo, 0), max(col_off - halo, 0)
+        bottom, right = min(row_off + height + halo, h), min(col_off + width + halo, w)
+        block = self.source.read(top, left, bottom - top, right - left)
+        filtered = lee_filter(block, self.size, self.looks, self.db_transform)
+        return filtered[row_off - top:row_off - top + height, col_off - left:col_off - left + width]
+
+    def close(self):
+        self.source.close()
+
+
+def despeckle(image: np.ndarray, size: int = DEFAULT_WINDOW, looks: float = S1_GRD_LOOKS,
+              db_transform: Optional[Tuple[float, float]] = None, block_rows: int = 1024) -> np.ndarray:
+    """
+    Lee-filter an in-memory or memory-mapped 2D array in row strips.
+
+    Returns:
+        Filtered float32 array
+    """
+    source = LeeFilteredSource(ArraySource(image), size, looks, db_transform)
+    out = np.empty(image.shape, dtype=np.float32)
+    for row_off, height in iter_blocks(image.shape, block_rows):
+        out[row_off:row_off + height] = source.read(row_off, 0, height, image.shape[1])
+    return out
+
+
+def benchmark(shape: Tuple[int, int] = (4096, 4096), size: int = DEFAULT_WINDOW,
+              block_rows: int = 1024, repeats: int = 3) -> float:
+    """
+    Throughput of the chunked Lee filter on synthetic speckled dB data.
+
+    Returns:
+        Best-of-repeats megapixels per second
+    """
+    rng = np.random.default_rng(0)
+    image = (10 * np.log10(rng.gamma(S1_GRD_LOOKS, 1 / S1_GRD_LOOKS, shape)) - 12).astype(np.float32)
+    best = np.inf
+    for _ in range(repeats):
+        start = time.perf_counter()
+        despeckle(image, size, db_transform=(1.0, 0.0), block_rows=block_rows)
+        best = min(best, time.perf_counter() - start)
+    return image.size / 1e6 / best
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark the chunked Lee speckle filter')
+    parser.add_argument('--rows', type=int, default=4096)
+    parser.add_argument('--cols', type=int, default=4096)
+    parser.add_argument('--window', type=int, default=DEFAULT_WINDOW)
+    parser.add_argument('--block-rows', type=int, default=1024)
+    args = parser.parse_args()
+
+    mps = benchmark((args.rows, args.cols), args.window, args.block_rows)
+    print(f"Lee {args.window}x{args.window}, {args.block_rows}-row blocks: {mps:.1f} MP/s")
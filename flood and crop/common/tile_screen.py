@@ -0,0 +1,129 @@
+"""
+Cheap per-tile pre-screen: nodata fraction, texture and change magnitude of every tile
+"""
+import logging
+from dataclasses import dataclass
+from typing import Callable, Dict, Optional, Tuple
+
+import numpy as np
+
+log = logging.getLogger(__name__)
+
+
+def window_sums(image: np.ndarray, tile_size: int, stride: int) -> np.ndarray:
+    """
+    Sum of every tile of an image, from one summed-area table.
+
+    Tiles are laid out as in window_views: origins range(0, size - tile_size + 1, stride).
+
+    Returns:
+        (tile_rows, tile_cols) float64 sums
+    """
+    h, w = image.shape
+    table = np.zeros((h + 1, w + 1), dtype=np.float64)
+    np.cumsum(image, axis=0, dtype=np.float64, out=table[1:, 1:])
+    np.cumsum(table[1:, 1:], axis=1, out=table[1:, 1:])
+    rows = np.arange(0, h - tile_size + 1, stride)
+    cols = np.arange(0, w - tile_size + 1, stride)
+    top, bottom = rows[:, None], rows[:, None] + tile_size
+    left, right = cols[None, :], cols[None, :] + tile_size
+    return table[bottom, right] - table[top, right] - table[bottom, left] + table[top, left]
+
+
+@dataclass
+class TileScreen:
+    """
+    Thresholds that separate informative tiles from nodata and featureless ones.
+
+    Attributes:
+        max_nodata: Tiles with at least this fraction of nodata/padding are dropped
+        min_std, min_change: Tiles below both (std of the 0-1 normalized input, mean
+            absolute change) are featureless, e.g. calm open water or ocean
+        low_weight: Sampling weight of featureless tiles in training
+    """
+    max_nodata: float = 0.95
+    min_std: float = 0.01
+    min_change: float = 0.02
+    low_weight: float = 0.25
+
+    def measure(self, image: np.ndarray, valid: np.ndarray, change: np.ndarray,
+                tile_size: int, stride: int) -> Dict[str, np.ndarray]:
+        """
+        Per-tile statistics of a block, over its valid pixels.
+
+        Args:
+            image: Normalized input (e.g. the during-flood scene)
+            valid: 1 where the pixel holds data, 0 for nodata or padding
+            change: Change image (e.g. flood - pre)
+            tile_size: Tile edge in pixels
+            stride: Step between tiles
+
+        Returns:
+            Dict of (tile_rows, tile_cols) arrays: nodata fraction, std and mean |change|
+        """
+        valid = valid > 0
+        count = window_sums(valid, tile_size, stride)
+        n = np.maximum(count, 1.0)
+        # np.where rather than a product, so NaN nodata does not leak into the sums
+        masked = np.where(valid, image, 0).astype(np.float32)
+        mean = window_sums(masked, tile_size, stride) / n
+        variance = np.maximum(window_sums(masked * masked, tile_size, stride) / n - mean * mean, 0.0)
+        return {
+            'nodata': 1.0 - count / (tile_size * tile_size),
+            'std': np.sqrt(variance),
+            'change': window_sums(np.where(valid, np.abs(change), 0), tile_size, stride) / n
+        }
+
+    def skip(self, stats: Dict[str, np.ndarray]) -> np.ndarray:
+        """Tiles a model need not run on: mostly nodata, or featureless"""
+        featureless = (stats['std'] < self.min_std) & (stats['change'] < self.min_change)
+        return (stats['nodata'] >= self.max_nodata) | featureless
+
+    def weights(self, stats: Dict[str, np.ndarray], positives: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Training weight of every tile.
+
+        Args:
+            stats: Output of measure
+            positives: Tiles that contain the target class; always kept at full weight
+
+        Returns:
+            float32 weights: 0 to drop (mostly nodata), low_weight if featureless, else 1
+        """
+        weights = np.ones(stats['nodata'].shape, dtype=np.float32)
+        weights[(stats['std'] < self.min_std) & (stats['change'] < self.min_change)] = self.low_weight
+        weights[stats['nodata'] >= self.max_nodata] = 0.0
+        if positives is not None:
+            weights[positives] = 1.0
+        return weights
+
+
+def stitch_tiles(predict: Callable[[int, int], np.ndarray], shape: Tuple[int, int], tile_size: int,
+                 stride: int, skip: Optional[np.ndarray] = None, background: float = 0.0) -> np.ndarray:
+    """
+    Average overlapping per-tile predictions into one full-size map.
+
+    Skipped tiles contribute neither a prediction nor a count, so they never dilute
+    the average of the model tiles they overlap.
+
+    Args:
+        predict: Called with a tile origin (row, col); returns its (tile_size, tile_size) prediction
+        shape: (height, width) of the output
+        tile_size: Tile edge in pixels
+        stride: Step between tiles
+        skip: (tile_rows, tile_cols) tiles to leave out, e.g. from TileScreen.skip
+        background: Value of pixels no model tile covers
+
+    Returns:
+        (height, width) float32 map
+    """
+    h, w = shape
+    pred_sum = np.zeros((h, w), dtype=np.float32)
+    pred_count = np.zeros((h, w), dtype=np.float32)
+    for i in range(0, h - tile_size + 1, stride):
+        for j in range(0, w - tile_size + 1, stride):
+            if skip is not None and skip[i // stride, j // stride]:
+                continue
+            pred_sum[i:i + tile_size, j:j + tile_size] += predict(i, j)
+            pred_count[i:i + tile_size, j:j + tile_size] += 1
+    return np.where(pred_count > 0, pred_sum / np.maximum(pred_count, 1), background).astype(np.float32)
@@ -0,0 +1,320 @@
+"""
+Preallocated on-disk tile store with per-split index arrays
+"""
+import os
+import json
+import logging
+from collections import OrderedDict
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+try:
+    import lz4.frame
+except ImportError:  # LZ4 chunk encoding is optional; raw fields are memory-mapped
+    lz4 = None
+
+log = logging.getLogger(__name__)
+
+MANIFEST = 'manifest.json'
+# Tiles read per chunk when iterating over a split
+READ_CHUNK = 256
+# Tiles per LZ4 frame: small enough that a random tile read decompresses little else
+LZ4_CHUNK_TILES = 16
+# Decompressed LZ4 chunks kept per field
+LZ4_CACHE_CHUNKS = 8
+
+
+def _take(array, rows: np.ndarray) -> np.ndarray:
+    """Copy rows of a tile array, reading each contiguous run of sorted rows once"""
+    order = np.argsort(rows, kind='stable')
+    out = np.empty((len(rows),) + tuple(array.shape[1:]), dtype=array.dtype)
+    out[order] = array[rows[order]]
+    return out
+
+
+class Lz4TileArray:
+    """
+    Read-only tile array stored as LZ4 frames of chunk_tiles tiles each.
+
+    <field>.lz4 holds the frames back to back; <field>_offsets.npy their byte offsets.
+    A few decompressed chunks are cached, so sequential reads decompress each frame once.
+    """
+
+    def __init__(self, path: str, offsets_path: str, tile_shape: Tuple[int, ...], dtype,
+                 chunk_tiles: int, count: int, cache_chunks: int = LZ4_CACHE_CHUNKS):
+        if lz4 is None:
+            raise ImportError("lz4 is required to read LZ4-encoded tile stores (pip install lz4)")
+        self.path = path
+        self.offsets = np.load(offsets_path)
+        self.tile_shape = tuple(tile_shape)
+        self.dtype = np.dtype(dtype)
+        self.chunk_tiles = chunk_tiles
+        self.count = count
+        self.cache_chunks = cache_chunks
+        self._cache: 'OrderedDict[int, np.ndarray]' = OrderedDict()
+
+    @property
+    def shape(self) -> Tuple[int, ...]:
+        return (self.count,) + self.tile_shape
+
+    def __len__(self) -> int:
+        return self.count
+
+    def _chunk(self, k: int) -> np.ndarray:
+        if k in self._cache:
+            self._cache.move_to_end(k)
+            return self._cache[k]
+        with open(self.path, 'rb') as f:
+            f.seek(self.offsets[k])
+            frame = f.read(self.offsets[k + 1] - self.offsets[k])
+        chunk = np.frombuffer(lz4.frame.decompress(frame), dtype=self.dtype).reshape((-1,) + self.tile_shape)
+        self._cache[k] = chunk
+        if len(self._cache) > self.cache_chunks:
+            self._cache.popitem(last=False)
+        return chunk
+
+    def __getitem__(self, rows):
+        if np.isscalar(rows):
+            row = int(rows)
+            return self._chunk(row // self.chunk_tiles)[row % self.chunk_tiles]
+        rows = np.arange(self.count)[rows] if isinstance(rows, slice) else np.asarray(rows)
+        out = np.empty((len(rows),) + self.tile_shape, dtype=self.dtype)
+        for i, row in enumerate(rows):
+            out[i] = self._chunk(int(row) // self.chunk_tiles)[int(row) % self.chunk_tiles]
+        return out
+
+
+class SplitField:
+    """
+    One field of a split, read lazily from the store.
+
+    Indexes like an (n_tiles, *tile_shape) array: integers, slices and index arrays
+    return copies of just the requested tiles.
+    """
+
+    def __init__(self, array, indices: np.ndarray):
+        self.array = array
+        self.indices = indices
+
+    @property
+    def shape(self) -> Tuple[int, ...]:
+        return (len(self.indices),) + tuple(self.array.shape[1:])
+
+    def __len__(self) -> int:
+        return len(self.indices)
+
+    def __getitem__(self, idx) -> np.ndarray:
+        rows = self.indices[idx]
+        if np.isscalar(rows):
+            return np.array(self.array[int(rows)])
+        return _take(self.array, rows)
+
+    def __iter__(self) -> Iterator[np.ndarray]:
+        for start in range(0, len(self), READ_CHUNK):
+            yield from self[start:start + READ_CHUNK]
+
+
+class TileSplit:
+    """A named split of a tile store; split[field] is a lazy SplitField."""
+
+    def __init__(self, store: 'TileStore', indices: np.ndarray):
+        self.store = store
+        self.indices = indices
+
+    def __len__(self) -> int:
+        return len(self.indices)
+
+    def keys(self):
+        return self.store.fields.keys()
+
+    def __getitem__(self, name: str) -> SplitField:
+        return SplitField(self.store.arrays[name], self.indices)
+
+
+class TileStore:
+    """
+    Fixed-capacity tile arrays, one memory-mapped .npy file per field.
+
+    Tiles are written in place at a cursor (no list of tiles, no np.stack) and
+    train/val splits are index arrays into the store rather than shuffled copies.
+    Fields can be re-encoded as LZ4 chunks after writing. manifest.json records
+    fields, shapes, encodings, the number of tiles written and the splits.
+    """
+
+    def __init__(self, root: str, fields: Dict[str, Tuple[int, ...]], capacity: int,
+                 dtype: str = 'float32', mode: str = 'r', encodings: Optional[Dict[str, dict]] = None,
+                 count: int = 0):
+        self.root = root
+        self.fields = {name: tuple(shape) for name, shape in fields.items()}
+        self.capacity = capacity
+        self.dtype = np.dtype(dtype)
+        self.count = count
+        # Write cursor bound: the capacity, or the end of the shard being written
+        self.limit = capacity
+        self.splits: Dict[str, int] = {}
+        # Where each source's tiles landed: [{'event': ..., 'offset': ..., 'count': ...}]
+        self.shards: List[Dict[str, Any]] = []
+        self.encodings = encodings or {name: {'encoding': 'raw', 'file': f"{name}.npy"} for name in self.fields}
+        self.arrays = {name: self._open_field(name, mode) for name in self.fields}
+
+    def _field_path(self, name: str) -> str:
+        return os.path.join(self.root, self.encodings[name]['file'])
+
+    def _index_path(self, split: str) -> str:
+        return os.path.join(self.root, f"{split}_index.npy")
+
+    def _open_field(self, name: str, mode: str):
+        encoding = self.encodings[name]
+        if encoding['encoding'] == 'lz4':
+            return Lz4TileArray(os.path.join(self.root, encoding['file']),
+                                os.path.join(self.root, encoding['offsets']),
+                                self.fields[name], self.dtype, encoding['chunk_tiles'], self.count)
+        if mode == 'w+':
+            return np.lib.format.open_memmap(self._field_path(name), mode=mode, dtype=self.dtype,
+                                             shape=(self.capacity,) + self.fields[name])
+        return np.load(self._field_path(name), mmap_mode=mode)
+
+    @classmethod
+    def create(cls, root: str, fields: Dict[str, Tuple[int, ...]], capacity: int,
+               dtype: str = 'float32') -> 'TileStore':
+        """
+        Preallocate a store for capacity tiles.
+
+        Args:
+            root: Store directory
+            fields: Field name -> per-tile shape
+            capacity: Maximum number of tiles
+            dtype: Element type of every field
+
+        Returns:
+            Writable store
+        """
+        os.makedirs(root, exist_ok=True)
+        # A store being rewritten is unreadable until its next flush
+        if cls.exists(root):
+            os.remove(os.path.join(root, MANIFEST))
+        return cls(root, fields, capacity, dtype, mode='w+')
+
+    @classmethod
+    def open(cls, root: str, mode: str = 'r') -> 'TileStore':
+        """Open a flushed store; only the manifest and split indices are read up front"""
+        with open(os.path.join(root, MANIFEST)) as f:
+            manifest = json.load(f)
+        fields = manifest['fields']
+        store = cls(root, {name: field['shape'] for name, field in fields.items()},
+                    manifest['capacity'], manifest['dtype'], mode=mode,
+                    encodings={name: {key: value for key, value in field.items() if key != 'shape'}
+                               for name, field in fields.items()},
+                    count=manifest['count'])
+        store.splits = manifest['splits']
+        store.shards = manifest.get('shards', [])
+        return store
+
+    @staticmethod
+    def exists(root: str) -> bool:
+        return os.path.exists(os.path.join(root, MANIFEST))
+
+    def reserve(self, n: int) -> int:
+        """Claim the next n tile slots; returns the first slot"""
+        if self.count + n > self.limit:
+            raise ValueError(f"Tile store full: {self.count} + {n} > {self.limit}")
+        start = self.count
+        self.count += n
+        return start
+
+    def rollback(self, count: int) -> None:
+        """Forget tiles written after slot count (e.g. from a failed scene)"""
+        self.count = count
+
+    def seek(self, start: int, stop: int) -> None:
+        """Confine writes to slots [start, stop), e.g. one worker's shard of a shared store"""
+        self.count = start
+        self.limit = stop
+
+    def merge_shards(self, shards: Sequence[Dict[str, Any]]) -> None:
+        """
+        Adopt shards written into their reserved slot ranges, closing the gaps they left.
+
+        Args:
+            shards: Dicts with event, offset and count, in the order tiles should appear;
+                a shard that wrote fewer tiles than it reserved is moved down, chunk by chunk
+        """
+        self.shards = []
+        cursor = 0
+        for shard in shards:
+            offset, count = shard['offset'], shard['count']
+            if offset != cursor:
+                for start in range(0, count, READ_CHUNK):
+                    n = min(READ_CHUNK, count - start)
+                    for array in self.arrays.values():
+                        array[cursor + start:cursor + start + n] = array[offset + start:offset + start + n]
+            self.shards.append({'event': shard['event'], 'offset': cursor, 'count': count})
+            cursor += count
+        self.count = cursor
+        self.limit = self.capacity
+
+    def set_split(self, split: str, indices: Sequence[int]) -> None:
+        indices = np.asarray(indices, dtype=np.int64)
+        np.save(self._index_path(split), indices)
+        self.splits[split] = int(len(indices))
+
+    def split_indices(self, split: str) -> np.ndarray:
+        return np.load(self._index_path(split))
+
+    def split(self, split: str) -> TileSplit:
+        """Lazy view of a split; tiles are read from disk only when indexed"""
+        return TileSplit(self, self.split_indices(split))
+
+    def compress(self, chunk_tiles: int = LZ4_CHUNK_TILES) -> None:
+        """
+        Re-encode the raw fields as LZ4 frames of chunk_tiles tiles, dropping the raw files.
+
+        Args:
+            chunk_tiles: Tiles per frame
+        """
+        if lz4 is None:
+            raise ImportError("lz4 is required to compress a tile store (pip install lz4)")
+        for name, encoding in self.encodings.items():
+            if encoding['encoding'] != 'raw':
+                continue
+            raw_path = self._field_path(name)
+            array = self.arrays[name]
+            offsets = [0]
+            with open(os.path.join(self.root, f"{name}.lz4"), 'wb') as f:
+                for start in range(0, self.count, chunk_tiles):
+                    frame = lz4.frame.compress(np.ascontiguousarray(array[start:start + chunk_tiles]).tobytes())
+                    f.write(frame)
+                    offsets.append(offsets[-1] + len(frame))
+            np.save(os.path.join(self.root, f"{name}_offsets.npy"), np.asarray(offsets, dtype=np.int64))
+
+            # Release the memory map before removing its file
+            del array
+            self.arrays[name] = None
+            os.remove(raw_path)
+            self.encodings[name] = {'encoding': 'lz4', 'file': f"{name}.lz4", 'offsets': f"{name}_offsets.npy",
+                                    'chunk_tiles': chunk_tiles}
+            self.arrays[name] = self._open_field(name, 'r')
+        self.capacity = self.limit = self.count
+        self.flush()
+
+    def flush(self, write_manifest: bool = True) -> None:
+        """Flush the memory maps and (unless a shard writer calls it) write the manifest"""
+        for array in self.arrays.values():
+            if isinstance(array, np.memmap):
+                array.flush()
+        if not write_manifest:
+            return
+        manifest = {
+            'fields': {name: dict({'shape': list(shape)}, **self.encodings[name])
+                       for name, shape in self.fields.items()},
+            'dtype': self.dtype.str,
+            'capacity': self.capacity,
+            'count': self.count,
+            'splits': self.splits,
+            'shards': self.shards
+        }
+        tmp_path = os.path.join(self.root, f"{MANIFEST}.tmp")
+        with open(tmp_path, 'w') as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(tmp_path, os.path.join(self.root, MANIFEST))
@@ -14,6 +14,7 @@ Key Features for the Narrative:
 """
 
 import os
+import sys
 import json
 import time
 import logging
@@ -22,7 +23,6 @@ import datetime as dt
 
 import ee
 import numpy as np
-import requests
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
@@ -32,6 +32,12 @@ from torch.utils.data import Dataset, DataLoader
 from torchvision import transforms
 from transformers import SegformerForSemanticSegmentation, SegformerConfig
 
+sys.path.append('..')
+from common.download import Downloader, EarthEngineTransport
+from common.download_cache import DownloadCache
+from common.gridding import plan_grid, fetch_mosaic
+from common.raster_io import iter_blocks
+
 # --- Configuration -----------------------------------------------------------
 warnings.filterwarnings("ignore")
 logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
@@ -39,21 +45,23 @@ log = logging.getLogger(__name__)
 
 GCP_PROJECT = "hyperion-472805"
 
-# --- START: FIX FOR GEE REQUEST SIZE ERROR ---
-# We are reducing the AOI size and increasing the scale to fit within GEE's download limits.
-BANGLADESH_AOI = [89.2, 23.2, 89.35, 23.35]  # Smaller, focused Jessore Region
-SCALE = 30 # Increased scale from 10m to 30m to reduce data volume
-# --- END: FIX FOR GEE REQUEST SIZE ERROR ---
+# The AOI is split into request-sized tiles automatically, so the full district
+# can be pulled at Sentinel-2's native 10 m resolution.
+BANGLADESH_AOI = [88.9, 22.8, 89.5, 23.35]  # Jessore District
+SCALE = 10
 
 START_DATE = '2023-11-01'
 END_DATE = '2024-02-28' # Dry season, ideal for stress analysis
 CLOUD_COVER = 15
+# Rows per strip when normalizing the mosaic, so the full scene never sits in memory
+NORMALIZE_BLOCK_ROWS = 1024
 
 # --- Directory Setup (Unique for this demo) ----------------------------------
 def ensure(path):
     os.makedirs(path, exist_ok=True)
 
 DATA_RAW_DIR = "crop_demo_data_raw"
+DOWNLOAD_CACHE_DIR = "crop_demo_download_cache"
 DATA_PROC_DIR = "crop_demo_data_processed"
 MODELS_DIR = "crop_demo_models"
 ASSETS_DIR = "crop_demo_assets"
@@ -74,48 +82,69 @@ def pull_data():
         log.error("Please ensure you have run 'earthengine authenticate' and 'earthengine set_project hyperion-472805'")
         return False
 
-    aoi = ee.Geometry.Rectangle(BANGLADESH_AOI)
+    s2_band_names = ['B4', 'B3', 'B2', 'B5', 'B8', 'B11', 'B12'] # R, G, B, Red Edge, NIR, SWIR
 
-    s2_collection = (ee.ImageCollection('COPERNICUS/S2_SR_HARMONIZED')
-                     .filterBounds(aoi)
-                     .filterDate(START_DATE, END_DATE)
-                     .filter(ee.Filter.lt('CLOUDY_PIXEL_PERCENTAGE', CLOUD_COVER)))
+    def build_image():
+        # Only runs on a cache miss, so cached runs skip the collection query as well
+        aoi = ee.Geometry.Rectangle(BANGLADESH_AOI)
 
-    if s2_collection.size().getInfo() == 0:
-        log.error("No suitable Sentinel-2 images found. Try adjusting dates or cloud cover.")
-        return False
+        s2_collection = (ee.ImageCollection('COPERNICUS/S2_SR_HARMONIZED')
+                         .filterBounds(aoi)
+                         .filterDate(START_DATE, END_DATE)
+                         .filter(ee.Filter.lt('CLOUDY_PIXEL_PERCENTAGE', CLOUD_COVER)))
 
-    best_s2_image = s2_collection.sort('CLOUDY_PIXEL_PERCENTAGE').first().clip(aoi)
-    
-    s2_bands = best_s2_image.select(['B4', 'B3', 'B2', 'B5', 'B8', 'B11', 'B12']) # R, G, B, Red Edge, NIR, SWIR
+        if s2_collection.size().getInfo() == 0:
+            log.error("No suitable Sentinel-2 images found. Try adjusting dates or cloud cover.")
+            return None
 
-    dem = ee.Image('USGS/SRTMGL1_003').clip(aoi)
-    slope = ee.Terrain.slope(dem)
+        best_s2_image = s2_collection.sort('CLOUDY_PIXEL_PERCENTAGE').first().clip(aoi)
+        s2_bands = best_s2_image.select(s2_band_names)
 
-    final_image = s2_bands.addBands(dem.rename('elevation')).addBands(slope.rename('slope'))
+        dem = ee.Image('USGS/SRTMGL1_003').clip(aoi)
+        slope = ee.Terrain.slope(dem)
+
+        return s2_bands.addBands(dem.rename('elevation')).addBands(slope.rename('slope'))
 
-    url = final_image.getDownloadURL({
-        'scale': SCALE,
-        'crs': 'EPSG:4326',
-        'region': aoi,
-        'format': 'NPY'
-    })
-    
     raw_path = os.path.join(DATA_RAW_DIR, "multimodal_jessore.npy")
-    with open(raw_path, "wb") as f:
-        f.write(requests.get(url).content)
-    
-    data_structured = np.load(raw_path, allow_pickle=True)
-    band_names = list(data_structured.dtype.names)
-    data_unpacked = np.stack([data_structured[band] for band in band_names], axis=-1).astype(np.float32)
-    
-    for i in range(data_unpacked.shape[-1]):
-        band_data = data_unpacked[:, :, i]
-        min_val, max_val = band_data.min(), band_data.max()
-        if max_val > min_val:
-            data_unpacked[:, :, i] = (band_data - min_val) / (max_val - min_val)
+    band_names = s2_band_names + ['elevation', 'slope']
+    layer = {
+        'name': "multimodal_jessore",
+        'grid': plan_grid(BANGLADESH_AOI, SCALE, n_bands=len(band_names)),
+        'out_path': raw_path,
+        'tile_dir': os.path.join(DATA_RAW_DIR, "tiles"),
+        'build': build_image,
+        'spec': {'collection': 'COPERNICUS/S2_SR_HARMONIZED', 'dates': [START_DATE, END_DATE],
+                 'max_cloud': CLOUD_COVER, 'bands': band_names}
+    }
+    # Tiles download in parallel; repeated runs with unchanged requests reuse the cached tiles
+    downloader = Downloader(EarthEngineTransport(), max_workers=8, cache=DownloadCache(DOWNLOAD_CACHE_DIR))
+    if fetch_mosaic(downloader, [layer])[layer['name']] is None:
+        log.error("Multi-modal download failed.")
+        return False
     
-    np.save(raw_path, data_unpacked)
+    # The mosaic is already a (rows, cols, bands) float32 array; per-band min/max in one pass over row strips
+    raw = np.load(raw_path, mmap_mode='r')
+    h, w, n_bands = raw.shape
+    min_val = np.full(n_bands, np.inf, dtype=raw.dtype)
+    max_val = np.full(n_bands, -np.inf, dtype=raw.dtype)
+    for row_off, height in iter_blocks((h, w), NORMALIZE_BLOCK_ROWS):
+        block = raw[row_off:row_off + height]
+        min_val = np.minimum(min_val, block.min(axis=(0, 1)))
+        max_val = np.maximum(max_val, block.max(axis=(0, 1)))
+    # Constant bands are left as they are
+    scaled = max_val > min_val
+    offset = np.where(scaled, min_val, 0).astype(raw.dtype)
+    scale = np.where(scaled, max_val - min_val, 1).astype(raw.dtype)
+
+    # Normalize strip by strip into a new memory-mapped file, then swap it in
+    tmp_path = f"{raw_path}.tmp.npy"
+    data_unpacked = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=raw.dtype, shape=raw.shape)
+    for row_off, height in iter_blocks((h, w), NORMALIZE_BLOCK_ROWS):
+        data_unpacked[row_off:row_off + height] = (raw[row_off:row_off + height] - offset) / scale
+    data_unpacked.flush()
+    del data_unpacked, raw
+    os.replace(tmp_path, raw_path)
+    data_unpacked = np.load(raw_path, mmap_mode='r')
 
     log.info(f"Successfully downloaded and unpacked multi-modal data to {raw_path} with shape {data_unpacked.shape}")
     
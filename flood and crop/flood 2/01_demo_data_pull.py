@@ -4,12 +4,16 @@ Pulls multi-modal data (SAR, Optical, DEM) for a single, high-quality
 flood event in Bangladesh for the investor demo.
 """
 import os
+import sys
 import json
 import logging
-import requests
 import ee
 from datetime import datetime
 
+sys.path.append('..')
+from common.download import DownloadJob, Downloader, EarthEngineTransport, region_coordinates
+from common.download_cache import DownloadCache
+
 # --- Configuration -----------------------------------
 logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
 log = logging.getLogger(__name__)
@@ -22,6 +26,7 @@ def ensure_dir(path):
     os.makedirs(path, exist_ok=True)
 
 DATA_ROOT = "demo_data_raw"
+CACHE_ROOT = "demo_download_cache"
 ensure_dir(DATA_ROOT)
 
 # --- Main Data Pull Logic ----------------------------
@@ -62,24 +67,33 @@ def pull_demo_data():
     dem = ee.Image('USGS/SRTMGL1_003').clip(aoi)
 
     # --- Download all data layers ---
+    bands = {'s1_pre': ['VV', 'VH'], 's1_flood': ['VV', 'VH'], 's2_flood': ['B4', 'B3', 'B2', 'B8'], 'dem': ['elevation']}
     datasets = {
-        's1_pre': s1_pre.select(['VV', 'VH']),
-        's1_flood': s1_flood.select(['VV', 'VH']),
-        's2_flood': s2_flood.select(['B4', 'B3', 'B2', 'B8']), # R,G,B,NIR
-        'dem': dem.select('elevation')
+        's1_pre': s1_pre.select(bands['s1_pre']),
+        's1_flood': s1_flood.select(bands['s1_flood']),
+        's2_flood': s2_flood.select(bands['s2_flood']), # R,G,B,NIR
+        'dem': dem.select(bands['dem'])
     }
 
-    for name, image in datasets.items():
-        log.info(f"Downloading {name}...")
-        url = image.getDownloadURL({'scale': SCALE, 'crs': 'EPSG:4326', 'region': aoi, 'format': 'NPY'})
-        filepath = os.path.join(DATA_ROOT, f"{name}.npy")
-        
-        try:
-            with open(filepath, "wb") as f:
-                f.write(requests.get(url).content)
-            log.info(f" -> Successfully saved to {filepath}")
-        except Exception as e:
-            log.error(f" -> FAILED to download {name}. Reason: {e}")
+    dates = {'s1_pre': event['pre_date'], 's1_flood': event['flood_date'], 's2_flood': event['flood_date']}
+    jobs = [
+        DownloadJob(
+            name=name,
+            path=os.path.join(DATA_ROOT, f"{name}.npy"),
+            build=lambda image=image: image,
+            params={'scale': SCALE, 'crs': 'EPSG:4326', 'region': region_coordinates(event['aoi']), 'format': 'NPY'},
+            spec={'event': event['name'], 'layer': name, 'dates': dates.get(name), 'bands': bands[name]}
+        )
+        for name, image in datasets.items()
+    ]
+
+    # All layers download concurrently; unchanged requests come from the local cache
+    downloader = Downloader(EarthEngineTransport(), max_workers=len(jobs), cache=DownloadCache(CACHE_ROOT))
+    for name, filepath in downloader.fetch_all(jobs).items():
+        if filepath:
+            log.info(f" -> {name} saved to {filepath}")
+        else:
+            log.error(f" -> FAILED to download {name}")
 
     log.info("\nData acquisition for the demo is complete.")
 
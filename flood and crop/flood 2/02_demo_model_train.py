@@ -4,7 +4,9 @@ Trains the advanced Vision Transformer model and generates all assets
 for the investor demo.
 """
 import os
+import sys
 import json
+import argparse
 import time
 import datetime as dt
 import warnings
@@ -13,16 +15,24 @@ import torch.nn as nn
 import torch.nn.functional as F
 import numpy as np
 import matplotlib.pyplot as plt
-from torch.utils.data import DataLoader, Dataset
+from torch.utils.data import DataLoader, Dataset, WeightedRandomSampler
 from transformers import SegformerForSemanticSegmentation, SegformerConfig
 from PIL import Image
 from scipy.ndimage import sobel
 
+sys.path.append('..')
+from common.raster_io import ArraySource
+from common.raster_stats import scene_stats, save_stats, load_stats
+from common.speckle import despeckle, DEFAULT_WINDOW, SPECKLE_FILTERS
+from common.tile_screen import TileScreen, window_sums, stitch_tiles
+
 # --- Configuration & Safety Checks -------------------
 warnings.filterwarnings("ignore")
 DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
 DATA_ROOT = "demo_data_raw"
 ASSET_ROOT = "demo_assets"
+# Per-band normalization statistics, fitted at training and reused at inference
+STATS_PATH = os.path.join("demo_models", "normalization_stats.json")
 
 # Optional CRF Import
 try:
@@ -45,7 +55,7 @@ ensure_dir("demo_models")
 
 # --- The Dataset -------------------------------------
 class FloodDemoDataset(Dataset):
-    def __init__(self):
+    def __init__(self, fit_stats=True, speckle_filter='none', speckle_window=DEFAULT_WINDOW, screen=None):
         # Load structured arrays
         s1_pre_structured = np.load(os.path.join(DATA_ROOT, 's1_pre.npy'))
         s1_flood_structured = np.load(os.path.join(DATA_ROOT, 's1_flood.npy'))
@@ -60,24 +70,61 @@ class FloodDemoDataset(Dataset):
         # Load DEM and ensure it's float32
         self.dem = np.load(os.path.join(DATA_ROOT, 'dem.npy')).astype(np.float32)
 
-        # Simple normalization for demo
-        for arr in [self.s1_pre, self.s1_flood, self.s2_flood]:
-            min_val, max_val = arr.min(), arr.max()
-            if max_val > min_val:
-                arr[:] = (arr - min_val) / (max_val - min_val)
-        
-        # Normalize DEM separately (it might be 2D)
-        dem_min, dem_max = self.dem.min(), self.dem.max()
-        if dem_max > dem_min:
-            self.dem = (self.dem - dem_min) / (dem_max - dem_min)
+        # SAR nodata (NaN or the 0 fill of masked pixels), judged before filtering and normalization
+        self.valid = np.ones(self.s1_pre.shape[:2], dtype=bool)
+        for arr in [self.s1_pre, self.s1_flood]:
+            self.valid &= np.isfinite(arr[..., 0]) & (arr[..., 0] != 0)
+        self.screen = screen or TileScreen()
+
+        # Speckle filtering of the SAR bands (GRD backscatter in dB)
+        if speckle_filter == 'lee':
+            for arr in [self.s1_pre, self.s1_flood]:
+                for band in range(arr.shape[-1]):
+                    arr[..., band] = despeckle(arr[..., band], speckle_window, db_transform=(1.0, 0.0))
+
+        stats = self._band_stats(fit_stats)
+        # The pseudo-mask thresholds were tuned on min/max scaled layers, so it is built before normalizing
+        self.mask = self._create_pseudomask(stats)
+        # Robust per-band normalization (2nd-98th percentile to 0-1, outliers clipped)
+        self._normalize(stats)
+
+        self.tiles, self.masks, self.weights = self._create_tiles()
+
+    def _bands(self):
+        """Every band as a 2D view, keyed layer/index (the DEM might be 2D)"""
+        layers = {'s1_pre': self.s1_pre, 's1_flood': self.s1_flood, 's2_flood': self.s2_flood,
+                  'dem': self.dem if self.dem.ndim == 3 else self.dem[..., None]}
+        return {f"{name}/{i}": arr[..., i] for name, arr in layers.items() for i in range(arr.shape[-1])}
+
+    def _band_stats(self, fit_stats):
+        if fit_stats or not os.path.exists(STATS_PATH):
+            # One streaming pass per band; saved so inference scales inputs exactly as in training
+            stats = {band: scene_stats(ArraySource(arr)) for band, arr in self._bands().items()}
+            save_stats(STATS_PATH, {'demo': stats}, stats)
+            return stats
+        return load_stats(STATS_PATH)[1]
+
+    def _normalize(self, stats):
+        for band, arr in self._bands().items():
+            lo, hi = stats[band].robust_range()
+            if hi > lo:
+                arr -= lo
+                arr /= hi - lo
+                np.clip(arr, 0, 1, out=arr)
 
-        self.mask = self._create_pseudomask()
-        self.tiles, self.masks = self._create_tiles()
+    @staticmethod
+    def _minmax_scaled(stats, layer, band):
+        """A band scaled by its layer's overall min/max (all bands together), the pseudo-mask's reference scale"""
+        layer_stats = [band_stats for name, band_stats in stats.items() if name.startswith(f"{layer}/")]
+        lo = min(band_stats.min for band_stats in layer_stats)
+        hi = max(band_stats.max for band_stats in layer_stats)
+        return (band - lo) / (hi - lo) if hi > lo else band
 
-    def _create_pseudomask(self):
-        # Defensible pseudo-mask from the "Ultimate" script
-        vv = self.s1_flood[:,:,0]
-        nir, red = self.s2_flood[:,:,3], self.s2_flood[:,:,0]
+    def _create_pseudomask(self, stats):
+        # Defensible pseudo-mask from the "Ultimate" script, on the raw (unnormalized) layers
+        vv = self._minmax_scaled(stats, 's1_flood', self.s1_flood[:,:,0])
+        nir = self._minmax_scaled(stats, 's2_flood', self.s2_flood[:,:,3])
+        red = self._minmax_scaled(stats, 's2_flood', self.s2_flood[:,:,0])
         ndwi = (nir - red) / (nir + red + 1e-6)
         
         # Handle both 2D and 3D DEM arrays
@@ -85,24 +132,36 @@ class FloodDemoDataset(Dataset):
             dem_data = self.dem[:,:,0]
         else:
             dem_data = self.dem
-        slope = sobel(dem_data)
+        slope = sobel(self._minmax_scaled(stats, 'dem', dem_data))
 
         # Combine evidence: low SAR backscatter, high water index, flat terrain
         mask = (vv < 0.2) & (ndwi > 0.1) & (slope < 0.05)
         return mask.astype(np.int64)
 
+    def screen_tiles(self, tile_size=256, stride=128):
+        """Per-tile pre-screen statistics of the scene, on the (tile_rows, tile_cols) grid of the tile loops"""
+        sar_change = np.abs(self.s1_flood[:,:,0] - self.s1_pre[:,:,0])
+        return self.screen.measure(self.s1_flood[:,:,0], self.valid, sar_change, tile_size, stride)
+
     def _create_tiles(self, tile_size=256, stride=128):
         rgb = self.s2_flood[:,:,:3]
         sar_change = np.abs(self.s1_flood[:,:,0] - self.s1_pre[:,:,0])
         input_stack = np.stack([rgb[:,:,0], rgb[:,:,1], sar_change], axis=-1)
+        # Mostly-nodata tiles are dropped, featureless ones down-weighted; tiles with water keep full weight
+        tile_weights = self.screen.weights(self.screen_tiles(tile_size, stride),
+                                           window_sums(self.mask, tile_size, stride) > 0)
         
         h, w, _ = input_stack.shape
-        tiles, masks = [], []
+        tiles, masks, weights = [], [], []
         for i in range(0, h - tile_size + 1, stride):
             for j in range(0, w - tile_size + 1, stride):
+                weight = tile_weights[i // stride, j // stride]
+                if weight == 0:
+                    continue
                 tiles.append(input_stack[i:i+tile_size, j:j+tile_size, :])
                 masks.append(self.mask[i:i+tile_size, j:j+tile_size])
-        return tiles, masks
+                weights.append(weight)
+        return tiles, masks, np.asarray(weights, dtype=np.float32)
 
     def __len__(self):
         return len(self.tiles)
@@ -145,14 +204,17 @@ class HawkEYEModel(nn.Module):
         return logits
 
 # --- Training Loop ----------------------------------
-def train_model():
+def train_model(speckle_filter='none'):
     print("Starting HawkEYE Model Training...")
-    dataset = FloodDemoDataset()
+    dataset = FloodDemoDataset(speckle_filter=speckle_filter)
     train_size = int(0.8 * len(dataset))
     val_size = len(dataset) - train_size
     train_dataset, val_dataset = torch.utils.data.random_split(dataset, [train_size, val_size])
 
-    dl_tr = DataLoader(train_dataset, batch_size=2, shuffle=True)  # Reduced batch size
+    # Featureless tiles are drawn less often than informative ones
+    sampler = WeightedRandomSampler(torch.from_numpy(dataset.weights[train_dataset.indices]).double(),
+                                    num_samples=len(train_dataset), replacement=True)
+    dl_tr = DataLoader(train_dataset, batch_size=2, sampler=sampler)  # Reduced batch size
     dl_va = DataLoader(val_dataset, batch_size=2)
     
     net = HawkEYEModel().to(DEVICE)
@@ -207,10 +269,10 @@ def train_model():
     return net
 
 # --- Asset Generation -------------------------------
-def generate_assets(net):
+def generate_assets(net, speckle_filter='none'):
     print("\nGenerating final assets for demo...")
     net.eval()
-    dataset = FloodDemoDataset()
+    dataset = FloodDemoDataset(fit_stats=False, speckle_filter=speckle_filter)
     
     # Create full-size input
     rgb = dataset.s2_flood[:,:,:3]
@@ -221,32 +283,28 @@ def generate_assets(net):
     tile_size = 256
     stride = 128
     
-    # Initialize output arrays
-    pred_sum = np.zeros((h, w), dtype=np.float32)
-    pred_count = np.zeros((h, w), dtype=np.float32)
+    # Nodata and featureless tiles are background without running the model
+    skip = dataset.screen.skip(dataset.screen_tiles(tile_size, stride))
+    
+    def predict(i, j):
+        # Extract tile
+        rgb_tile = rgb[i:i+tile_size, j:j+tile_size]
+        sar_tile = sar_change[i:i+tile_size, j:j+tile_size]
+        input_tile = np.stack([rgb_tile[:,:,0], rgb_tile[:,:,1], sar_tile], axis=-1)
+        
+        # Convert to tensor
+        input_tensor = torch.tensor(input_tile).permute(2,0,1).float().unsqueeze(0).to(DEVICE)
+        
+        # Get prediction
+        logits = net(input_tensor)
+        probs = F.softmax(logits, dim=1)
+        return probs[0, 1].cpu().numpy()
     
+    # Average overlapping model tiles; pixels only skipped tiles cover are background
     with torch.no_grad():
-        for i in range(0, h - tile_size + 1, stride):
-            for j in range(0, w - tile_size + 1, stride):
-                # Extract tile
-                rgb_tile = rgb[i:i+tile_size, j:j+tile_size]
-                sar_tile = sar_change[i:i+tile_size, j:j+tile_size]
-                input_tile = np.stack([rgb_tile[:,:,0], rgb_tile[:,:,1], sar_tile], axis=-1)
-                
-                # Convert to tensor
-                input_tensor = torch.tensor(input_tile).permute(2,0,1).float().unsqueeze(0).to(DEVICE)
-                
-                # Get prediction
-                logits = net(input_tensor)
-                probs = F.softmax(logits, dim=1)
-                flood_prob = probs[0, 1].cpu().numpy()
-                
-                # Add to output with averaging for overlaps
-                pred_sum[i:i+tile_size, j:j+tile_size] += flood_prob
-                pred_count[i:i+tile_size, j:j+tile_size] += 1
+        mean_pred = stitch_tiles(predict, (h, w), tile_size, stride, skip=skip)
     
-    # Average predictions
-    mean_pred = pred_sum / (pred_count + 1e-6)
+    print(f"Pre-screen skipped {int(skip.sum())}/{skip.size} tiles")
     
     # Simple thresholding for final mask
     final_mask = (mean_pred > 0.5).astype(np.uint8)
@@ -312,14 +370,19 @@ def build_report(flood_percentage):
 
 # --- Main Execution ---------------------------------
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Train the HawkEYE demo model and generate its assets')
+    parser.add_argument('--speckle-filter', choices=SPECKLE_FILTERS, default='none',
+                        help='Speckle filter applied to the SAR bands before tiling')
+    args = parser.parse_args()
+    
     start_time = time.time()
     print("="*60)
     print("  STARTING HAWKEYE ULTIMATE DEMO PIPELINE  ")
     print("="*60)
     
     try:
-        model = train_model()
-        flood_percent = generate_assets(model)
+        model = train_model(args.speckle_filter)
+        flood_percent = generate_assets(model, args.speckle_filter)
         build_report(flood_percent)
         
         total_time = time.time() - start_time
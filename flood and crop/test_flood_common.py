@@ -0,0 +1,637 @@
+# test_flood_common.py
+# Offline tests for the shared flood/crop raster utilities
+# Uses small synthetic rasters so no Earth Engine access or downloads are needed
+
+import gzip
+import importlib.util
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pytest
+
+from common.download import DownloadJob, Downloader, HttpMirrorTransport
+from common.download_cache import DownloadCache, request_key
+from common.gridding import plan_grid, tile_jobs
+from common.raster_io import (ArraySource, BlockCacheSource, ScaledSource, ValidSource, aligned_shape,
+                              iter_aligned_tiles, iter_aligned_windows, open_raster)
+from common.raster_stats import RELATIVE_ACCURACY, BandStats, merge_stats, scene_stats
+from common.speckle import LeeFilteredSource, despeckle, lee_filter
+from common.tile_screen import stitch_tiles
+from common.tile_store import TileStore
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def test_skipped_tiles_do_not_dilute_overlapping_predictions():
+    tile_size, stride = 4, 2
+    shape = (10, 10)
+    skip = np.zeros((4, 4), dtype=bool)
+    skip[1, 1] = True
+    skip[3, 3] = True
+
+    def predict(i, j):
+        return np.full((tile_size, tile_size), 0.8, dtype=np.float32)
+
+    full = stitch_tiles(predict, shape, tile_size, stride)
+    screened = stitch_tiles(predict, shape, tile_size, stride, skip=skip)
+
+    # Every pixel a model tile covers keeps its averaged probability
+    assert np.allclose(screened[:8, :8], 0.8)
+    assert np.array_equal(screened[:, :6], full[:, :6])
+    # Pixels only the skipped corner tile covers are background
+    assert np.all(screened[8:, 8:] == 0.0)
+    assert np.allclose(full[8:, 8:], 0.8)
+
+
+def test_stitched_overlaps_average_only_model_tiles():
+    tile_size, stride = 4, 2
+    values = {(0, 0): 0.2, (0, 2): 0.6, (0, 4): 1.0}
+    skip = np.array([[False, False, True]])
+
+    stitched = stitch_tiles(lambda i, j: np.full((tile_size, tile_size), values[i, j]),
+                            (4, 8), tile_size, stride, skip=skip)
+
+    assert np.allclose(stitched[:, :2], 0.2)
+    assert np.allclose(stitched[:, 2:4], 0.4)
+    assert np.allclose(stitched[:, 4:6], 0.6)
+    assert np.all(stitched[:, 6:] == 0.0)
+
+
+class MirrorHandler(BaseHTTPRequestHandler):
+    """Serves server.files with Range support; server.failures[path] requests get a 503 first.
+
+    Paths in server.gzipped are always sent gzip-encoded, whatever the client accepts.
+    """
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.requests.append((self.path, self.headers.get('Range')))
+            server.active += 1
+            server.max_active = max(server.max_active, server.active)
+            fail = server.failures.get(self.path, 0) > 0
+            if fail:
+                server.failures[self.path] -= 1
+        try:
+            time.sleep(0.05)
+            if fail:
+                self.send_error(503)
+                return
+            if self.path not in server.files:
+                self.send_error(404)
+                return
+            body = server.files[self.path]
+            encoded = self.path in server.gzipped
+            if encoded:
+                body = gzip.compress(body)
+            start = int(self.headers['Range'][len('bytes='):].rstrip('-')) if self.headers.get('Range') else 0
+            self.send_response(206 if start else 200)
+            if encoded:
+                self.send_header('Content-Encoding', 'gzip')
+            if start:
+                self.send_header('Content-Range', f"bytes {start}-{len(body) - 1}/{len(body)}")
+            self.send_header('Content-Length', str(len(body) - start))
+            self.end_headers()
+            self.wfile.write(body[start:])
+        finally:
+            with server.lock:
+                server.active -= 1
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def mirror():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), MirrorHandler)
+    server.files, server.failures, server.requests = {}, {}, []
+    server.gzipped = set()
+    server.lock = threading.Lock()
+    server.active = server.max_active = 0
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_mirror_fetches_gridded_tiles_in_parallel_with_retry_and_resume(mirror, tmp_path):
+    grid = plan_grid([90.0, 23.0, 90.05, 23.05], scale=100, n_bands=1, max_request_bytes=4000)
+    jobs = tile_jobs(grid, 'dhaka/s1_pre', str(tmp_path / 'tiles'), build=lambda: None,
+                     spec={'dataset': 'S1'})
+    assert len(jobs) >= 4
+    rng = np.random.default_rng(0)
+    for tile in jobs:
+        # The mirror holds one file per tile under the layer name, as Earth Engine would return them
+        mirror.files[f"/mirror/dhaka/s1_pre/tile_{tile.row}_{tile.col}.npy"] = rng.bytes(2000 + tile.col)
+
+    first, second = list(jobs.values())[:2]
+    retried = '/mirror/' + first.name + '.npy'
+    mirror.failures[retried] = 1
+    resumed = '/mirror/' + second.name + '.npy'
+    (tmp_path / 'tiles').mkdir()
+    with open(f"{second.path}.part", 'wb') as f:
+        f.write(mirror.files[resumed][:700])
+
+    downloader = Downloader(HttpMirrorTransport(f"http://127.0.0.1:{mirror.server_port}/mirror/"),
+                            max_workers=4, backoff=0.01)
+    results = downloader.fetch_all(jobs.values())
+
+    for tile, job in jobs.items():
+        assert results[job.name] == job.path
+        with open(job.path, 'rb') as f:
+            assert f.read() == mirror.files[f"/mirror/dhaka/s1_pre/tile_{tile.row}_{tile.col}.npy"]
+    assert mirror.max_active > 1
+    assert [path for path, _ in mirror.requests].count(retried) == 2
+    assert (resumed, 'bytes=700-') in mirror.requests
+
+
+def test_mirror_decodes_a_gzipped_layer_and_restarts_its_resume(mirror, tmp_path):
+    """A mirror that compresses despite Accept-Encoding: identity still yields the plain layer."""
+    layer = bytes(range(256)) * 40
+    mirror.files['/mirror/s1_pre.npy'] = layer
+    mirror.gzipped.add('/mirror/s1_pre.npy')
+    job = DownloadJob('s1_pre', str(tmp_path / 's1_pre.npy'))
+    with open(f"{job.path}.part", 'wb') as f:
+        f.write(layer[:700])
+
+    transport = HttpMirrorTransport(f"http://127.0.0.1:{mirror.server_port}/mirror/")
+    assert Downloader(transport, retries=0, backoff=0.01).fetch(job) == job.path
+
+    with open(job.path, 'rb') as f:
+        assert f.read() == layer
+    # The encoded tail cannot be appended to the plain partial file, so the layer is fetched whole
+    assert mirror.requests == [('/mirror/s1_pre.npy', 'bytes=700-'), ('/mirror/s1_pre.npy', None)]
+
+
+def test_mirror_identity_is_part_of_the_cache_key(mirror, tmp_path):
+    mirror.files['/a/s1_pre.npy'] = b'from mirror a'
+    mirror.files['/b/s1_pre.npy'] = b'from mirror b'
+    cache = DownloadCache(str(tmp_path / 'cache'))
+    job = DownloadJob('s1_pre', str(tmp_path / 's1_pre.npy'), params={'scale': 10}, spec={'dataset': 'S1'})
+
+    for base, expected in (('a', b'from mirror a'), ('b', b'from mirror b'), ('a', b'from mirror a')):
+        transport = HttpMirrorTransport(f"http://127.0.0.1:{mirror.server_port}/{base}")
+        Downloader(transport, backoff=0.01, cache=cache).fetch(job)
+        with open(job.path, 'rb') as f:
+            assert f.read() == expected
+    # The third fetch is a cache hit
+    assert [path for path, _ in mirror.requests] == ['/a/s1_pre.npy', '/b/s1_pre.npy']
+
+
+def test_tile_jobs_build_their_layer_once(tmp_path):
+    calls = []
+
+    def build():
+        calls.append(1)
+        time.sleep(0.01)
+        if len(calls) == 1:
+            raise RuntimeError('transient getInfo failure')
+        return object()
+
+    grid = plan_grid([90.0, 23.0, 90.05, 23.05], scale=100, n_bands=1, max_request_bytes=4000)
+    jobs = list(tile_jobs(grid, 'dhaka/s1_pre', str(tmp_path), build, {'dataset': 'S1'}).values())
+    with pytest.raises(RuntimeError):
+        jobs[0].build()
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        images = list(pool.map(lambda job: job.build(), jobs))
+
+    assert len(calls) == 2
+    assert all(image is images[0] for image in images)
+
+
+def test_request_key_ignores_spec_ordering():
+    spec = {'spec': {'dataset': 'S1', 'bands': ['VV', 'VH'], 'dates': ['2024-07-01', '2024-07-15']},
+            'params': {'scale': 10, 'format': 'NPY'}}
+    reordered = {'params': {'format': 'NPY', 'scale': 10},
+                 'spec': {'dates': ['2024-07-01', '2024-07-15'], 'bands': ['VV', 'VH'], 'dataset': 'S1'}}
+    assert request_key(spec) == request_key(reordered)
+    assert request_key(spec) != request_key(dict(spec, params={'scale': 20, 'format': 'NPY'}))
+
+
+def _commit(cache, key, data):
+    part = cache.partial_path(key)
+    with open(part, 'wb') as f:
+        f.write(data)
+    return cache.commit(key, part, {'dataset': 'S1'})
+
+
+def test_cache_hits_misses_and_eviction(tmp_path):
+    root = str(tmp_path / 'cache')
+    cache = DownloadCache(root)
+    key = request_key({'dataset': 'S1'})
+    assert cache.lookup(key) is None
+
+    blob = _commit(cache, key, b'sar layer')
+    assert cache.lookup(key) == blob
+    assert DownloadCache(root).lookup(key) == blob
+    cache.materialize(key, str(tmp_path / 'out' / 's1.npy'))
+    assert (tmp_path / 'out' / 's1.npy').read_bytes() == b'sar layer'
+
+    cache.evict(key)
+    assert cache.lookup(key) is None
+    assert not os.path.exists(blob)
+    assert key not in DownloadCache(root).index
+
+
+def test_cache_hits_stat_the_blob_and_hash_only_when_asked(tmp_path, monkeypatch):
+    root = str(tmp_path / 'cache')
+    cache = DownloadCache(root)
+    key = request_key({'dataset': 'S1'})
+    blob = _commit(cache, key, b'sar layer')
+
+    def no_hashing(path):
+        raise AssertionError('a plain hit re-hashed the blob')
+
+    with monkeypatch.context() as m:
+        m.setattr('common.download_cache.file_sha256', no_hashing)
+        assert DownloadCache(root).lookup(key) == blob
+
+    # Same size, different bytes: the rewrite moves the mtime
+    time.sleep(0.05)
+    with open(blob, 'wb') as f:
+        f.write(b'SAR LAYER')
+    assert DownloadCache(root).lookup(key) is None
+    assert key not in DownloadCache(root).index
+
+    # With the old mtime restored only verification notices
+    blob = _commit(cache, key, b'sar layer')
+    mtime = os.stat(blob).st_mtime_ns
+    with open(blob, 'wb') as f:
+        f.write(b'SAR LAYER')
+    os.utime(blob, ns=(mtime, mtime))
+    assert DownloadCache(root).lookup(key) == blob
+    assert DownloadCache(root).lookup(key, verify=True) is None
+    blob = _commit(cache, key, b'sar layer')
+    assert DownloadCache(root, verify=True).lookup(key) == blob
+
+
+def test_cache_materializes_hard_links_and_falls_back_to_copies(tmp_path, monkeypatch):
+    cache = DownloadCache(str(tmp_path / 'cache'))
+    key = request_key({'dataset': 'S1'})
+    blob = _commit(cache, key, b'sar layer')
+
+    dest = str(tmp_path / 'out' / 's1.npy')
+    cache.materialize(key, dest)
+    cache.materialize(key, dest)
+    assert os.path.samefile(blob, dest)
+    assert sorted(os.listdir(tmp_path / 'out')) == ['s1.npy']
+
+    def no_links(src, dst):
+        raise OSError('cross-device link')
+
+    monkeypatch.setattr(os, 'link', no_links)
+    copy = str(tmp_path / 'other' / 's1.npy')
+    cache.materialize(key, copy)
+    assert not os.path.samefile(blob, copy)
+    with open(copy, 'rb') as f:
+        assert f.read() == b'sar layer'
+
+
+def test_cached_download_resumes_its_partial_blob(mirror, tmp_path):
+    mirror.files['/s1_pre.npy'] = bytes(range(256)) * 8
+    cache = DownloadCache(str(tmp_path / 'cache'))
+    job = DownloadJob('s1_pre', str(tmp_path / 's1_pre.npy'), spec={'dataset': 'S1'})
+    downloader = Downloader(HttpMirrorTransport(f"http://127.0.0.1:{mirror.server_port}"), cache=cache)
+
+    key = request_key(dict(job.cache_spec(), transport=downloader.transport.identity()))
+    with open(cache.partial_path(key), 'wb') as f:
+        f.write(mirror.files['/s1_pre.npy'][:1000])
+
+    assert downloader.fetch(job) == job.path
+    assert mirror.requests == [('/s1_pre.npy', 'bytes=1000-')]
+    assert cache.lookup(key) == cache.blob_path(key)
+    with open(job.path, 'rb') as f:
+        assert f.read() == mirror.files['/s1_pre.npy']
+
+
+def speckled_scene(seed=0, shape=(300, 200)):
+    """Gamma-speckled backscatter in dB with a few NaN nodata pixels and bright outliers"""
+    rng = np.random.default_rng(seed)
+    intensity = rng.gamma(4.0, 0.05 / 4.0, size=shape) * np.linspace(0.2, 2.0, shape[1])
+    scene = (10 * np.log10(intensity)).astype(np.float32)
+    scene[rng.random(shape) < 0.01] = np.nan
+    scene[rng.random(shape) < 0.001] = 40.0
+    return scene
+
+
+@pytest.mark.parametrize('p', [1, 2, 25, 50, 75, 98, 99])
+def test_percentiles_are_within_the_sketch_accuracy(p):
+    scene = speckled_scene()
+    finite = scene[np.isfinite(scene)]
+    stats = scene_stats(ArraySource(scene), block_rows=37)
+
+    exact = np.percentile(finite, p, method='lower')
+    assert abs(stats.percentile(p) - exact) <= RELATIVE_ACCURACY * abs(exact)
+    assert stats.nonfinite == scene.size - finite.size
+
+
+def test_robust_range_ignores_outliers():
+    scene = speckled_scene()
+    finite = scene[np.isfinite(scene)]
+    lo, hi = scene_stats(ArraySource(scene)).robust_range()
+    exact_lo, exact_hi = np.percentile(finite, [2, 98], method='lower')
+
+    assert abs(lo - exact_lo) <= RELATIVE_ACCURACY * abs(exact_lo)
+    assert abs(hi - exact_hi) <= RELATIVE_ACCURACY * abs(exact_hi)
+    assert hi < 40.0
+
+
+def test_merged_block_stats_equal_one_pass():
+    scene = speckled_scene(seed=1)
+    one_pass = BandStats()
+    one_pass.update(scene)
+    merged = merge_stats(scene_stats(ArraySource(block)) for block in np.array_split(scene, 7))
+
+    assert merged.count == one_pass.count and merged.nonfinite == one_pass.nonfinite
+    assert (merged.min, merged.max) == (one_pass.min, one_pass.max)
+    assert np.isclose(merged.moments.mean, one_pass.moments.mean, rtol=1e-12)
+    assert np.isclose(merged.moments.variance, one_pass.moments.variance, rtol=1e-12)
+    for p in (1, 2, 50, 98, 99):
+        assert merged.percentile(p) == one_pass.percentile(p)
+    finite = scene[np.isfinite(scene)].astype(np.float64)
+    assert np.isclose(merged.moments.std, finite.std(), rtol=1e-12)
+
+
+class CountingSource(ArraySource):
+    def __init__(self, data):
+        super().__init__(data)
+        self.reads = 0
+
+    def read(self, row_off, col_off, height, width):
+        self.reads += 1
+        return super().read(row_off, col_off, height, width)
+
+
+@pytest.mark.parametrize('lee', [False, True])
+def test_nodata_mask_reuses_the_blocks_the_sar_chain_read(lee):
+    scenes = [speckled_scene(seed) for seed in (2, 3)]
+    scenes[0][:, :20] = 0.0
+    counters = [CountingSource(scene) for scene in scenes]
+    raw = [BlockCacheSource(counter) for counter in counters]
+    chains = [ScaledSource(LeeFilteredSource(source, 7) if lee else source, -30.0, 0.02) for source in raw]
+
+    blocks = list(iter_aligned_windows(chains + [ValidSource(raw)], 64, 32, block_tiles=2))
+    expected_valid = np.ones(scenes[0].shape, dtype=bool)
+    for scene in scenes:
+        expected_valid &= np.isfinite(scene) & (scene != 0)
+
+    for counter in counters:
+        assert counter.reads == len(blocks)
+    for row_off, col_off, (_, _, valid) in blocks:
+        h, w = valid.shape
+        assert np.array_equal(valid > 0, expected_valid[row_off:row_off + h, col_off:col_off + w])
+
+
+@pytest.mark.parametrize('shape', [(300, 200), (64, 200), (50, 40)])
+def test_windowed_tiles_equal_slices_of_the_full_scene(shape, tmp_path):
+    rng = np.random.default_rng(4)
+    scenes = [rng.random(shape, dtype=np.float32), rng.random((shape[0] + 3, shape[1]), dtype=np.float32)]
+    np.save(tmp_path / 'flood.npy', scenes[1])
+    sources = [ArraySource(scenes[0]), open_raster(str(tmp_path / 'flood.npy'))]
+    assert aligned_shape(sources) == shape
+
+    # Scenes smaller than a tile are zero padded to one tile
+    h, w = max(shape[0], 64), max(shape[1], 64)
+    padded = [np.zeros((h, w), dtype=np.float32) for _ in scenes]
+    for full, scene in zip(padded, scenes):
+        full[:shape[0], :shape[1]] = scene[:shape[0], :shape[1]]
+
+    origins = []
+    for row, col, tiles in iter_aligned_tiles(sources, 64, 32, block_tiles=2):
+        origins.append((row, col))
+        for tile, full in zip(tiles, padded):
+            assert np.array_equal(tile, full[row:row + 64, col:col + 64])
+    expected = [(row, col) for row in range(0, h - 64 + 1, 32) for col in range(0, w - 64 + 1, 32)]
+    assert sorted(origins) == expected
+
+
+@pytest.fixture
+def rapid_preprocessing(monkeypatch):
+    """Flood 1's preprocessing module (its model imports need torch and cv2)"""
+    pytest.importorskip('torch')
+    pytest.importorskip('cv2')
+    spec = importlib.util.spec_from_file_location(
+        'rapid_preprocessing', os.path.join(HERE, 'Flood 1', 'rapid_preprocessing.py'))
+    module = importlib.util.module_from_spec(spec)
+    # Registered so worker processes can unpickle the preprocessor
+    monkeypatch.setitem(sys.modules, 'rapid_preprocessing', module)
+    spec.loader.exec_module(module)
+    return module
+
+
+def write_flood_event(directory, name, shape, seed):
+    rng = np.random.default_rng(seed)
+    paths = {}
+    for layer in ('s1_pre', 's1_flood', 'flood_mask'):
+        paths[layer] = os.path.join(directory, f"{name}_{layer}.npy")
+        np.save(paths[layer], (rng.random(shape) * 20 - 5).astype(np.float32))
+    return paths
+
+
+TILE_FIELDS = {'pre': (1, 128, 128), 'flood': (1, 128, 128), 'change': (1, 128, 128), 'masks': (128, 128),
+               'weights': ()}
+
+
+def test_process_flood_pair_lists_the_streamed_tiles(rapid_preprocessing, tmp_path):
+    paths = write_flood_event(str(tmp_path), 'a', (700, 900), seed=5)
+    files = (paths['s1_pre'], paths['s1_flood'], paths['flood_mask'])
+    preprocessor = rapid_preprocessing.RapidFloodPreprocessor(screen=False)
+
+    tiles = preprocessor.process_flood_pair(*files)
+    store = TileStore.create(str(tmp_path / 'tiles'), TILE_FIELDS, capacity=len(tiles))
+    assert preprocessor.write_flood_pair(store, *files) == len(tiles)
+
+    # The store is filled block by block; the list is in row-major order
+    streamed = sorted(np.asarray(store.arrays['pre'][:, 0]), key=lambda tile: tile.tobytes())
+    listed = sorted((tile['pre'] for tile in tiles), key=lambda tile: tile.tobytes())
+    assert all(np.array_equal(a, b) for a, b in zip(streamed, listed))
+    assert all(np.array_equal(tile['change'], tile['flood'] - tile['pre']) for tile in tiles)
+
+
+def fill_store(store, tiles):
+    """Writes tiles (field -> stacked array) at the store's cursor, in two reservations"""
+    n = len(tiles['masks'])
+    for start, stop in ((0, n // 2), (n // 2, n)):
+        slot = store.reserve(stop - start)
+        for name, values in tiles.items():
+            store.arrays[name][slot:slot + stop - start] = values[start:stop]
+
+
+def synthetic_tiles(n, seed=6, tile_size=16):
+    rng = np.random.default_rng(seed)
+    return {'pre': rng.random((n, 1, tile_size, tile_size), dtype=np.float32),
+            'masks': (rng.random((n, tile_size, tile_size)) > 0.7).astype(np.float32),
+            'weights': rng.choice([0.25, 1.0], size=n).astype(np.float32)}
+
+
+def test_tile_store_round_trip_with_splits(tmp_path):
+    root = str(tmp_path / 'tiles')
+    tiles = synthetic_tiles(40)
+    store = TileStore.create(root, {'pre': (1, 16, 16), 'masks': (16, 16), 'weights': ()}, capacity=50)
+    fill_store(store, tiles)
+    with pytest.raises(ValueError):
+        store.reserve(11)
+    order = np.random.default_rng(0).permutation(40)
+    store.set_split('train', order[:32])
+    store.set_split('val', order[32:])
+    store.flush()
+
+    reopened = TileStore.open(root)
+    assert reopened.count == 40 and reopened.splits == {'train': 32, 'val': 8}
+    for name, values in tiles.items():
+        assert np.array_equal(reopened.arrays[name][:40], values)
+    for split, indices in (('train', order[:32]), ('val', order[32:])):
+        assert np.array_equal(reopened.split_indices(split), indices)
+        assert np.array_equal(reopened.split(split)['pre'][:], tiles['pre'][indices])
+
+
+def test_rewriting_a_store_hides_it_until_flushed(tmp_path):
+    root = str(tmp_path / 'tiles')
+    TileStore.create(root, {'masks': (4, 4)}, capacity=2).flush()
+    assert TileStore.exists(root)
+    store = TileStore.create(root, {'masks': (4, 4)}, capacity=2)
+    assert not TileStore.exists(root)
+    store.flush()
+    assert TileStore.open(root).count == 0
+
+
+@pytest.mark.parametrize('encoding', ['raw', 'lz4'])
+def test_lazy_split_views_equal_the_eager_tiles(encoding, tmp_path):
+    if encoding == 'lz4':
+        pytest.importorskip('lz4')
+    root = str(tmp_path / 'tiles')
+    tiles = synthetic_tiles(37)
+    store = TileStore.create(root, {'pre': (1, 16, 16), 'masks': (16, 16), 'weights': ()}, capacity=37)
+    fill_store(store, tiles)
+    indices = np.random.default_rng(1).permutation(37)[:30]
+    store.set_split('train', indices)
+    store.flush()
+    if encoding == 'lz4':
+        # Chunks of 8 tiles, so reads span several frames and the last one is partial
+        store.compress(chunk_tiles=8)
+        assert not os.path.exists(os.path.join(root, 'pre.npy'))
+
+    split = TileStore.open(root).split('train')
+    for name, values in tiles.items():
+        field, eager = split[name], values[indices]
+        assert field.shape == eager.shape
+        assert np.array_equal(field[:], eager)
+        assert np.array_equal(np.stack(list(field)), eager)
+        assert np.array_equal(field[5], eager[5])
+        assert np.array_equal(field[np.array([7, 2, 7])], eager[[7, 2, 7]])
+        assert np.array_equal(field[10:20], eager[10:20])
+
+
+def test_flood_dataset_items_equal_the_eager_tiles(tmp_path):
+    pytest.importorskip('torch')
+    spec = importlib.util.spec_from_file_location('streamlined_model',
+                                                  os.path.join(HERE, 'Flood 1', 'streamlined_model.py'))
+    streamlined_model = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(streamlined_model)
+
+    rng = np.random.default_rng(2)
+    tiles = {'pre': rng.random((12, 1, 16, 16), dtype=np.float32),
+             'change': rng.random((12, 1, 16, 16), dtype=np.float32),
+             'masks': (rng.random((12, 16, 16)) > 0.5).astype(np.float32)}
+    root = str(tmp_path / 'tiles')
+    store = TileStore.create(root, {name: values.shape[1:] for name, values in tiles.items()}, capacity=12)
+    fill_store(store, tiles)
+    indices = np.array([9, 0, 4, 11, 3])
+    store.set_split('val', indices)
+    store.flush()
+
+    dataset = streamlined_model.OptimizedFloodDataset(root, 'val')
+    assert len(dataset) == len(indices) and dataset.weights is None
+    for i, row in enumerate(indices):
+        change, pre, mask = dataset[i]
+        assert np.array_equal(change.numpy(), tiles['change'][row])
+        assert np.array_equal(pre.numpy(), tiles['pre'][row])
+        assert np.array_equal(mask.numpy(), tiles['masks'][row])
+
+
+def write_shard(root, event, start, stop, seed):
+    """Worker process: writes fewer tiles than reserved into slots [start, stop), like a screened event"""
+    store = TileStore.open(root, mode='r+')
+    store.seek(start, stop)
+    tiles = synthetic_tiles(stop - start - seed % 3, seed=seed)
+    fill_store(store, tiles)
+    store.flush(write_manifest=False)
+    return {'event': event, 'offset': start, 'count': store.count - start}
+
+
+def sharded_store(root, workers):
+    events = [('a', 9), ('b', 14), ('c', 5), ('d', 11)]
+    offsets = np.concatenate([[0], np.cumsum([size for _, size in events])])
+    store = TileStore.create(root, {'pre': (1, 16, 16), 'masks': (16, 16), 'weights': ()},
+                             capacity=int(offsets[-1]))
+    store.flush()
+    jobs = [(root, event, int(offsets[i]), int(offsets[i + 1]), i + 7) for i, (event, _) in enumerate(events)]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        # Shards are merged in event order, whatever order the workers finish in
+        shards = [future.result() for future in [pool.submit(write_shard, *job) for job in jobs]]
+    store.merge_shards(shards)
+    store.flush()
+    return TileStore.open(root)
+
+
+def test_one_and_two_workers_write_identical_shards(tmp_path):
+    one = sharded_store(str(tmp_path / 'one'), workers=1)
+    two = sharded_store(str(tmp_path / 'two'), workers=2)
+
+    assert one.shards == two.shards and one.count == two.count == sum(s['count'] for s in one.shards)
+    expected = {name: np.concatenate([synthetic_tiles(size - seed % 3, seed=seed)[name]
+                                      for size, seed in ((9, 7), (14, 8), (5, 9), (11, 10))])
+                for name in ('pre', 'masks', 'weights')}
+    for name, values in expected.items():
+        assert np.array_equal(one.arrays[name][:one.count], values)
+        assert np.array_equal(two.arrays[name][:two.count], values)
+
+
+def test_preprocessing_with_one_and_two_workers_matches(rapid_preprocessing, tmp_path, monkeypatch):
+    stores = []
+    for workers in (1, 2):
+        work = tmp_path / f"workers_{workers}"
+        (work / 'data' / 'optimized').mkdir(parents=True)
+        monkeypatch.chdir(work)
+        events = {name: {'data': write_flood_event('data/optimized', name, shape, seed)}
+                  for name, shape, seed in (('a', (400, 500), 1), ('b', (100, 90), 2), ('c', (300, 260), 3))}
+        with open('data/optimized/catalog.json', 'w') as f:
+            json.dump({'events': events}, f)
+        rapid_preprocessing.RapidFloodPreprocessor(workers=workers).run()
+        stores.append(TileStore.open(str(work / 'data' / 'rapid_processed' / 'tiles')))
+
+    one, two = stores
+    assert one.count == two.count > 0 and one.shards == two.shards
+    for name in one.fields:
+        assert np.array_equal(one.arrays[name][:one.count], two.arrays[name][:two.count])
+    assert np.array_equal(one.split_indices('train'), two.split_indices('train'))
+
+
+@pytest.mark.parametrize('window', [3, 7])
+@pytest.mark.parametrize('db_transform', [None, (1.0, 0.0)])
+def test_blockwise_lee_equals_filtering_the_whole_scene(window, db_transform):
+    scene = speckled_scene(seed=8, shape=(157, 131))
+    scene[40:43, :] = np.nan
+    if db_transform is None:
+        scene = np.power(10.0, scene / 10.0, dtype=np.float32)
+    whole = lee_filter(scene, window, db_transform=db_transform)
+    # NaN pixels stay NaN and are left out of their neighbours' moments
+    assert np.array_equal(np.isnan(whole), np.isnan(scene))
+
+    # Odd block sizes put block edges everywhere, including next to the NaN rows and the scene border
+    source = LeeFilteredSource(ArraySource(scene), window, db_transform=db_transform)
+    blockwise = np.full_like(whole, -1.0)
+    for row_off in range(0, 157, 37):
+        for col_off in range(0, 131, 29):
+            height, width = min(37, 157 - row_off), min(29, 131 - col_off)
+            blockwise[row_off:row_off + height, col_off:col_off + width] = source.read(row_off, col_off, height, width)
+    np.testing.assert_allclose(blockwise, whole, rtol=1e-5, atol=1e-6, equal_nan=True)
+    np.testing.assert_allclose(despeckle(scene, window, db_transform=db_transform, block_rows=23), whole,
+                               rtol=1e-5, atol=1e-6, equal_nan=True)
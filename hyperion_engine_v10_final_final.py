@@ -27,7 +27,7 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(
 logger = logging.getLogger(__name__)
 
 def install_packages():
-    packages = ['yfinance', 'xgboost', 'lightgbm', 'catboost', 'scikit-learn']
+    packages = ['yfinance', 'xgboost', 'lightgbm', 'catboost', 'scikit-learn', 'pyarrow']
     for package in packages:
         try:
             __import__(package.split('==')[0])
@@ -42,29 +42,21 @@ class HyperionV10:
 
     def load_data(self):
         logger.info("Step 1/3: Loading Granular Trade Lane Data...")
+        from atlas_store import load_lane_csv
+        from atlas_exog import load_exog_panel
         try:
-            feuw_df = pd.read_csv('xsicfeuw_data.csv', index_col='Date', parse_dates=True)
-            uwfe_df = pd.read_csv('xsiuwfe_data.csv', index_col='Date', parse_dates=True)
-            feuw_df.rename(columns={'XSICFEUW': 'feuw_price'}, inplace=True)
-            uwfe_df.rename(columns={'XSICUWFE': 'uwfe_price'}, inplace=True)
+            # Parsed once into a typed cache, memory-mapped on later runs
+            feuw_df = load_lane_csv('xsicfeuw_data.csv', 'XSICFEUW', 'feuw_price')
+            uwfe_df = load_lane_csv('xsiuwfe_data.csv', 'XSICUWFE', 'uwfe_price')
             self.target_column = 'feuw_price'
         except FileNotFoundError as e:
             logger.error(f"CRITICAL ERROR: Data file not found - {e.filename}.")
             sys.exit(1)
             
-        import yfinance as yf
-        try:
-            market_data = yf.download(['BDRY', 'BZ=F'], start='2018-01-01', end=datetime.now(), progress=False)
-            features_df = pd.DataFrame({
-                'bdi_proxy_price': market_data['Close']['BDRY'],
-                'fuel_price': market_data['Close']['BZ=F']
-            })
-        except Exception:
-            logger.warning("Could not download market data.")
-            features_df = pd.DataFrame()
-
-        df = feuw_df.join(uwfe_df, how='inner').join(features_df, how='left')
-        df = df.resample('D').ffill().bfill().dropna()
+        features_df = load_exog_panel()
+
+        df = feuw_df.join(uwfe_df, how='inner').resample('D').ffill()
+        df = df.join(features_df, how='left').bfill().dropna()
         
         self.results["data_summary"] = {
             "start_date": df.index.min().strftime('%Y-%m-%d'),
@@ -78,8 +70,9 @@ class HyperionV10:
         df_feat = df.copy()
         df_feat['trade_imbalance_ratio'] = df_feat['feuw_price'] / (df_feat['uwfe_price'] + 1e-6)
         
-        # Lags on all NON-TARGET input variables
-        for col in ['uwfe_price', 'bdi_proxy_price', 'fuel_price', 'trade_imbalance_ratio']:
+        # Lags on all NON-TARGET input variables, including every exogenous series
+        lag_columns = [col for col in df_feat.columns if col not in (self.target_column, 'target')]
+        for col in lag_columns:
             if col in df_feat.columns:
                 for lag in [1, 7, 14, 30]:
                     df_feat[f'{col}_lag_{lag}'] = df_feat[col].shift(lag)
@@ -15,10 +15,11 @@ import subprocess
 import sys
 import time
 import logging
+import tracemalloc
 
 # Install packages BEFORE importing them
 def install_packages():
-    packages = ['yfinance', 'xgboost', 'lightgbm', 'catboost', 'scikit-learn', 'shap']
+    packages = ['yfinance', 'xgboost', 'lightgbm', 'catboost', 'scikit-learn', 'shap', 'pyarrow']
     for package in packages:
         try:
             __import__(package.split('==')[0])
@@ -31,14 +32,26 @@ install_packages()
 
 # Now import the packages
 from sklearn.linear_model import Ridge
-from sklearn.ensemble import RandomForestRegressor, GradientBoostingRegressor
+from sklearn.ensemble import RandomForestRegressor, ExtraTreesRegressor, GradientBoostingRegressor
 from sklearn.model_selection import TimeSeriesSplit
 from sklearn.metrics import mean_absolute_error, r2_score
 import lightgbm as lgb
 import xgboost as xgb
 from catboost import CatBoostRegressor
-import yfinance as yf
-import shap
+
+from atlas_store import build_prediction_table, write_prediction_store, load_lane_csv
+from atlas_registry import ModelRegistry
+from atlas_regimes import detect_regimes
+from atlas_lags import select_lags
+from atlas_explain import ExplanationCache, explain_model
+from atlas_exog import load_exog_panel
+from atlas_tuning import TUNABLE_FAMILIES, make_estimator, successive_halving
+from atlas_scoring import QUANTILES, INTERVAL, score_folds, pinball_loss, interval_scores
+
+try:
+    import resource
+except ImportError:  # Not available on Windows; peak RSS is then not reported
+    resource = None
 
 # Set up CatBoost for Windows compatibility
 os.environ["CATBOOST_DATA_DIR"] = tempfile.mkdtemp()
@@ -47,37 +60,77 @@ warnings.filterwarnings('ignore')
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s', stream=sys.stdout)
 logger = logging.getLogger(__name__)
 
+# Smallest test fold we are willing to score; short regime windows get fewer CV splits
+MIN_CV_FOLD_ROWS = 60
+
+# Fixed lags given to every non-target input unless auto-lag selection is on
+DEFAULT_LAGS = [1, 7, 14, 30]
+
+def peak_rss_mb():
+    """Peak resident set size of this process so far, in MB (None where unsupported)."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+def start_allocation_trace():
+    """Starts tracemalloc (or resets its peak if already on); pass the result to allocation_peak_mb."""
+    started = not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start()
+    tracemalloc.reset_peak()
+    return started, tracemalloc.get_traced_memory()[0]
+
+def allocation_peak_mb(trace):
+    """Peak of Python and NumPy allocations since start_allocation_trace, above what was live then, in MB.
+
+    Unlike the process-wide RSS high-water mark this covers only the traced
+    section, so lean and standard runs can be compared. Native allocations
+    made inside the boosting libraries are not traced.
+    """
+    started, baseline = trace
+    peak = tracemalloc.get_traced_memory()[1] - baseline
+    if started:
+        tracemalloc.stop()
+    return peak / (1024 * 1024)
+
+# Longest forecast curve the multi-horizon (direct, multi-output) mode will fit
+MAX_MULTI_HORIZON = 60
+
 class AtlasEngine:
-    def __init__(self, quick_mode=False):
-        self.results = {"metadata": {"timestamp": datetime.now().isoformat(), "version": "atlas-2.0", "quick_mode": quick_mode}}
+    def __init__(self, quick_mode=False, regime_aware=False, auto_lags=False, explanation_cache_dir='atlas_explanations',
+                 tune=False, tuning_budget_minutes=10.0, lean=False, trace_memory=False):
+        self.results = {"metadata": {"timestamp": datetime.now().isoformat(), "version": "atlas-2.0", "quick_mode": quick_mode,
+                                     "regime_aware": regime_aware, "auto_lags": auto_lags, "tune": tune,
+                                     "lean": lean}}
         self.quick_mode = quick_mode
+        self.regime_aware = regime_aware
+        self.auto_lags = auto_lags
+        self.tune = tune
+        self.lean = lean  # float32 feature base shared by all horizons, models get array views
+        self._lean_cache = (None,)
+        self.trace_memory = trace_memory  # tracemalloc around the foundry (slows allocation-heavy code ~3x)
+        self.tuning_budget_minutes = tuning_budget_minutes  # CPU-minutes for the whole run
         self.target_column = 'feuw_price'
         self.trained_models = {}  # Store trained models for ensemble
+        self.prediction_tables = []  # Columnar prediction blocks, written once by run_all
+        self.explanation_cache = ExplanationCache(explanation_cache_dir) if explanation_cache_dir else None
 
     def load_data(self):
         logger.info("Step 1/4: Loading Granular Trade Lane Data...")
         try:
-            feuw_df = pd.read_csv('xsicfeuw_data.csv', index_col='Date', parse_dates=True)
-            uwfe_df = pd.read_csv('xsiuwfe_data.csv', index_col='Date', parse_dates=True)
-            feuw_df.rename(columns={'XSICFEUW': 'feuw_price'}, inplace=True)
-            uwfe_df.rename(columns={'XSICUWFE': 'uwfe_price'}, inplace=True)
+            # Parsed once into a typed cache, memory-mapped on later runs
+            feuw_df = load_lane_csv('xsicfeuw_data.csv', 'XSICFEUW', 'feuw_price')
+            uwfe_df = load_lane_csv('xsiuwfe_data.csv', 'XSICUWFE', 'uwfe_price')
         except FileNotFoundError as e:
             logger.error(f"CRITICAL ERROR: Data file not found - {e.filename}.")
             sys.exit(1)
             
-        # Download market data with proper error handling
-        try:
-            market_data = yf.download(['BDRY', 'BZ=F'], start='2018-01-01', end=datetime.now(), progress=False)
-            features_df = pd.DataFrame({
-                'bdi_proxy_price': market_data['Close']['BDRY'],
-                'fuel_price': market_data['Close']['BZ=F']
-            })
-        except Exception as e:
-            logger.warning(f"Could not download market data: {e}")
-            features_df = pd.DataFrame()
-
-        df = feuw_df.join(uwfe_df, how='inner').join(features_df, how='left')
-        df = df.resample('D').ffill().bfill().dropna()
+        # Market inputs come from the shared daily exogenous panel (already calendar-aligned)
+        features_df = load_exog_panel()
+
+        df = feuw_df.join(uwfe_df, how='inner').resample('D').ffill()
+        df = df.join(features_df, how='left').bfill().dropna()
         
         # Check if market features are available
         if features_df.empty:
@@ -91,17 +144,22 @@ class AtlasEngine:
         }
         return df
 
-    def create_features(self, df, is_training=True):
-        """Creates features with proper temporal boundaries - FIXED from New2 feedback."""
+    def create_features(self, df, is_training=True, lags=None):
+        """Creates features with proper temporal boundaries - FIXED from New2 feedback.
+        
+        lags maps column -> list of lags; by default every lag_columns() input gets DEFAULT_LAGS.
+        """
         df_feat = df.copy()
         
         # The "Rosetta Stone" feature - trade imbalance ratio (safe - uses current row only)
         df_feat['trade_imbalance_ratio'] = df_feat['feuw_price'] / (df_feat['uwfe_price'] + 1e-6)
+        if lags is None:
+            lags = {col: DEFAULT_LAGS for col in self.lag_columns(df_feat)}
         
         # Compute lags ONLY from available history
-        for col in ['uwfe_price', 'bdi_proxy_price', 'fuel_price', 'trade_imbalance_ratio']:
+        for col, col_lags in lags.items():
             if col in df_feat.columns:
-                for lag in [1, 7, 14, 30]:
+                for lag in col_lags:
                     if is_training:
                         # Training: normal shift
                         df_feat[f'{col}_lag_{lag}'] = df_feat[col].shift(lag)
@@ -111,6 +169,76 @@ class AtlasEngine:
         
         return df_feat
 
+    def create_lean_features(self, df, lags=None):
+        """float32 counterpart of create_features for lean mode, minus target-derived columns.
+
+        Fills one preallocated C-contiguous (rows, features) array instead of
+        copying the frame per column. Returns (base, target, feature_cols).
+        """
+        inputs = [col for col in df.columns if self.target_column not in col]
+        series = {col: df[col].to_numpy() for col in inputs}
+        series['trade_imbalance_ratio'] = df['feuw_price'].to_numpy() / (df['uwfe_price'].to_numpy() + 1e-6)
+        if lags is None:
+            lags = {col: DEFAULT_LAGS for col in self.lag_columns(df)}
+
+        lag_specs = [(col, lag) for col, col_lags in lags.items() if col in series for lag in col_lags]
+        plain_cols = inputs + ['trade_imbalance_ratio']
+        feature_cols = plain_cols + [f'{col}_lag_{lag}' for col, lag in lag_specs]
+
+        n = len(df)
+        base = np.empty((n, len(feature_cols)), dtype=np.float32)
+        for j, col in enumerate(plain_cols):
+            base[:, j] = series[col]
+        for j, (col, lag) in enumerate(lag_specs, start=len(plain_cols)):
+            base[:lag, j] = np.nan
+            base[lag:, j] = series[col][:max(n - lag, 0)]
+        return base, df[self.target_column].to_numpy(dtype=np.float32), feature_cols
+
+    def lean_design(self, df, h, lags=None, regime_start=None):
+        """(X, y) for horizon h as views over the shared float32 base.
+
+        Lags only leave NaNs at the start, so the usable rows form one contiguous
+        block and every horizon is a row slice of the same array.
+        """
+        key = json.dumps(lags, sort_keys=True)
+        if self._lean_cache[0] != key:
+            base, target, feature_cols = self.create_lean_features(df, lags)
+            valid = ~np.isnan(base).any(axis=1) & ~np.isnan(target)
+            first = int(np.argmax(valid))
+            if not valid[first:].all():
+                raise ValueError("Lean mode needs gap-free input; rows with missing values found after the lag warm-up")
+            self._lean_cache = (key, base, target, feature_cols, first)
+        _, base, target, feature_cols, first = self._lean_cache
+
+        if regime_start is not None:
+            first = max(first, int(df.index.searchsorted(regime_start)))
+        end = len(df) - h
+        index = df.index[first:end]
+        X = pd.DataFrame(base[first:end], index=index, columns=feature_cols, copy=False)
+        y = pd.Series(target[first + h:], index=index, name='target', copy=False)
+        return X, y
+
+    def model_input(self, data):
+        """What models are fitted on: the contiguous float32 array in lean mode, else the frame."""
+        return data.to_numpy() if self.lean else data
+
+    @staticmethod
+    def pre_test_rows(frame):
+        """Rows of a target-aligned frame that can never fall in the final test fold.
+
+        TimeSeriesSplit uses at least two splits, so its last test fold holds at
+        most a third of the rows. Anything fitted on these rows (regimes, lags)
+        cannot see the data the champion is scored on.
+        """
+        return frame.iloc[:len(frame) - len(frame) // 3]
+
+    def lag_columns(self, df):
+        """Inputs that get lag features: every non-target column, including all exogenous series."""
+        columns = [col for col in df.columns if col not in (self.target_column, 'target') and '_lag_' not in col]
+        if 'trade_imbalance_ratio' not in columns:
+            columns.append('trade_imbalance_ratio')
+        return columns
+
     def create_confidence_models(self):
         """Create quantile regression models for confidence intervals."""
         return {
@@ -118,9 +246,50 @@ class AtlasEngine:
             "gb_upper": GradientBoostingRegressor(loss='quantile', alpha=0.9, random_state=42)
         }
 
-    def run_forecasting_foundry(self, df, forecast_horizon=None):
+    def tune_models(self, X, y, tscv, horizon_key, feature_cols, registry=None, cpu_budget_minutes=None):
+        """Successive-halving search per boosting family on an inner split of the first CV training window.
+
+        Every outer CV fold (and the final fold that picks the champion) lies after
+        the rows tuning sees, so tuned families are scored out of sample just like
+        the untuned ones. Best configs are cached per horizon in the registry and
+        reused while the features match.
+        """
+        first_test = next(iter(tscv.split(X)))[1][0]
+        scored_from = X.index[first_test]
+        inner_splits = max(2, min(tscv.n_splits, first_test // MIN_CV_FOLD_ROWS - 1))
+        X, y = X.iloc[:first_test], y.iloc[:first_test]
+        folds = list(TimeSeriesSplit(n_splits=inner_splits).split(X))
+        tuning = {}
+        for family in TUNABLE_FAMILIES:
+            cached = registry.tuned_params(horizon_key, family, feature_cols, before=scored_from) \
+                if registry is not None else None
+            if cached is not None:
+                tuning[family] = {"params": cached["params"], "cv_mae": cached["cv_mae"], "cached": True}
+                continue
+
+            result = successive_halving(family, X.to_numpy(), y.to_numpy(), folds, cpu_budget_minutes=cpu_budget_minutes)
+            if result is None:
+                continue
+            if registry is not None:
+                registry.store_tuned_params(horizon_key, family, feature_cols, result, tuned_through=X.index[-1])
+            tuning[family] = {
+                "params": result["params"],
+                "cv_mae": result["cv_mae"],
+                "trials": result["trials"],
+                "cpu_seconds": result["cpu_seconds"],
+                "cached": False
+            }
+            logger.info(f"    Tuned {family}: CV MAE {result['cv_mae']:.1f} after {result['trials']} trials "
+                        f"({result['cpu_seconds']:.0f} CPU-s)")
+        return tuning
+
+    def run_forecasting_foundry(self, df, forecast_horizon=None, registry=None):
         logger.info("Step 2/4: Running Advanced Forecasting Foundry with Confidence Intervals...")
         self.results["forecasting"] = {}
+        self.trained_models = {}
+        self.prediction_tables = []
+        self._lean_cache = (None,)
+        allocation_trace = start_allocation_trace() if self.trace_memory else None
         
         # Use specific horizon if provided, otherwise use all
         if forecast_horizon:
@@ -130,29 +299,55 @@ class AtlasEngine:
         else:
             horizons = [7, 14, 30]
 
+        # Restrict training to the current regime (lags still use the earlier history).
+        # Boundaries are fitted on rows no horizon's final test fold can reach.
+        regime_start = None
+        if self.regime_aware:
+            history = self.pre_test_rows(self.create_features(df).iloc[:len(df) - max(horizons)])
+            self.results["regimes"] = detect_regimes(history, end=df.index.max())
+            regime_start = pd.Timestamp(self.results["regimes"]["current_regime_start"])
+            logger.info(f"    Current regime starts {regime_start.strftime('%Y-%m-%d')} – training windows limited to it.")
+
         for h in horizons:
             logger.info(f"  -> Processing {h}-day forecast with confidence intervals...")
             
-            data_with_target = df.copy()
-            data_with_target['target'] = data_with_target[self.target_column].shift(-h)
-            data_with_target.dropna(subset=['target'], inplace=True)
-
-            # Use TimeSeriesSplit for proper time series validation
-            tscv = TimeSeriesSplit(n_splits=5)
-            
-            # Get features with proper temporal boundaries
-            data_with_features = self.create_features(data_with_target, is_training=True).dropna()
+            if self.auto_lags or not self.lean:
+                data_with_target = df.copy()
+                data_with_target['target'] = data_with_target[self.target_column].shift(-h)
+                data_with_target.dropna(subset=['target'], inplace=True)
             
-            # Remove target-derived features (leakage prevention)
-            features_to_remove = [col for col in data_with_features.columns if self.target_column in col]
-            feature_cols = [col for col in data_with_features.columns 
-                          if col not in features_to_remove and col != 'target']
+            # Data-driven lags, chosen on rows that can never fall in the final test fold
+            lags = None
+            if self.auto_lags:
+                selection_df = self.pre_test_rows(self.create_features(data_with_target, lags={}))
+                if regime_start is not None:
+                    selection_df = selection_df.loc[regime_start:]
+                lags = select_lags(selection_df, selection_df['target'], self.lag_columns(selection_df))
+                logger.info(f"    Auto-selected lags: {lags}")
             
-            X = data_with_features[feature_cols]
-            y = data_with_features['target']
+            if self.lean:
+                X, y = self.lean_design(df, h, lags, regime_start)
+                feature_cols = list(X.columns)
+            else:
+                # Get features with proper temporal boundaries
+                data_with_features = self.create_features(data_with_target, is_training=True, lags=lags).dropna()
+                if regime_start is not None:
+                    data_with_features = data_with_features.loc[regime_start:]
+                
+                # Remove target-derived features (leakage prevention)
+                features_to_remove = [col for col in data_with_features.columns if self.target_column in col]
+                feature_cols = [col for col in data_with_features.columns 
+                              if col not in features_to_remove and col != 'target']
+                
+                X = data_with_features[feature_cols]
+                y = data_with_features['target']
             
             logger.info(f"    Training with {len(X.columns)} features.")
 
+            # Use TimeSeriesSplit for proper time series validation
+            n_splits = max(2, min(5, len(X) // MIN_CV_FOLD_ROWS - 1))
+            tscv = TimeSeriesSplit(n_splits=n_splits)
+
             # Models with proper reproducibility
             models = {
                 "Ridge": Ridge(),
@@ -168,33 +363,64 @@ class AtlasEngine:
                 models = {"Ridge": Ridge()}
             
             horizon_key = f"{h}_day"
-            self.results["forecasting"][horizon_key] = {"benchmark": {}, "cv_scores": {}}
+            tuning = None
+            if self.tune and not self.quick_mode:
+                budget = self.tuning_budget_minutes / (len(horizons) * len(TUNABLE_FAMILIES))
+                tuning = self.tune_models(X, y, tscv, horizon_key, feature_cols, registry, budget)
+                for family, tuned in tuning.items():
+                    models[family] = make_estimator(family, tuned["params"])
+            
+            self.results["forecasting"][horizon_key] = {
+                "benchmark": {},
+                "cv_scores": {},
+                "training_window": {
+                    "start": X.index.min().strftime('%Y-%m-%d'),
+                    "end": X.index.max().strftime('%Y-%m-%d'),
+                    "rows": len(X),
+                    "cv_splits": n_splits
+                },
+                "lags": lags if lags is not None else {col: DEFAULT_LAGS for col in self.lag_columns(df)}
+            }
+            if tuning is not None:
+                self.results["forecasting"][horizon_key]["tuning"] = tuning
 
-            # Time series cross-validation
+            # Time series cross-validation (fold predictions are kept for probabilistic scoring)
             cv_scores = {name: [] for name in models.keys()}
+            cv_preds = {name: [] for name in models.keys()}
+            cv_actuals = []
             
             for train_idx, test_idx in tscv.split(X):
-                X_train, X_test = X.iloc[train_idx], X.iloc[test_idx]
-                y_train, y_test = y.iloc[train_idx], y.iloc[test_idx]
+                # Folds are contiguous, so row slices avoid copying the fold data
+                train_rows = slice(train_idx[0], train_idx[-1] + 1)
+                test_rows = slice(test_idx[0], test_idx[-1] + 1)
+                X_train, X_test = X.iloc[train_rows], X.iloc[test_rows]
+                y_train, y_test = y.iloc[train_rows], y.iloc[test_rows]
+                cv_actuals.append(y_test.to_numpy())
                 
                 for name, model in models.items():
-                    model.fit(X_train, y_train)
-                    preds = model.predict(X_test)
+                    model.fit(self.model_input(X_train), self.model_input(y_train))
+                    preds = model.predict(self.model_input(X_test))
                     r2 = r2_score(y_test, preds)
                     cv_scores[name].append(r2)
+                    cv_preds[name].append(preds)
+            
+            # Conformal quantiles, CRPS, pinball, coverage and width for every model and fold at once
+            prob_scores = score_folds(np.array([cv_preds[name] for name in models]), np.array(cv_actuals))
             
             # Calculate final metrics on last split (most recent data)
-            X_train_final, X_test_final = X.iloc[train_idx], X.iloc[test_idx]
-            y_train_final, y_test_final = y.iloc[train_idx], y.iloc[test_idx]
+            X_train_final, X_test_final = X.iloc[train_rows], X.iloc[test_rows]
+            y_train_final, y_test_final = y.iloc[train_rows], y.iloc[test_rows]
             
             best_r2 = -np.inf
             champion_model = None
             runner_up_model = None
             runner_up_name = None
+            final_preds = {}
             
             for name, model in models.items():
-                model.fit(X_train_final, y_train_final)
-                preds = model.predict(X_test_final)
+                model.fit(self.model_input(X_train_final), self.model_input(y_train_final))
+                preds = model.predict(self.model_input(X_test_final))
+                final_preds[name] = preds
                 r2 = r2_score(y_test_final, preds)
                 mae = mean_absolute_error(y_test_final, preds)
                 
@@ -202,11 +428,16 @@ class AtlasEngine:
                 cv_mean = np.mean(cv_scores[name])
                 cv_std = np.std(cv_scores[name])
                 
+                m = list(models).index(name)
                 self.results["forecasting"][horizon_key]["benchmark"][name] = {
                     "r2": float(r2), 
                     "mae": float(mae),
                     "cv_r2_mean": float(cv_mean),
-                    "cv_r2_std": float(cv_std)
+                    "cv_r2_std": float(cv_std),
+                    "cv_crps": float(np.mean(prob_scores["crps"][m])),
+                    "cv_pinball": {f"{tau:.2f}": float(loss) for tau, loss in zip(QUANTILES, prob_scores["pinball"][m].mean(axis=0))},
+                    "cv_coverage_80": float(np.mean(prob_scores["coverage"][m])),
+                    "cv_width_80": float(np.mean(prob_scores["width"][m]))
                 }
                 
                 # Track champion and runner-up for ensemble
@@ -220,113 +451,214 @@ class AtlasEngine:
                 elif runner_up_model is None or r2 > self.results["forecasting"][horizon_key]["benchmark"].get(runner_up_name, {}).get("r2", -np.inf):
                     runner_up_model = model
                     runner_up_name = name
-                
-                if r2 > best_r2:
-                    best_r2 = r2
-                    importances = []
-                    if hasattr(model, 'feature_importances_'):
-                        importances = sorted(zip(X_train_final.columns, model.feature_importances_), 
-                                           key=lambda x: x[1], reverse=True)
-                    elif hasattr(model, 'coef_'):
-                        # For Ridge, use absolute standardized coefficients
-                        coef_abs = np.abs(model.coef_)
-                        importances = sorted(zip(X_train_final.columns, coef_abs), 
-                                           key=lambda x: x[1], reverse=True)
-                    
-                    self.results["forecasting"][horizon_key]["champion"] = {
-                        "name": name, 
-                        "r2": float(r2), 
-                        "mae": float(mae),
-                        "cv_r2_mean": float(cv_mean),
-                        "cv_r2_std": float(cv_std),
-                        "predictions": preds.tolist(), 
-                        "actuals": y_test_final.tolist(),
-                        "dates": y_test_final.index.strftime('%Y-%m-%d').tolist(),
-                        "feature_importance": [(k, float(v)) for k, v in importances[:5]]
-                    }
+            
+            importances = []
+            if hasattr(champion_model, 'feature_importances_'):
+                importances = sorted(zip(X_train_final.columns, champion_model.feature_importances_), 
+                                   key=lambda x: x[1], reverse=True)
+            elif hasattr(champion_model, 'coef_'):
+                # For Ridge, use absolute standardized coefficients
+                coef_abs = np.abs(champion_model.coef_)
+                importances = sorted(zip(X_train_final.columns, coef_abs), 
+                                   key=lambda x: x[1], reverse=True)
+            
+            # Predictions themselves go to the columnar store; the JSON only references them
+            self.results["forecasting"][horizon_key]["champion"] = {
+                "name": champion_name, 
+                **self.results["forecasting"][horizon_key]["benchmark"][champion_name],
+                "test_start": y_test_final.index.min().strftime('%Y-%m-%d'),
+                "test_end": y_test_final.index.max().strftime('%Y-%m-%d'),
+                "n_predictions": len(y_test_final),
+                "feature_importance": [(k, float(v)) for k, v in importances[:5]]
+            }
+            self.trained_models[horizon_key] = {
+                "name": champion_name,
+                "model": champion_model,
+                "feature_cols": feature_cols,
+                "lags": self.results["forecasting"][horizon_key]["lags"],
+                "train_end": X_train_final.index.max().strftime('%Y-%m-%d')
+            }
             
             # Create confidence intervals using quantile regression
             logger.info(f"    Creating confidence intervals for {h}-day forecast...")
             confidence_models = self.create_confidence_models()
+            confidence_preds = {}
             
             for conf_name, conf_model in confidence_models.items():
-                conf_model.fit(X_train_final, y_train_final)
-                conf_preds = conf_model.predict(X_test_final)
-                
-                if conf_name == "gb_lower":
-                    self.results["forecasting"][horizon_key]["confidence_lower"] = conf_preds.tolist()
-                else:
-                    self.results["forecasting"][horizon_key]["confidence_upper"] = conf_preds.tolist()
+                conf_model.fit(self.model_input(X_train_final), self.model_input(y_train_final))
+                confidence_preds[conf_name] = conf_model.predict(self.model_input(X_test_final))
+            
+            interval_width = confidence_preds["gb_upper"] - confidence_preds["gb_lower"]
+            coverage, _ = interval_scores(y_test_final.to_numpy(), confidence_preds["gb_lower"], confidence_preds["gb_upper"])
+            band_pinball = pinball_loss(y_test_final.to_numpy(), np.column_stack([confidence_preds["gb_lower"], confidence_preds["gb_upper"]]), INTERVAL)
+            self.results["forecasting"][horizon_key]["confidence_interval"] = {
+                "lower_quantile": INTERVAL[0],
+                "upper_quantile": INTERVAL[1],
+                "mean_width": float(np.mean(interval_width)),
+                "coverage": float(coverage),
+                "pinball": {f"{tau:.2f}": float(loss) for tau, loss in zip(INTERVAL, band_pinball)}
+            }
+            
+            self.prediction_tables.append(build_prediction_table(
+                h, champion_name, y_test_final.index, y_test_final.values, final_preds[champion_name],
+                confidence_preds["gb_lower"], confidence_preds["gb_upper"]
+            ))
             
             # Create ensemble prediction (80% champion, 20% runner-up)
             if runner_up_model is not None:
-                champion_preds = champion_model.predict(X_test_final)
-                runner_up_preds = runner_up_model.predict(X_test_final)
-                ensemble_preds = 0.8 * champion_preds + 0.2 * runner_up_preds
+                ensemble_preds = 0.8 * final_preds[champion_name] + 0.2 * final_preds[runner_up_name]
                 ensemble_r2 = r2_score(y_test_final, ensemble_preds)
                 
                 self.results["forecasting"][horizon_key]["ensemble"] = {
                     "champion_weight": 0.8,
                     "runner_up_weight": 0.2,
                     "runner_up_name": runner_up_name,
-                    "r2": float(ensemble_r2),
-                    "predictions": ensemble_preds.tolist()
+                    "r2": float(ensemble_r2)
                 }
                 
+                self.prediction_tables.append(build_prediction_table(
+                    h, "Ensemble", y_test_final.index, y_test_final.values, ensemble_preds,
+                    confidence_preds["gb_lower"], confidence_preds["gb_upper"]
+                ))
+                
                 logger.info(f"    Ensemble R²: {ensemble_r2:.3f} (Champion: {champion_name}, Runner-up: {runner_up_name})")
             
-            # Add SHAP explainability for champion model
-            if champion_name == "Ridge":
-                logger.info(f"    Generating SHAP explanations for {champion_name}...")
-                try:
-                    explainer = shap.LinearExplainer(champion_model, X_train_final)
-                    shap_values = explainer.shap_values(X_test_final)
-                    
-                    # Get mean absolute SHAP values for feature importance
-                    mean_shap = np.mean(np.abs(shap_values), axis=0)
-                    shap_importance = sorted(zip(X_train_final.columns, mean_shap), 
-                                           key=lambda x: x[1], reverse=True)
-                    
-                    self.results["forecasting"][horizon_key]["shap_explanations"] = {
-                        "feature_importance": [(k, float(v)) for k, v in shap_importance[:5]],
-                        "sample_explanations": []
-                    }
-                    
-                    # Add sample explanations for first few predictions
-                    for i in range(min(3, len(X_test_final))):
-                        explanation = {
-                            "date": y_test_final.index[i].strftime('%Y-%m-%d'),
-                            "prediction": float(champion_model.predict(X_test_final.iloc[[i]])[0]),
-                            "actual": float(y_test_final.iloc[i]),
-                            "feature_contributions": {}
-                        }
-                        
-                        for j, feature in enumerate(X_train_final.columns):
-                            if j < len(shap_values[i]):
-                                explanation["feature_contributions"][feature] = float(shap_values[i][j])
-                        
-                        self.results["forecasting"][horizon_key]["shap_explanations"]["sample_explanations"].append(explanation)
-                        
-                except Exception as e:
-                    logger.warning(f"SHAP explanation failed: {e}")
-            
-            # Save pred vs actual CSV with confidence intervals
-            pred_df = pd.DataFrame({
-                'date': y_test_final.index,
-                'actual': y_test_final.values,
-                'predicted': champion_model.predict(X_test_final),
-                'confidence_lower': self.results["forecasting"][horizon_key]["confidence_lower"],
-                'confidence_upper': self.results["forecasting"][horizon_key]["confidence_upper"]
-            })
-            
-            if "ensemble" in self.results["forecasting"][horizon_key]:
-                pred_df['ensemble_predicted'] = self.results["forecasting"][horizon_key]["ensemble"]["predictions"]
+            # SHAP + permutation importance for whichever model is champion (cached per fingerprint)
+            logger.info(f"    Generating explanations for {champion_name}...")
+            try:
+                self.results["forecasting"][horizon_key]["shap_explanations"] = explain_model(
+                    champion_model, X_train_final, X_test_final, y_test_final, cache=self.explanation_cache
+                )
+            except Exception as e:
+                logger.warning(f"SHAP explanation failed: {e}")
             
-            csv_filename = f"atlas_{h}day_predictions_with_confidence.csv"
-            pred_df.to_csv(csv_filename, index=False)
-            logger.info(f"    Saved predictions with confidence intervals to {csv_filename}")
-        
+        self._lean_cache = (None,)  # release the shared base array
+        # ru_maxrss never decreases and includes data loading, so it is only the process total;
+        # the traced allocation peak is what compares lean and standard foundries
+        memory = {
+            "lean": self.lean,
+            "foundry_peak_alloc_mb": allocation_peak_mb(allocation_trace) if allocation_trace else None,
+            "process_peak_rss_mb": peak_rss_mb()
+        }
+        self.results["memory"] = memory
+        if memory["foundry_peak_alloc_mb"] is not None:
+            logger.info(f"    Foundry allocation peak: {memory['foundry_peak_alloc_mb']:.1f} MB")
+        if memory["process_peak_rss_mb"] is not None:
+            logger.info(f"    Process peak RSS so far: {memory['process_peak_rss_mb']:.0f} MB")
         logger.info("✅ Advanced Forecasting Foundry complete.")
+
+    def run_multi_horizon_foundry(self, df, max_horizon):
+        """Direct forecasts for every horizon 1..max_horizon from one design matrix.
+
+        Each model is a natively multi-output learner fitted once per fold on the
+        full (rows, max_horizon) target matrix; metrics are still reported per
+        horizon in the same layout as run_forecasting_foundry.
+        """
+        logger.info(f"Step 2/4: Running Multi-Horizon Foundry (1-{max_horizon} days, one fit per model)...")
+        # The multi-output design uses fixed lags, float64 frames and untuned models
+        ignored = [option for option, enabled in (('lean', self.lean), ('auto_lags', self.auto_lags),
+                                                  ('tune', self.tune)) if enabled]
+        if ignored:
+            logger.warning(f"Multi-horizon mode ignores {', '.join(ignored)} (fixed lags, untuned models).")
+        self.results["forecasting"] = {}
+        self.trained_models = {}
+        self.prediction_tables = []
+        horizons = np.arange(1, max_horizon + 1)
+
+        data_with_features = self.create_features(df)
+        targets = pd.DataFrame({h: data_with_features[self.target_column].shift(-h) for h in horizons})
+        data_with_features = data_with_features.join(targets.add_prefix('target_')).dropna()
+
+        if self.regime_aware:
+            self.results["regimes"] = detect_regimes(self.pre_test_rows(data_with_features), end=df.index.max())
+            regime_start = pd.Timestamp(self.results["regimes"]["current_regime_start"])
+            data_with_features = data_with_features.loc[regime_start:]
+            logger.info(f"    Current regime starts {regime_start.strftime('%Y-%m-%d')} – training window limited to it.")
+
+        target_cols = [f'target_{h}' for h in horizons]
+        feature_cols = [col for col in data_with_features.columns
+                        if self.target_column not in col and col not in target_cols]
+        X = data_with_features[feature_cols]
+        Y = data_with_features[target_cols].to_numpy()
+        logger.info(f"    Training with {len(feature_cols)} features and {max_horizon} target columns.")
+
+        models = {"Ridge": Ridge()}
+        if not self.quick_mode:
+            models["Random_Forest"] = RandomForestRegressor(random_state=42, n_jobs=-1)
+            models["Extra_Trees"] = ExtraTreesRegressor(random_state=42, n_jobs=-1)
+
+        n_splits = max(2, min(5, len(X) // MIN_CV_FOLD_ROWS - 1))
+        tscv = TimeSeriesSplit(n_splits=n_splits)
+
+        # cv_scores[name] is (folds, horizons): every fold scores all horizons at once
+        cv_scores = {name: [] for name in models.keys()}
+        for train_idx, test_idx in tscv.split(X):
+            for name, model in models.items():
+                model.fit(X.iloc[train_idx], Y[train_idx])
+                cv_scores[name].append(r2_score(Y[test_idx], model.predict(X.iloc[test_idx]), multioutput='raw_values'))
+
+        X_train_final, X_test_final = X.iloc[train_idx], X.iloc[test_idx]
+        Y_train_final, Y_test_final = Y[train_idx], Y[test_idx]
+        test_dates = X_test_final.index
+
+        final_preds, final_r2, final_mae, fit_seconds = {}, {}, {}, {}
+        for name, model in models.items():
+            fit_start = time.time()
+            model.fit(X_train_final, Y_train_final)
+            fit_seconds[name] = time.time() - fit_start
+            final_preds[name] = model.predict(X_test_final)
+            final_r2[name] = r2_score(Y_test_final, final_preds[name], multioutput='raw_values')
+            final_mae[name] = mean_absolute_error(Y_test_final, final_preds[name], multioutput='raw_values')
+
+        names = list(models.keys())
+        r2_matrix = np.vstack([final_r2[name] for name in names])
+        horizon_champions = [names[i] for i in np.argmax(r2_matrix, axis=0)]
+
+        for i, h in enumerate(horizons):
+            horizon_key = f"{h}_day"
+            benchmark = {
+                name: {
+                    "r2": float(final_r2[name][i]),
+                    "mae": float(final_mae[name][i]),
+                    "cv_r2_mean": float(np.mean(np.asarray(cv_scores[name])[:, i])),
+                    "cv_r2_std": float(np.std(np.asarray(cv_scores[name])[:, i]))
+                }
+                for name in names
+            }
+            champion_name = horizon_champions[i]
+            self.results["forecasting"][horizon_key] = {
+                "mode": "multi_output",
+                "benchmark": benchmark,
+                "champion": {
+                    "name": champion_name,
+                    **benchmark[champion_name],
+                    "test_start": test_dates.min().strftime('%Y-%m-%d'),
+                    "test_end": test_dates.max().strftime('%Y-%m-%d'),
+                    "n_predictions": len(test_dates)
+                },
+                "training_window": {
+                    "start": X.index.min().strftime('%Y-%m-%d'),
+                    "end": X.index.max().strftime('%Y-%m-%d'),
+                    "rows": len(X),
+                    "cv_splits": n_splits
+                }
+            }
+            self.prediction_tables.append(build_prediction_table(
+                int(h), champion_name, test_dates, Y_test_final[:, i], final_preds[champion_name][:, i]
+            ))
+
+        mean_r2 = {name: float(np.mean(final_r2[name])) for name in names}
+        self.results["multi_horizon"] = {
+            "max_horizon": int(max_horizon),
+            "models": names,
+            "mean_r2": mean_r2,
+            "fit_seconds": {name: float(t) for name, t in fit_seconds.items()},
+            "best_model": max(mean_r2, key=mean_r2.get),
+            "lags": {col: DEFAULT_LAGS for col in self.lag_columns(df)},
+            "ignored_options": ignored
+        }
+        logger.info(f"✅ Multi-Horizon Foundry complete. Best curve: {self.results['multi_horizon']['best_model']} "
+                    f"(mean R² {max(mean_r2.values()):.3f} over {max_horizon} horizons)")
     
     def calculate_overall_rankings(self):
         logger.info("Step 3/4: Calculating Overall Model Rankings...")
@@ -343,6 +675,18 @@ class AtlasEngine:
                          key=lambda x: x[1], reverse=True)
         self.results['overall_rankings'] = rankings
         logger.info(f"🏆 Top model (Avg CV R²): {self.results['overall_rankings'][0][0]}")
+        
+        # Probabilistic skill: mean CV CRPS of the conformal quantile forecasts (lower is better)
+        crps_scores = {}
+        for horizon_data in self.results['forecasting'].values():
+            for model_name, metrics in horizon_data['benchmark'].items():
+                if 'cv_crps' in metrics:
+                    crps_scores.setdefault(model_name, []).append(metrics['cv_crps'])
+        if crps_scores:
+            self.results['probabilistic_rankings'] = sorted(
+                [(name, float(np.mean(scores))) for name, scores in crps_scores.items()], key=lambda x: x[1]
+            )
+            logger.info(f"🎯 Top model (Avg CV CRPS): {self.results['probabilistic_rankings'][0][0]}")
 
     def generate_business_insights(self):
         logger.info("Step 4/4: Generating Business Insights...")
@@ -378,10 +722,8 @@ class AtlasEngine:
                 }
                 
                 # Risk assessment
-                if 'confidence_lower' in data and 'confidence_upper' in data:
-                    avg_confidence_width = np.mean([
-                        u - l for u, l in zip(data['confidence_upper'], data['confidence_lower'])
-                    ])
+                if 'confidence_interval' in data:
+                    avg_confidence_width = data['confidence_interval']['mean_width']
                     insights["risk_assessment"][horizon] = {
                         "uncertainty_band": f"±{avg_confidence_width/2:.0f} USD/TEU",
                         "volatility_rating": "High" if avg_confidence_width > 500 else "Medium" if avg_confidence_width > 200 else "Low"
@@ -409,13 +751,26 @@ class AtlasEngine:
         self.results["business_insights"] = insights
         logger.info("✅ Business insights generated.")
 
-    def run_all(self, forecast_horizon=None, output_file=None):
+    def register_champions(self, registry, results_file=None):
+        """Stores each horizon's champion in the model registry for serving and drift checks."""
+        for horizon_key, trained in self.trained_models.items():
+            registry.register(
+                horizon_key, trained["name"], trained["model"], trained["feature_cols"],
+                self.results["forecasting"][horizon_key]["benchmark"][trained["name"]],
+                trained["train_end"], lags=trained["lags"], results_file=results_file
+            )
+        logger.info(f"Registered {len(self.trained_models)} champion model(s) in {registry.root}")
+
+    def run_all(self, forecast_horizon=None, output_file=None, registry=None, df=None, multi_horizon=None):
         start_time = time.time()
         mode_str = "Quick" if self.quick_mode else "Full"
         logger.info(f"🚀 Starting ATLAS Engine V2.0 ({mode_str} Mode)...")
         
-        full_df = self.load_data()
-        self.run_forecasting_foundry(full_df, forecast_horizon)
+        full_df = df if df is not None else self.load_data()
+        if multi_horizon:
+            self.run_multi_horizon_foundry(full_df, multi_horizon)
+        else:
+            self.run_forecasting_foundry(full_df, forecast_horizon, registry=registry)
         self.calculate_overall_rankings()
         self.generate_business_insights()
         
@@ -424,9 +779,17 @@ class AtlasEngine:
         else:
             mode_suffix = "_quick" if self.quick_mode else ""
             filename = f"atlas_v2_results_{datetime.now().strftime('%Y%m%d_%H%M%S')}{mode_suffix}.json"
+        
+        # One columnar file for all horizons; the JSON only references it
+        store_filename = f"{os.path.splitext(filename)[0]}_predictions.arrow"
+        self.results["predictions_store"] = write_prediction_store(self.prediction_tables, store_filename)
+        logger.info(f"Saved {self.results['predictions_store']['rows']} prediction rows to {store_filename}")
             
         with open(filename, 'w') as f:
             json.dump(self.results, f, indent=4)
+        
+        if registry is not None:
+            self.register_champions(registry, results_file=filename)
             
         runtime = time.time() - start_time
         logger.info(f"🎉 ATLAS V2.0 analysis complete. Results saved to {filename} (Runtime: {runtime:.1f}s)")
@@ -449,8 +812,34 @@ def main():
                        help='Quick mode: Ridge only, 7-day horizon')
     parser.add_argument('--output', type=str, 
                        help='Output JSON filename')
+    parser.add_argument('--registry', type=str,
+                       help='Model registry directory to store champion models in')
+    parser.add_argument('--regime-aware', action='store_true',
+                       help='Train only on the current regime found by change-point detection')
+    parser.add_argument('--auto-lags', action='store_true',
+                       help='Select lags per input from FFT cross-correlations instead of fixed [1, 7, 14, 30]')
+    parser.add_argument('--tune', action='store_true',
+                       help='Successive-halving search for LightGBM/XGBoost/CatBoost (cached in --registry)')
+    parser.add_argument('--tuning-budget', type=float, default=10.0, metavar='MINUTES',
+                       help='CPU-minutes the whole tuning run may use (default: 10)')
+    parser.add_argument('--lean', action='store_true',
+                       help='Memory-lean mode: one float32 feature base, models fitted on array views')
+    parser.add_argument('--trace-memory', action='store_true',
+                       help='Report the foundry\'s peak Python/NumPy allocations (tracemalloc; slower), '
+                            'comparable between runs with and without --lean')
+    parser.add_argument('--multi-horizon', type=int, metavar='H',
+                       help=f'Fit multi-output models once for every horizon 1..H (max {MAX_MULTI_HORIZON})')
     
     args = parser.parse_args()
+    if args.multi_horizon is not None and not 1 <= args.multi_horizon <= MAX_MULTI_HORIZON:
+        parser.error(f'--multi-horizon must be between 1 and {MAX_MULTI_HORIZON}')
+    if args.multi_horizon and args.registry:
+        logger.warning("Multi-horizon models are not registered; run without --multi-horizon to populate the registry.")
+    if args.multi_horizon:
+        ignored = [flag for flag, enabled in (('--lean', args.lean), ('--auto-lags', args.auto_lags),
+                                              ('--tune', args.tune)) if enabled]
+        if ignored:
+            parser.error(f"{', '.join(ignored)} cannot be combined with --multi-horizon")
     
     # Quick mode overrides forecast horizon
     if args.quick:
@@ -458,8 +847,13 @@ def main():
     else:
         forecast_horizon = args.forecast
     
-    engine = AtlasEngine(quick_mode=args.quick)
-    engine.run_all(forecast_horizon=forecast_horizon, output_file=args.output)
+    registry = ModelRegistry(args.registry) if args.registry else None
+    
+    engine = AtlasEngine(quick_mode=args.quick, regime_aware=args.regime_aware, auto_lags=args.auto_lags,
+                         tune=args.tune, tuning_budget_minutes=args.tuning_budget, lean=args.lean,
+                         trace_memory=args.trace_memory)
+    engine.run_all(forecast_horizon=forecast_horizon, output_file=args.output, registry=registry,
+                   multi_horizon=args.multi_horizon)
 
 if __name__ == "__main__":
     main()
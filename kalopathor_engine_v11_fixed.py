@@ -18,7 +18,7 @@ import logging
 
 # Install packages BEFORE importing them
 def install_packages():
-    packages = ['yfinance', 'xgboost', 'lightgbm', 'catboost', 'scikit-learn', 'shap']
+    packages = ['yfinance', 'xgboost', 'lightgbm', 'catboost', 'scikit-learn', 'shap', 'pyarrow']
     for package in packages:
         try:
             __import__(package.split('==')[0])
@@ -37,7 +37,9 @@ from sklearn.metrics import mean_absolute_error, r2_score
 import lightgbm as lgb
 import xgboost as xgb
 from catboost import CatBoostRegressor
-import yfinance as yf
+
+from atlas_store import load_lane_csv
+from atlas_exog import load_exog_panel
 
 # Set up CatBoost for Windows compatibility
 os.environ["CATBOOST_DATA_DIR"] = tempfile.mkdtemp()
@@ -55,27 +57,18 @@ class KalopathorEngine:
     def load_data(self):
         logger.info("Step 1/3: Loading Granular Trade Lane Data...")
         try:
-            feuw_df = pd.read_csv('xsicfeuw_data.csv', index_col='Date', parse_dates=True)
-            uwfe_df = pd.read_csv('xsiuwfe_data.csv', index_col='Date', parse_dates=True)
-            feuw_df.rename(columns={'XSICFEUW': 'feuw_price'}, inplace=True)
-            uwfe_df.rename(columns={'XSICUWFE': 'uwfe_price'}, inplace=True)
+            # Parsed once into a typed cache, memory-mapped on later runs
+            feuw_df = load_lane_csv('xsicfeuw_data.csv', 'XSICFEUW', 'feuw_price')
+            uwfe_df = load_lane_csv('xsiuwfe_data.csv', 'XSICUWFE', 'uwfe_price')
         except FileNotFoundError as e:
             logger.error(f"CRITICAL ERROR: Data file not found - {e.filename}.")
             sys.exit(1)
             
-        # Download market data with proper error handling
-        try:
-            market_data = yf.download(['BDRY', 'BZ=F'], start='2018-01-01', end=datetime.now(), progress=False)
-            features_df = pd.DataFrame({
-                'bdi_proxy_price': market_data['Close']['BDRY'],
-                'fuel_price': market_data['Close']['BZ=F']
-            })
-        except Exception as e:
-            logger.warning(f"Could not download market data: {e}")
-            features_df = pd.DataFrame()
+        # Market inputs come from the shared daily exogenous panel (already calendar-aligned)
+        features_df = load_exog_panel()
 
-        df = feuw_df.join(uwfe_df, how='inner').join(features_df, how='left')
-        df = df.resample('D').ffill().bfill().dropna()
+        df = feuw_df.join(uwfe_df, how='inner').resample('D').ffill()
+        df = df.join(features_df, how='left').bfill().dropna()
         
         # Check if market features are available
         if features_df.empty:
@@ -100,8 +93,9 @@ class KalopathorEngine:
         df_feat['trade_imbalance_ratio_lag_1'] = (df_feat['feuw_price'].shift(1) / 
                                                  (uwfe_price_shifted + 1e-6))
         
-        # Lags on all NON-TARGET input variables
-        for col in ['uwfe_price', 'bdi_proxy_price', 'fuel_price', 'trade_imbalance_ratio_lag_1']:
+        # Lags on all NON-TARGET input variables, including every exogenous series
+        lag_columns = [col for col in df.columns if col not in (self.target_column, 'target')]
+        for col in lag_columns + ['trade_imbalance_ratio_lag_1']:
             if col in df_feat.columns:
                 for lag in [1, 7, 14, 30]:
                     df_feat[f'{col}_lag_{lag}'] = df_feat[col].shift(lag)
@@ -0,0 +1,638 @@
+# test_atlas_engine.py
+# Offline tests for the ATLAS V2.0 engine
+# Uses a synthetic freight frame so no data files or market downloads are needed
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from kalopathor_2_engine import AtlasEngine
+from atlas_store import read_frame, read_prediction_store, load_lane_csv, write_frame
+from atlas_scheduler import AtlasScheduler
+from atlas_lags import select_lags
+from atlas_explain import ExplanationCache, explain_model
+from atlas_exog import load_exog_panel
+from atlas_registry import ModelRegistry
+from atlas_tuning import successive_halving
+from atlas_stream import FreightStream
+from atlas_benchmark import generate_freight_frame, run_benchmark, compare_to_baseline
+from atlas_scoring import QUANTILES, score_folds
+from atlas_reconcile import Hierarchy, reconcile
+from atlas_service import ForecastService, make_server
+
+
+def make_freight_frame(n_days=400, seed=0):
+    """Synthetic daily frame with the same columns AtlasEngine.load_data returns."""
+    rng = np.random.default_rng(seed)
+    index = pd.date_range('2022-01-01', periods=n_days, freq='D')
+    uwfe = 700 + np.cumsum(rng.normal(0, 5, n_days))
+    bdi = 20 + np.cumsum(rng.normal(0, 0.3, n_days))
+    fuel = 80 + np.cumsum(rng.normal(0, 1, n_days))
+    feuw = 2.5 * uwfe + 10 * bdi + rng.normal(0, 20, n_days)
+    return pd.DataFrame({
+        'feuw_price': feuw,
+        'uwfe_price': uwfe,
+        'bdi_proxy_price': bdi,
+        'fuel_price': fuel
+    }, index=index)
+
+
+@pytest.fixture
+def freight_df():
+    return make_freight_frame()
+
+
+class TestAtlasEngine:
+
+    def test_prediction_store_replaces_json_lists(self, freight_df, tmp_path, monkeypatch):
+        """Predictions are written once to the columnar store and only referenced from JSON."""
+        monkeypatch.chdir(tmp_path)
+        engine = AtlasEngine(quick_mode=True)
+        engine.load_data = lambda: freight_df
+        engine.run_all(forecast_horizon=7, output_file='results.json')
+
+        with open('results.json') as f:
+            results = json.load(f)
+
+        champion = results['forecasting']['7_day']['champion']
+        assert 'predictions' not in champion
+        assert 'confidence_lower' not in results['forecasting']['7_day']
+
+        store = results['predictions_store']
+        assert store['format'] == 'arrow_ipc'
+        assert os.path.exists(store['path'])
+        assert not list(tmp_path.glob('*.csv'))
+
+        assert 'cv_crps' in results['forecasting']['7_day']['benchmark']['Ridge']
+        assert 0 <= results['forecasting']['7_day']['confidence_interval']['coverage'] <= 1
+        assert results['probabilistic_rankings'][0][0] == 'Ridge'
+
+        preds = read_prediction_store(store['path'], columns=['date', 'predicted'], horizon=7, model=champion['name'])
+        assert list(preds.columns) == ['date', 'predicted']
+        assert len(preds) == champion['n_predictions']
+        assert preds['predicted'].notna().all()
+
+    def test_regime_aware_training_window(self, tmp_path, monkeypatch):
+        """A level shift is detected and training is limited to the regime after it."""
+        monkeypatch.chdir(tmp_path)
+        df = make_freight_frame(n_days=900)
+        df.iloc[:400, df.columns.get_loc('feuw_price')] *= 3
+
+        engine = AtlasEngine(quick_mode=True, regime_aware=True)
+        engine.run_forecasting_foundry(df, forecast_horizon=7)
+
+        regime_start = pd.Timestamp(engine.results['regimes']['current_regime_start'])
+        assert abs((regime_start - df.index[400]).days) <= 7
+        window = engine.results['forecasting']['7_day']['training_window']
+        assert pd.Timestamp(window['start']) >= regime_start
+        assert window['rows'] < 900 - 400
+
+    def test_regimes_are_fitted_without_the_final_test_fold(self, tmp_path, monkeypatch):
+        """A level shift that only the final test fold contains does not move the training window."""
+        monkeypatch.chdir(tmp_path)
+        df = make_freight_frame(n_days=1500)
+        df.iloc[1100:, df.columns.get_loc('feuw_price')] *= 3
+
+        engine = AtlasEngine(quick_mode=True, regime_aware=True)
+        engine.run_forecasting_foundry(df, forecast_horizon=7)
+
+        regime_start = pd.Timestamp(engine.results['regimes']['current_regime_start'])
+        test_start = pd.Timestamp(engine.results['forecasting']['7_day']['champion']['test_start'])
+        assert regime_start < df.index[1000] <= test_start
+        assert all(pd.Timestamp(date) < test_start
+                   for dates in engine.results['regimes']['boundaries'].values() for date in dates)
+
+    def test_auto_lags_limit_feature_matrix(self, freight_df, tmp_path, monkeypatch):
+        """With auto lags only the selected lag columns reach the models."""
+        monkeypatch.chdir(tmp_path)
+        engine = AtlasEngine(quick_mode=True, auto_lags=True)
+        engine.run_forecasting_foundry(freight_df, forecast_horizon=7)
+
+        lags = engine.results['forecasting']['7_day']['lags']
+        assert sum(len(v) for v in lags.values()) <= 16
+        feature_cols = engine.trained_models['7_day']['feature_cols']
+        lag_cols = [col for col in feature_cols if '_lag_' in col]
+        assert sorted(lag_cols) == sorted(f"{col}_lag_{lag}" for col, col_lags in lags.items() for lag in col_lags)
+
+    def test_multi_horizon_fits_whole_curve_once(self, freight_df, tmp_path, monkeypatch):
+        """One multi-output Ridge fit reproduces per-horizon Ridge fits for every horizon 1..H."""
+        from sklearn.linear_model import Ridge
+        from sklearn.metrics import r2_score
+
+        monkeypatch.chdir(tmp_path)
+        engine = AtlasEngine(quick_mode=True)
+        engine.load_data = lambda: freight_df
+        engine.run_all(output_file='results.json', multi_horizon=10)
+
+        forecasting = engine.results['forecasting']
+        assert list(forecasting) == [f"{h}_day" for h in range(1, 11)]
+        assert engine.results['multi_horizon']['best_model'] == 'Ridge'
+
+        preds = read_prediction_store(engine.results['predictions_store']['path'])
+        assert sorted(preds['horizon'].unique()) == list(range(1, 11))
+
+        # Rebuild the 7-day problem by hand on the same rows and final split
+        features = engine.create_features(freight_df)
+        features['target'] = features['feuw_price'].shift(-7)
+        features = features.loc[features.index <= freight_df.index[-11]].dropna()
+        feature_cols = [c for c in features.columns if 'feuw_price' not in c and c != 'target']
+        test_start = pd.Timestamp(forecasting['7_day']['champion']['test_start'])
+        train, test = features.loc[:test_start - pd.Timedelta(days=1)], features.loc[test_start:]
+        single = Ridge().fit(train[feature_cols], train['target']).predict(test[feature_cols])
+        assert forecasting['7_day']['benchmark']['Ridge']['r2'] == pytest.approx(r2_score(test['target'], single))
+
+    def test_multi_horizon_reports_unsupported_options(self, freight_df, tmp_path, monkeypatch, caplog):
+        """Lean, auto-lag and tuning options are flagged in multi-horizon mode instead of silently dropped."""
+        import sys
+        import kalopathor_2_engine
+
+        monkeypatch.chdir(tmp_path)
+        engine = AtlasEngine(quick_mode=True, explanation_cache_dir=None, lean=True, auto_lags=True)
+        with caplog.at_level('WARNING'):
+            engine.run_multi_horizon_foundry(freight_df, 3)
+        assert engine.results['multi_horizon']['ignored_options'] == ['lean', 'auto_lags']
+        assert 'ignores lean, auto_lags' in caplog.text
+
+        monkeypatch.setattr(sys, 'argv', ['kalopathor_2_engine.py', '--multi-horizon', '5', '--tune'])
+        with pytest.raises(SystemExit):
+            kalopathor_2_engine.main()
+
+    def test_lean_mode_matches_standard_foundry(self, tmp_path, monkeypatch):
+        """Lean mode trains on float32 views of one shared base and reproduces the standard metrics."""
+        monkeypatch.chdir(tmp_path)
+        df = make_freight_frame(n_days=600)
+        standard = AtlasEngine(quick_mode=True, explanation_cache_dir=None, trace_memory=True)
+        standard.run_forecasting_foundry(df, forecast_horizon=7)
+        lean = AtlasEngine(quick_mode=True, explanation_cache_dir=None, lean=True, trace_memory=True)
+        lean.run_forecasting_foundry(df, forecast_horizon=7)
+
+        expected = standard.results['forecasting']['7_day']
+        result = lean.results['forecasting']['7_day']
+        assert result['training_window'] == expected['training_window']
+        assert lean.trained_models['7_day']['feature_cols'] == standard.trained_models['7_day']['feature_cols']
+        assert result['benchmark']['Ridge']['r2'] == pytest.approx(expected['benchmark']['Ridge']['r2'], abs=1e-3)
+        assert lean.results['memory']['lean'] is True
+        # Both peaks are traced around the foundry alone, so they compare the two modes
+        assert 0 < lean.results['memory']['foundry_peak_alloc_mb'] < standard.results['memory']['foundry_peak_alloc_mb']
+
+        X7, _ = lean.lean_design(df, 7)
+        X30, _ = lean.lean_design(df, 30)
+        assert X7.to_numpy().dtype == np.float32 and X7.to_numpy().flags['C_CONTIGUOUS']
+        assert np.shares_memory(X7.to_numpy(), X30.to_numpy())
+
+
+def test_successive_halving_promotes_survivors_with_more_rounds():
+    """Each rung keeps 1/eta of the configs and gives them eta times more boosting rounds."""
+    from sklearn.model_selection import TimeSeriesSplit
+
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(600, 5))
+    y = 3 * X[:, 0] + rng.normal(0, 0.3, 600)
+    folds = list(TimeSeriesSplit(n_splits=3).split(X))[:-1]
+
+    result = successive_halving('LightGBM', X, y, folds, n_configs=9, min_rounds=20, max_rounds=180,
+                                eta=3, early_stopping_rounds=10, n_jobs=2)
+    rungs = pd.DataFrame(result['history']).groupby('rounds').size()
+    assert rungs.to_dict() == {20: 9, 60: 3, 180: 1}
+    assert 1 <= result['params']['n_estimators'] <= 180
+    assert successive_halving('LightGBM', X, y, folds, cpu_budget_minutes=0) is None
+
+
+def test_early_stopping_holds_out_the_tail_of_the_training_fold(monkeypatch):
+    """The rows that stop boosting come from the end of the training fold, never from the scored slice."""
+    import atlas_tuning
+    from sklearn.model_selection import TimeSeriesSplit
+
+    X = np.arange(300, dtype=np.float64).reshape(-1, 1)
+    folds = list(TimeSeriesSplit(n_splits=3).split(X))
+    calls = []
+
+    def fit(family, config, n_rounds, early_stopping_rounds, n_jobs, X_train, y_train, X_stop, y_stop, X_val):
+        calls.append((X_train[:, 0], X_stop[:, 0], X_val[:, 0]))
+        return np.zeros(len(X_val)), n_rounds
+
+    monkeypatch.setattr(atlas_tuning, '_fit_with_early_stopping', fit)
+    atlas_tuning._evaluate('LightGBM', {}, X, X[:, 0], folds, 20, 10, 1)
+
+    for (train_idx, val_idx), (fit_rows, stop_rows, val_rows) in zip(folds, calls):
+        assert np.array_equal(np.concatenate([fit_rows, stop_rows]), train_idx)
+        assert len(stop_rows) == int(len(train_idx) * atlas_tuning.EARLY_STOPPING_FRACTION)
+        assert np.array_equal(val_rows, val_idx)
+
+
+def test_tuned_params_are_cached_in_registry(freight_df, tmp_path):
+    """A second tuning pass for the same horizon and features reuses the registry entry."""
+    from sklearn.model_selection import TimeSeriesSplit
+
+    registry = ModelRegistry(str(tmp_path / 'registry'))
+    engine = AtlasEngine(tune=True, explanation_cache_dir=None)
+    X = freight_df[['uwfe_price', 'bdi_proxy_price', 'fuel_price']]
+    y = freight_df['feuw_price']
+
+    first = engine.tune_models(X, y, TimeSeriesSplit(n_splits=3), '7_day', list(X.columns), registry, 0.05)
+    assert set(first) == {'LightGBM', 'XGBoost', 'CatBoost'}
+    assert not any(entry['cached'] for entry in first.values())
+
+    reloaded = ModelRegistry(str(tmp_path / 'registry'))
+    second = engine.tune_models(X, y, TimeSeriesSplit(n_splits=3), '7_day', list(X.columns), reloaded, 0.05)
+    assert all(entry['cached'] for entry in second.values())
+    assert second['CatBoost']['params'] == first['CatBoost']['params']
+    assert reloaded.tuned_params('7_day', 'CatBoost', ['uwfe_price']) is None
+    # A search that saw rows from the scored folds is not reused
+    assert reloaded.tuned_params('7_day', 'CatBoost', list(X.columns), before=X.index[50]) is None
+
+
+def test_tuning_never_sees_the_scored_folds(freight_df, monkeypatch):
+    """Successive halving only gets rows before the first outer CV test fold."""
+    from sklearn.model_selection import TimeSeriesSplit
+    import kalopathor_2_engine
+
+    calls = []
+    monkeypatch.setattr(kalopathor_2_engine, 'successive_halving',
+                        lambda family, X, y, folds, **kwargs: calls.append((X, folds)))
+    X = freight_df[['uwfe_price', 'bdi_proxy_price', 'fuel_price']]
+    tscv = TimeSeriesSplit(n_splits=3)
+    AtlasEngine(tune=True, explanation_cache_dir=None).tune_models(X, freight_df['feuw_price'], tscv, '7_day', list(X.columns))
+
+    first_test = min(test_idx[0] for _, test_idx in tscv.split(X))
+    assert len(calls) == 3
+    for X_tune, folds in calls:
+        assert len(X_tune) == first_test
+        assert len(folds) >= 2 and all(test_idx[-1] < first_test for _, test_idx in folds)
+
+
+def test_stream_rows_match_batch_features(freight_df, tmp_path):
+    """Rows emitted by append_observation equal create_features on the full history, also after a reopen."""
+    from kalopathor_2_engine import DEFAULT_LAGS
+
+    engine = AtlasEngine(explanation_cache_dir=None)
+    lags = dict({col: DEFAULT_LAGS for col in engine.lag_columns(freight_df)}, fuel_price=[1, 3, 60])
+    journal = str(tmp_path / 'stream.bin')
+    history, live = freight_df.iloc[:300], freight_df.iloc[300:].drop(freight_df.index[350])
+
+    stream = FreightStream.from_frame(history, journal, lags)
+    rows = []
+    for i, (date, row) in enumerate(live.iterrows()):
+        if i == 25:
+            stream = FreightStream(journal, lags)  # restart mid-stream from the journal
+        rows.append(stream.append_observation(date, row['feuw_price'], row['uwfe_price'],
+                                              bdi_proxy_price=row['bdi_proxy_price'], fuel_price=row['fuel_price']))
+
+    expected = engine.create_features(freight_df.drop(freight_df.index[350]).asfreq('D').ffill(), lags=lags)
+    expected = expected.loc[live.index]
+    streamed = pd.DataFrame(rows)
+    assert list(streamed.columns) == list(expected.columns)
+    np.testing.assert_allclose(streamed.to_numpy(), expected.to_numpy())
+
+    # The skipped day was forward-filled into the journal
+    assert len(stream.to_frame()) == len(freight_df)
+    with pytest.raises(ValueError):
+        stream.append_observation(freight_df.index[-1], 1.0, 1.0)
+
+
+def test_benchmark_reports_scenarios_and_regressions():
+    """The benchmark times every scenario on synthetic data and flags slowdowns against a baseline."""
+    df = generate_freight_frame(n_rows=1000, n_lanes=3, n_exog=4)
+    assert list(df.columns) == ['feuw_price', 'uwfe_price', 'lane_3_price', 'exog_0', 'exog_1', 'exog_2', 'exog_3']
+
+    results = run_benchmark(n_rows=1000, n_exog=1, repeats=1, families=['Ridge'])
+    assert set(results['scenarios']) == {'load', 'features', 'fit_Ridge', 'predict_Ridge', 'foundry'}
+    assert all(timing['median_seconds'] > 0 for timing in results['scenarios'].values())
+
+    slower = json.loads(json.dumps(results))
+    slower['scenarios']['foundry']['median_seconds'] *= 2
+    assert [r['scenario'] for r in compare_to_baseline(slower, results)] == ['foundry']
+    assert compare_to_baseline(results, slower) == []
+    slower['config']['rows'] = 2000
+    assert compare_to_baseline(results, slower) == []
+
+
+def test_probabilistic_scores_match_per_fold_loop():
+    """Vectorised conformal scoring equals a straightforward loop over models, folds and quantiles."""
+    rng = np.random.default_rng(1)
+    actuals = rng.normal(100, 10, (4, 50))
+    preds = actuals[None] + rng.normal(0, [[[2.0]], [[8.0]]], (2, 4, 50))
+    scores = score_folds(preds, actuals)
+
+    m, k = 1, 3
+    residuals = (actuals[:k] - preds[m, :k]).ravel()
+    pinball = []
+    for tau in QUANTILES:
+        q = preds[m, k] + np.quantile(residuals, tau)
+        diff = actuals[k] - q
+        pinball.append(np.mean(np.where(diff >= 0, tau * diff, (tau - 1) * diff)))
+    lower = preds[m, k] + np.quantile(residuals, 0.1)
+    upper = preds[m, k] + np.quantile(residuals, 0.9)
+
+    np.testing.assert_allclose(scores['pinball'][m, k - 1], pinball)
+    assert scores['crps'][m, k - 1] == pytest.approx(2 * np.mean(pinball))
+    assert scores['coverage'][m, k - 1] == pytest.approx(np.mean((actuals[k] >= lower) & (actuals[k] <= upper)))
+    assert scores['width'][m, k - 1] == pytest.approx(np.mean(upper - lower))
+    # The noisier model has the worse probabilistic skill
+    assert scores['crps'][1].mean() > scores['crps'][0].mean()
+
+
+def test_reconciliation_matches_dense_mint_and_is_coherent():
+    """The constraint-space solve equals S (S'W^-1 S)^-1 S'W^-1 y_hat and sums up exactly."""
+    codes = ['M01AB', 'M01AE', 'N02BA', 'N02BE', 'N05B', 'N05C', 'R03', 'R06']
+    hierarchy = Hierarchy.from_prefixes(codes)
+    assert set(hierarchy.aggregates) == {'Total', 'M', 'N', 'R', 'M01A', 'N02B'}
+
+    rng = np.random.default_rng(3)
+    base = rng.normal(50, 10, (len(hierarchy.nodes), 5))
+    residuals = rng.normal(0, rng.uniform(1, 5, (len(hierarchy.nodes), 1)), (len(hierarchy.nodes), 200))
+
+    S = hierarchy.S.toarray()
+    W_inv = np.diag(1 / np.var(residuals, axis=1))
+    dense = S @ np.linalg.solve(S.T @ W_inv @ S, S.T @ W_inv @ base)
+    reconciled = reconcile(hierarchy, base, 'mint_diag', residuals)
+
+    np.testing.assert_allclose(reconciled, dense)
+    np.testing.assert_allclose(hierarchy.C @ reconciled, 0, atol=1e-9)
+    np.testing.assert_allclose(reconcile(hierarchy, base, 'bottom_up'), S @ base[len(hierarchy.aggregates):])
+    np.testing.assert_allclose(reconcile(hierarchy, base[:, 0], 'ols'), reconcile(hierarchy, base, 'ols')[:, 0])
+
+
+def test_service_batches_concurrent_requests(freight_df, tmp_path):
+    """Concurrent HTTP predictions are scored in shared batches and match the registered model."""
+    import threading
+    import urllib.request
+    from concurrent.futures import ThreadPoolExecutor
+    from sklearn.linear_model import Ridge
+
+    engine = AtlasEngine(explanation_cache_dir=None)
+    features = engine.create_features(freight_df).dropna()
+    feature_cols = [col for col in features.columns if col != 'feuw_price' and '_lag_' in col]
+    model = Ridge().fit(features[feature_cols], features['feuw_price'].shift(-7).ffill())
+    registry = ModelRegistry(str(tmp_path / 'registry'))
+    registry.register('7_day', 'Ridge', model, feature_cols, {"mae": 1.0}, '2023-01-01')
+    journal = str(tmp_path / 'stream.bin')
+    FreightStream.from_frame(freight_df, journal, {col: [1, 7, 14, 30] for col in engine.lag_columns(freight_df)})
+
+    service = ForecastService(str(tmp_path / 'registry'), journal, max_wait_ms=50)
+    server = make_server(service, port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    def call(path, payload=None):
+        data = json.dumps(payload).encode() if payload is not None else None
+        with urllib.request.urlopen(urllib.request.Request(url + path, data=data)) as response:
+            return json.loads(response.read())
+
+    try:
+        rows = features[feature_cols].iloc[-40:]
+        requests = [{"horizon": "7_day", "instances": [row.to_dict()]} for _, row in rows.iterrows()]
+        with ThreadPoolExecutor(max_workers=20) as pool:
+            replies = list(pool.map(lambda request: call('/predict', request), requests))
+        np.testing.assert_allclose([reply['predictions'][0] for reply in replies], model.predict(rows))
+
+        latest = call('/forecast?horizon=7_day')
+        assert latest['prediction'] == pytest.approx(model.predict(features[feature_cols].iloc[[-1]])[0])
+        assert latest['as_of'] == freight_df.index[-1].strftime('%Y-%m-%d')
+
+        stats = call('/metrics')['7_day']
+        assert stats['requests'] == 41
+        assert stats['batches'] < stats['requests']
+        assert stats['p50_ms'] <= stats['p99_ms']
+    finally:
+        server.shutdown()
+        server.server_close()
+        service.close()
+
+
+def test_service_rejects_malformed_requests_without_failing_the_batch(freight_df, tmp_path):
+    """A wrong-width request gets a 400 and the requests batched with it still succeed."""
+    import threading
+    import urllib.error
+    import urllib.request
+    from concurrent.futures import ThreadPoolExecutor
+    from sklearn.linear_model import Ridge
+
+    feature_cols = ['uwfe_price', 'bdi_proxy_price', 'fuel_price']
+    model = Ridge().fit(freight_df[feature_cols], freight_df['feuw_price'])
+    registry = ModelRegistry(str(tmp_path / 'registry'))
+    registry.register('7_day', 'Ridge', model, feature_cols, {"mae": 1.0}, '2023-01-01')
+    journal = str(tmp_path / 'empty.bin')
+    FreightStream(journal, {'uwfe_price': [1]})
+
+    service = ForecastService(str(tmp_path / 'registry'), journal, max_wait_ms=200)
+    server = make_server(service, port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    def call(path, payload=None):
+        data = json.dumps(payload).encode() if payload is not None else None
+        try:
+            with urllib.request.urlopen(urllib.request.Request(url + path, data=data)) as response:
+                return response.status, json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            return e.code, json.loads(e.read())
+
+    try:
+        rows = freight_df[feature_cols].iloc[:4].to_numpy()
+        requests = [{"horizon": "7_day", "instances": [list(row)]} for row in rows]
+        requests.insert(2, {"horizon": "7_day", "instances": [[1.0, 2.0]]})
+        requests.append({"horizon": "7_day", "instances": [["a", "b", "c"]]})
+        with ThreadPoolExecutor(max_workers=len(requests)) as pool:
+            replies = list(pool.map(lambda request: call('/predict', request), requests))
+
+        assert [status for status, _ in replies] == [200, 200, 400, 200, 200, 400]
+        good = [reply['predictions'][0] for status, reply in replies if status == 200]
+        np.testing.assert_allclose(good, model.predict(freight_df[feature_cols].iloc[:4]))
+
+        status, reply = call('/forecast?horizon=7_day')
+        assert status == 400 and 'no observations' in reply['error']
+
+        status, reply = call('/predict', {"horizon": "7_day"})
+        assert status == 400 and 'instances' in reply['error']
+        status, reply = call('/observe', {"date": "2024-01-01", "feuw": 1.0})
+        assert status == 400 and 'uwfe' in reply['error']
+        status, reply = call('/predict', {"horizon": "30_day", "instances": [list(rows[0])]})
+        assert status == 404 and 'Unknown horizon' in reply['error']
+    finally:
+        server.shutdown()
+        server.server_close()
+        service.close()
+
+
+def test_select_lags_finds_planted_lead():
+    """A series that leads the target by 20 days gets lag 20 picked first."""
+    rng = np.random.default_rng(3)
+    driver = np.cumsum(rng.normal(size=1200))
+    noise = np.cumsum(rng.normal(size=1200))
+    target = np.roll(driver, 20) + 0.2 * rng.normal(size=1200)
+    df = pd.DataFrame({'driver': driver[50:], 'noise': noise[50:]})
+
+    lags = select_lags(df, target[50:], ['driver', 'noise'], max_lag=365, top_k=2, max_features=3)
+    assert 20 in lags['driver']
+    assert sum(len(v) for v in lags.values()) <= 3
+
+
+def test_tree_champion_explanations_are_cached(freight_df, tmp_path, monkeypatch):
+    """Tree models get TreeSHAP + permutation importance; a second call is served from cache."""
+    from sklearn.ensemble import RandomForestRegressor
+    import atlas_explain
+
+    X = freight_df[['uwfe_price', 'bdi_proxy_price', 'fuel_price']]
+    y = freight_df['feuw_price']
+    model = RandomForestRegressor(n_estimators=20, random_state=42).fit(X.iloc[:300], y.iloc[:300])
+    cache = ExplanationCache(str(tmp_path / 'explanations'))
+
+    first = explain_model(model, X.iloc[:300], X.iloc[300:], y.iloc[300:], cache=cache, n_jobs=1)
+    assert first['method'] == 'tree'
+    assert len(first['permutation_importance']) == 3
+    assert len(first['sample_explanations']) == 3
+
+    monkeypatch.setattr(atlas_explain, 'permutation_importance', None)
+    second = explain_model(model, X.iloc[:300], X.iloc[300:], y.iloc[300:], cache=cache, n_jobs=1)
+    assert second['fingerprint'] == first['fingerprint']
+    assert second['feature_importance'] == [list(item) for item in first['feature_importance']]
+
+
+def test_exog_panel_is_aligned_cached_and_lagged(tmp_path, monkeypatch):
+    """CSV series land on the daily panel at publication date, the store is reused, and engines lag them."""
+    import atlas_exog
+
+    monkeypatch.chdir(tmp_path)
+    monthly = pd.DataFrame({'Date': pd.date_range('2022-01-01', periods=12, freq='MS'), 'pmi': np.arange(12.0)})
+    monthly.to_csv('pmi.csv', index=False)
+    with open('atlas_exog.json', 'w') as f:
+        json.dump({"series": [{"name": "pmi", "source": "csv", "path": "pmi.csv", "column": "pmi",
+                               "calendar": "monthly", "publication_lag_days": 10}]}, f)
+
+    panel = load_exog_panel()
+    assert np.isnan(panel.loc['2022-01-10', 'pmi'])
+    assert panel.loc['2022-01-11', 'pmi'] == 0.0
+    assert panel.loc['2022-02-10', 'pmi'] == 0.0
+    assert panel.loc['2022-02-11', 'pmi'] == 1.0
+    assert not panel.to_numpy().flags.writeable  # read-only memory-mapped view
+
+    monkeypatch.setattr(atlas_exog, 'build_panel', None)
+    assert load_exog_panel().equals(panel)
+
+    df = make_freight_frame(n_days=60).join(panel, how='left').bfill()
+    features = AtlasEngine(quick_mode=True).create_features(df)
+    assert {'pmi_lag_1', 'pmi_lag_30', 'fuel_price_lag_7'} <= set(features.columns)
+
+
+def test_lane_csv_cache_is_reused_until_source_changes(tmp_path, monkeypatch):
+    """The raw CSV is parsed once; a changed source file invalidates the cached copy."""
+    monkeypatch.chdir(tmp_path)
+    raw = pd.DataFrame({'Date': pd.date_range('2024-01-01', periods=5, freq='D')[::-1], 'XSICFEUW': np.arange(5.0)})
+    raw.to_csv('lane.csv', index=False)
+
+    first = load_lane_csv('lane.csv', 'XSICFEUW', 'feuw_price')
+    assert first.index.is_monotonic_increasing
+    assert list(first['feuw_price']) == [4.0, 3.0, 2.0, 1.0, 0.0]
+
+    monkeypatch.setattr(pd, 'read_csv', None)
+    assert load_lane_csv('lane.csv', 'XSICFEUW', 'feuw_price').equals(first)
+    monkeypatch.undo()
+
+    monkeypatch.chdir(tmp_path)
+    pd.concat([pd.DataFrame({'Date': [pd.Timestamp('2024-01-06')], 'XSICFEUW': [9.0]}), raw]).to_csv('lane.csv', index=False)
+    updated = load_lane_csv('lane.csv', 'XSICFEUW', 'feuw_price')
+    assert len(updated) == 6 and updated['feuw_price'].iloc[-1] == 9.0
+
+
+def test_lane_csv_cache_is_keyed_by_path_and_columns(tmp_path, monkeypatch):
+    """Same-named CSVs in different directories and different column reads get separate cache entries."""
+    monkeypatch.chdir(tmp_path)
+    dates = pd.date_range('2024-01-01', periods=3, freq='D')
+    for folder, offset in (('a', 0.0), ('b', 100.0)):
+        os.makedirs(folder)
+        pd.DataFrame({'Date': dates, 'XSICFEUW': np.arange(3.0) + offset,
+                      'XSICUWFE': np.arange(3.0) - offset}).to_csv(f'{folder}/lane.csv', index=False)
+
+    a = load_lane_csv('a/lane.csv', 'XSICFEUW', 'feuw_price')
+    b = load_lane_csv('b/lane.csv', 'XSICFEUW', 'feuw_price')
+    other = load_lane_csv('a/lane.csv', 'XSICUWFE', 'uwfe_price')
+    assert list(a['feuw_price']) == [0.0, 1.0, 2.0]
+    assert list(b['feuw_price']) == [100.0, 101.0, 102.0]
+    assert list(other.columns) == ['uwfe_price'] and list(other['uwfe_price']) == [0.0, 1.0, 2.0]
+
+    monkeypatch.setattr(pd, 'read_csv', None)
+    assert load_lane_csv('a/lane.csv', 'XSICFEUW', 'feuw_price').equals(a)
+    assert load_lane_csv('b/lane.csv', 'XSICFEUW', 'feuw_price').equals(b)
+
+
+def test_rewritten_frame_leaves_mapped_readers_on_the_old_arrays(tmp_path, monkeypatch):
+    """write_frame renames new arrays into place and writes meta.json only once they are complete."""
+    directory = str(tmp_path / 'frame')
+    dates = pd.date_range('2024-01-01', periods=4, freq='D')
+    write_frame(pd.DataFrame({'feuw_price': np.arange(4.0)}, index=dates), directory)
+    before = read_frame(directory)
+
+    # No meta.json is in place while the arrays are being replaced
+    saved = []
+    real_save = np.save
+
+    def save(file, array):
+        saved.append(os.path.exists(os.path.join(directory, 'meta.json')))
+        real_save(file, array)
+
+    monkeypatch.setattr(np, 'save', save)
+    write_frame(pd.DataFrame({'feuw_price': np.arange(10.0, 12.0)}, index=dates[:2]), directory)
+    monkeypatch.undo()
+
+    assert saved == [False, False]
+    assert list(before['feuw_price']) == [0.0, 1.0, 2.0, 3.0]
+    assert list(read_frame(directory)['feuw_price']) == [10.0, 11.0]
+    assert sorted(os.listdir(directory)) == ['index.npy', 'meta.json', 'values.npy']
+
+
+class TestAtlasScheduler:
+
+    def test_retrains_only_on_drift(self, freight_df, tmp_path, monkeypatch):
+        """Unchanged inputs serve the cache; a level shift in the inputs triggers a retrain."""
+        monkeypatch.chdir(tmp_path)
+        current = {'df': freight_df}
+        monkeypatch.setattr(AtlasEngine, 'load_data', lambda self: current['df'])
+        watched = tmp_path / 'lane.csv'
+        watched.write_text('v1')
+
+        scheduler = AtlasScheduler(registry_dir='registry', watch_paths=[str(watched)], quick_mode=True)
+        assert scheduler.tick()['action'] == 'retrain'
+        assert scheduler.registry.horizons() == ['7_day']
+        assert scheduler.cached_forecast() is not None
+
+        assert scheduler.tick()['action'] == 'serve_cached'
+
+        shifted = make_freight_frame(n_days=60, seed=1)
+        shifted.index = shifted.index + (freight_df.index[-1] - shifted.index[0]) + pd.Timedelta(days=1)
+        shifted['uwfe_price'] += 400
+        current['df'] = pd.concat([freight_df, shifted])
+        watched.write_text('v2 with more rows')
+
+        decision = AtlasScheduler(registry_dir='registry', watch_paths=[str(watched)], quick_mode=True).tick()
+        assert decision['action'] == 'retrain'
+        assert any('uwfe_price' in reason for reason in decision['reasons'])
+
+    def test_exogenous_inputs_are_drift_monitored(self, freight_df, tmp_path, monkeypatch):
+        """Series beyond the base lanes (e.g. from the exogenous panel) get their own drift checks."""
+        monkeypatch.chdir(tmp_path)
+        df = freight_df.assign(pmi=np.sin(np.arange(len(freight_df)) / 10))
+        current = {'df': df}
+        monkeypatch.setattr(AtlasEngine, 'load_data', lambda self: current['df'])
+        watched = tmp_path / 'panel.json'
+        watched.write_text('v1')
+
+        scheduler = AtlasScheduler(registry_dir='registry', watch_paths=[str(watched)], quick_mode=True)
+        scheduler.tick()
+        assert {'pmi', 'uwfe_price', 'trade_imbalance_ratio'} <= set(scheduler.monitor.features)
+
+        shifted = df.iloc[-60:].copy()
+        shifted.index = shifted.index + pd.Timedelta(days=60)
+        shifted['pmi'] += 5
+        current['df'] = pd.concat([df, shifted])
+        watched.write_text('v2')
+        decision, _ = scheduler.check()
+        assert decision['action'] == 'retrain'
+        assert any('pmi' in reason for reason in decision['reasons'])
+
+
+if __name__ == "__main__":
+    pytest.main([__file__])